@@ -1,15 +1,222 @@
-from django.contrib import admin
+from functools import partial
+
+from django.contrib import admin, messages
+from django.contrib.auth import get_permission_codename
 from django.contrib.auth.admin import UserAdmin
-from .models import Shop, Category, Product, ProductInfo, Parameter, ProductParameter, Order, OrderItem, Contact, CustomUser
+from django.db import transaction
+from django.db.models import QuerySet
+from .models import Shop, Category, Product, ProductInfo, Parameter, ProductParameter, Order, OrderItem, Contact, CustomUser, \
+    ImportJob
+from .caching import bump_shop_version
+from .facets import refresh_facets
+from .importer import delete_product_infos
+from .pagination import EstimatedCountPaginator
+from .search import get_search_index
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Список для таблиц на миллионы строк: без COUNT(*) по всей таблице (ни для
+    пагинации, ни для "всего N"), без подсчёта фасетов фильтров. Наследники
+    задают list_select_related под свои list_display и raw_id_fields или
+    autocomplete_fields вместо выпадающих списков по всем связанным строкам
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    show_facets = admin.ShowFacets.NEVER
+
+
+def bump_shop_versions(shop_ids):
+    # Закешированные ответы каталога магазинов устаревают после фиксации
+    # транзакции: вызывается после записи, иначе вне транзакции версия
+    # сменилась бы до неё и читатели успели бы закешировать старые строки
+    for shop_id in set(shop_ids) - {None}:
+        transaction.on_commit(partial(bump_shop_version, shop_id))
+
+
+@admin.register(Shop)
+class ShopAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'url', 'user', 'imported_at')
+    list_select_related = ('user',)
+    search_fields = ('name',)
+    raw_id_fields = ('user',)
+
+
+@admin.register(Category)
+class CategoryAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name')
+    search_fields = ('name',)
+    autocomplete_fields = ('shops',)
+
+
+@admin.register(Parameter)
+class ParameterAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name')
+    search_fields = ('name',)
+
+
+@admin.register(Product)
+class ProductAdmin(LargeTableAdmin):
+    list_display = ('id', 'name', 'category')
+    list_select_related = ('category',)
+    list_filter = ('category',)
+    search_fields = ('=id', 'name')
+    autocomplete_fields = ('category',)
+
+
+class ProductParameterInline(admin.TabularInline):
+    model = ProductParameter
+    autocomplete_fields = ('parameter',)
+    extra = 0
+
+
+@admin.register(ProductInfo)
+class ProductInfoAdmin(LargeTableAdmin):
+    list_display = ('id', 'name', 'product', 'shop', 'price', 'price_rrc', 'quantity')
+    list_select_related = ('product', 'shop')
+    # Фильтры идут по индексам внешних ключей shop_id и product.category_id
+    list_filter = ('shop', 'product__category')
+    search_fields = ('=id', '=external_id', 'name')
+    raw_id_fields = ('product',)
+    autocomplete_fields = ('shop',)
+    inlines = [ProductParameterInline]
+    actions = ['mark_out_of_stock']
+    # Резерв ведут корзины (backend.reservations), хеш строки прайс-листа — импорт
+    readonly_fields = ('reserved', 'content_hash')
+
+    @admin.action(description='Снять с продажи (остаток 0)')
+    def mark_out_of_stock(self, request, queryset):
+        queryset = queryset.order_by()
+        with transaction.atomic():
+            # Со сброшенным хешем следующий импорт перезапишет строку, даже
+            # если в прайс-листе она не изменилась
+            updated = queryset.update(quantity=0, content_hash='')
+            bump_shop_versions(queryset.values_list('shop_id', flat=True).distinct())
+        self.message_user(request, f'Снято с продажи: {updated}', messages.SUCCESS)
+
+    def get_deleted_objects(self, objs, request):
+        # Подтверждение удаления показывает число строк, а не каждую строку с
+        # зависимыми: для выбранных "всех N" это были бы миллионы __str__
+        queryset = objs if isinstance(objs, QuerySet) else ProductInfo.objects.filter(id__in=[obj.id for obj in objs])
+        model_count = {
+            ProductInfo._meta.verbose_name_plural: queryset.count(),
+            ProductParameter._meta.verbose_name_plural:
+                ProductParameter.objects.filter(product_info__in=queryset.values('id')).count(),
+        }
+        perms_needed = {
+            model._meta.verbose_name for model in (ProductInfo, ProductParameter)
+            if not request.user.has_perm(f'{model._meta.app_label}.{get_permission_codename("delete", model._meta)}')
+        }
+        return [f'{name}: {count}' for name, count in model_count.items()], model_count, perms_needed, []
+
+    def delete_model(self, request, obj):
+        self.delete_queryset(request, ProductInfo.objects.filter(id=obj.id))
+
+    def delete_queryset(self, request, queryset):
+        """
+        Удаление выбранных предложений запросами по всему набору, как при
+        импорте: без загрузки строк и сигналов для каждой, с обновлением
+        поискового индекса, фасетов и кеша каталога
+        """
+        queryset = queryset.order_by()
+        with transaction.atomic():
+            # После удаления строк магазины и категории уже не прочитать
+            shop_ids, category_ids = set(), set()
+            for shop_id, category_id in queryset.values_list('shop_id', 'product__category_id').distinct():
+                shop_ids.add(shop_id)
+                category_ids.add(category_id)
+            delete_product_infos(ProductInfo.objects.filter(id__in=queryset.values('id')))
+            refresh_facets(category_ids)
+            bump_shop_versions(shop_ids)
+
+    def save_model(self, request, obj, form, change):
+        # Правка вручную, как и снятие с продажи, не переживает импорт прайс-листа
+        obj.content_hash = ''
+        super().save_model(request, obj, form, change)
+
+    def save_related(self, request, form, formsets, change):
+        """
+        После сохранения предложения и его параметров (форма изменения уже
+        в транзакции) обновляются поисковый документ, фасеты категорий и кеш
+        каталога — прежних магазина и товара тоже, если их сменили
+        """
+        super().save_related(request, form, formsets, change)
+        obj = form.instance
+        product_ids = {obj.product_id, form.initial.get('product')} - {None}
+        get_search_index().update([obj.id])
+        refresh_facets(Product.objects.filter(id__in=product_ids).values_list('category_id', flat=True))
+        bump_shop_versions({obj.shop_id, form.initial.get('shop')})
+
+
+@admin.register(ProductParameter)
+class ProductParameterAdmin(LargeTableAdmin):
+    list_display = ('id', 'product_info', 'parameter', 'value')
+    # ProductInfo.__str__ читает товар и магазин
+    list_select_related = ('product_info__product', 'product_info__shop', 'parameter')
+    # Индекс productparameter_value_idx начинается с parameter
+    list_filter = ('parameter',)
+    search_fields = ('=product_info__id', 'value')
+    raw_id_fields = ('product_info',)
+    autocomplete_fields = ('parameter',)
+
+
+class OrderItemInline(admin.TabularInline):
+    model = OrderItem
+    raw_id_fields = ('product',)
+    autocomplete_fields = ('shop',)
+    extra = 0
+
+
+@admin.register(Order)
+class OrderAdmin(LargeTableAdmin):
+    list_display = ('id', 'user', 'status', 'dt', 'total')
+    list_select_related = ('user',)
+    # Индекс order_status_idx
+    list_filter = ('status',)
+    search_fields = ('=id', '=user__email')
+    raw_id_fields = ('user',)
+    inlines = [OrderItemInline]
+    actions = ['mark_in_progress', 'mark_completed']
+
+    def set_status(self, request, queryset, status):
+        # Корзины (status='new') подтверждаются только через confirm_cart():
+        # там фиксируются резервы, цены и сумма
+        updated = queryset.exclude(status='new').order_by().update(status=status)
+        self.message_user(request, f'Статус изменён: {updated}', messages.SUCCESS)
+
+    @admin.action(description='Перевести в статус "В процессе"')
+    def mark_in_progress(self, request, queryset):
+        self.set_status(request, queryset, 'in_progress')
+
+    @admin.action(description='Перевести в статус "Завершён"')
+    def mark_completed(self, request, queryset):
+        self.set_status(request, queryset, 'completed')
+
+
+@admin.register(OrderItem)
+class OrderItemAdmin(LargeTableAdmin):
+    list_display = ('id', 'order', 'product', 'shop', 'quantity', 'price')
+    list_select_related = ('order', 'product', 'shop')
+    list_filter = ('shop', 'order__status')
+    search_fields = ('=order__id',)
+    raw_id_fields = ('order', 'product')
+    autocomplete_fields = ('shop',)
+
+
+@admin.register(Contact)
+class ContactAdmin(LargeTableAdmin):
+    list_display = ('id', 'user', 'type', 'value')
+    list_select_related = ('user',)
+    search_fields = ('value', '=user__email')
+    raw_id_fields = ('user',)
+
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'shop', 'status', 'rows_processed', 'created_at', 'finished_at')
+    list_select_related = ('user', 'shop')
+    list_filter = ('status',)
+    raw_id_fields = ('user', 'shop')
+
 
-# Регистрируем все созданные модели
 admin.site.register(CustomUser, UserAdmin)
-admin.site.register(Shop)
-admin.site.register(Category)
-admin.site.register(Product)
-admin.site.register(ProductInfo)
-admin.site.register(Parameter)
-admin.site.register(ProductParameter)
-admin.site.register(Order)
-admin.site.register(OrderItem)
-admin.site.register(Contact)
@@ -0,0 +1,149 @@
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.http import HttpResponse
+from django.utils.functional import classproperty
+from rest_framework import exceptions
+from rest_framework.response import Response
+
+from .caching import acatalog_cache_key, catalog_cache
+from .facets import alive_facet_counts, astored_facet_counts
+from .models import Order, ProductInfo
+from .profiling import serialization_timer
+from .serializers import FastProductCatalogSerializer, FastOrderItemSerializer
+from .views import ProductListAPIView, CartAPIView, OrderHistoryAPIView
+
+
+class AsyncAPIViewMixin:
+    """
+    Асинхронный dispatch для APIView под ASGI: запрос обрабатывается в цикле
+    событий без перехода в поток на весь запрос.
+
+    Аутентификаторы с aauthenticate() вызываются напрямую, остальные — через
+    sync_to_async. Обработчики-корутины ожидаются, синхронные (например, POST
+    корзины с транзакциями и select_for_update) выполняются в потоке.
+    JSON-ответ отрисовывается здесь же: отложенный render() Django вызвал бы
+    через sync_to_async
+    """
+
+    @classproperty
+    def view_is_async(cls):
+        return True
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await self.aperform_authentication(request)
+            self.initial(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            if not iscoroutinefunction(handler):
+                handler = sync_to_async(handler)
+            response = await handler(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.render_response(self.response)
+
+    async def aperform_authentication(self, request):
+        # То же, что Request._authenticate(); после него request.user уже
+        # известен и perform_authentication() в initial() базу не читает
+        for authenticator in request.authenticators:
+            aauthenticate = getattr(authenticator, 'aauthenticate', None) \
+                or sync_to_async(authenticator.authenticate)
+            try:
+                user_auth_tuple = await aauthenticate(request)
+            except exceptions.APIException:
+                request._not_authenticated()
+                raise
+            if user_auth_tuple is not None:
+                request._authenticator = authenticator
+                request.user, request.auth = user_auth_tuple
+                return
+        request._not_authenticated()
+
+    async def afilter_queryset(self, queryset):
+        # Фильтры без afilter_queryset() только строят запрос и базу не читают
+        for backend in self.filter_backends:
+            backend = backend()
+            afilter = getattr(backend, 'afilter_queryset', None)
+            if afilter:
+                queryset = await afilter(self.request, queryset, self)
+            else:
+                queryset = backend.filter_queryset(self.request, queryset, self)
+        return queryset
+
+    @staticmethod
+    def render_response(response):
+        # Browsable API при отрисовке может читать базу, он остаётся отложенным
+        if not isinstance(response, Response) or response.accepted_renderer.format == 'api':
+            return response
+        with serialization_timer():
+            response.render()
+        return HttpResponse(response.content, status=response.status_code, headers=response.headers)
+
+
+class AsyncProductListAPIView(AsyncAPIViewMixin, ProductListAPIView):
+    """
+    Асинхронный вариант ProductListAPIView с общим с ним кешем ответов
+    """
+
+    def get_cache_prefix(self):
+        return ProductListAPIView.__name__
+
+    async def get(self, request, *args, **kwargs):
+        cache = catalog_cache()
+        key = await acatalog_cache_key(request, self.get_cache_prefix())
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+
+        response = await self.alist(request)
+        if response.status_code == 200:
+            cache.set(key, response.data, self.cache_timeout)
+        return response
+
+    async def alist(self, request):
+        serializer = FastProductCatalogSerializer(self.get_requested_fields())
+        queryset = await self.afilter_queryset(self.get_queryset())
+        page = await self.paginator.apaginate_queryset(serializer.rows(queryset), request, view=self)
+        response = self.get_paginated_response(await serializer.ato_representation(page))
+        if request.query_params.get('facets') in ('1', 'true'):
+            response.data['facets'] = await self.aget_facets()
+        return response
+
+    async def aget_facets(self):
+        if self.use_live_facets():
+            return await alive_facet_counts(await self.afilter_queryset(ProductInfo.objects.all()))
+        return await astored_facet_counts(self.get_facet_category())
+
+
+class AsyncCartAPIView(AsyncAPIViewMixin, CartAPIView):
+    """
+    CartAPIView с асинхронным GET; изменения корзины идут через синхронные обработчики
+    """
+
+    async def get(self, request):
+        cart = await Order.objects.filter(user=request.user, status='new').afirst()
+        if not cart:
+            return Response({'message': 'Корзина пуста'}, status=200)
+
+        return Response(await FastOrderItemSerializer().aserialize(cart.items.all()), status=200)
+
+
+class AsyncOrderHistoryAPIView(AsyncAPIViewMixin, OrderHistoryAPIView):
+    """
+    Асинхронный вариант OrderHistoryAPIView
+    """
+
+    async def get(self, request, *args, **kwargs):
+        queryset = await self.afilter_queryset(self.get_queryset())
+        page = await self.paginator.apaginate_queryset(queryset, request, view=self)
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
@@ -0,0 +1,168 @@
+import atexit
+import hashlib
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import connections
+from django.utils import timezone
+from rest_framework import authentication, exceptions
+from rest_framework.authentication import TokenAuthentication, get_authorization_header
+from rest_framework.authtoken.models import Token
+
+
+def token_cache():
+    return caches[settings.AUTH_TOKEN_CACHE_ALIAS]
+
+
+def token_cache_key(key):
+    # Сам токен в ключ не попадает: файловый бэкенд может быть общим
+    return f'auth:token:{hashlib.blake2b(key.encode(), digest_size=16).hexdigest()}'
+
+
+def invalidate_tokens(keys):
+    token_cache().delete_many([token_cache_key(key) for key in keys])
+
+
+class LastSeenBuffer:
+    """
+    Копит отметки "последний визит" пользователей в памяти процесса и пишет
+    их одним bulk_update из фонового потока не чаще раза в
+    LAST_SEEN_FLUSH_INTERVAL секунд, вместо UPDATE на каждый запрос
+    """
+
+    def __init__(self):
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.last_flush = time.monotonic()
+        self.flushing = False
+
+    def touch(self, user_id):
+        with self.lock:
+            self.pending[user_id] = timezone.now()
+            due = time.monotonic() - self.last_flush >= settings.LAST_SEEN_FLUSH_INTERVAL
+            if not due or self.flushing:
+                return
+            self.flushing = True
+            self.last_flush = time.monotonic()
+        threading.Thread(target=self._flush_in_background, daemon=True).start()
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        if not pending:
+            return 0
+        User = get_user_model()
+        User.objects.bulk_update([User(pk=user_id, last_seen=seen) for user_id, seen in pending.items()],
+                                 ['last_seen'], batch_size=500)
+        return len(pending)
+
+    def _flush_in_background(self):
+        try:
+            self.flush()
+        finally:
+            # У потока своё соединение с базой, его нужно закрыть
+            connections.close_all()
+            with self.lock:
+                self.flushing = False
+
+
+last_seen = LastSeenBuffer()
+atexit.register(last_seen.flush)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication с кешем token -> пользователь: на повторных запросах
+    база не читается. Записи удаляются сигналами при удалении токена (logout),
+    смене пароля и изменении пользователя.
+
+    aauthenticate() — то же для асинхронных представлений, промах кеша
+    читается через aget()
+    """
+
+    def get_key(self, request):
+        """
+        Ключ из заголовка Authorization с проверками TokenAuthentication.authenticate
+        """
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) == 1:
+            raise exceptions.AuthenticationFailed('Invalid token header. No credentials provided.')
+        if len(auth) > 2:
+            raise exceptions.AuthenticationFailed('Invalid token header. Token string should not contain spaces.')
+        try:
+            return auth[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed(
+                'Invalid token header. Token string should not contain invalid characters.'
+            )
+
+    def authenticate(self, request):
+        key = self.get_key(request)
+        return None if key is None else self.authenticate_credentials(key)
+
+    async def aauthenticate(self, request):
+        key = self.get_key(request)
+        return None if key is None else await self.aauthenticate_credentials(key)
+
+    def authenticate_credentials(self, key):
+        token = token_cache().get(token_cache_key(key))
+        if token is None:
+            try:
+                token = Token.objects.select_related('user').get(key=key)
+            except Token.DoesNotExist:
+                raise exceptions.AuthenticationFailed('Invalid token.')
+            token_cache().set(token_cache_key(key), token)
+        return self.check_token(token)
+
+    async def aauthenticate_credentials(self, key):
+        # Кеш токенов в памяти процесса или в файлах, в базу он не ходит
+        token = token_cache().get(token_cache_key(key))
+        if token is None:
+            try:
+                token = await Token.objects.select_related('user').aget(key=key)
+            except Token.DoesNotExist:
+                raise exceptions.AuthenticationFailed('Invalid token.')
+            token_cache().set(token_cache_key(key), token)
+        return self.check_token(token)
+
+    @staticmethod
+    def check_token(token):
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+
+        last_seen.touch(token.user_id)
+        return token.user, token
+
+
+class SessionAuthentication(authentication.SessionAuthentication):
+    """
+    SessionAuthentication с aauthenticate(): пользователь сессии читается
+    через request.auser() без перехода в поток
+    """
+
+    async def aauthenticate(self, request):
+        auser = getattr(request._request, 'auser', None)
+        user = await auser() if auser else None
+        if not user or not user.is_active:
+            return None
+        self.enforce_csrf(request)
+        return user, None
+
+
+class BasicAuthentication(authentication.BasicAuthentication):
+    """
+    BasicAuthentication с aauthenticate() для асинхронных представлений
+    """
+
+    async def aauthenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != b'basic':
+            return None
+        # Проверка пароля занимает CPU и читает базу, поэтому выполняется в потоке
+        return await sync_to_async(self.authenticate)(request)
@@ -0,0 +1,235 @@
+import hashlib
+import os
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils import timezone
+from rest_framework.response import Response
+
+from .models import Shop
+from .search import tokenize
+
+_MISSING = object()
+
+# Счётчики попаданий общие для всех экземпляров бэкенда с одним LOCATION:
+# Django создаёт отдельный экземпляр кеша на каждый поток
+_stats = defaultdict(Counter)
+_stats_lock = threading.Lock()
+
+
+class CacheStatsMixin:
+    """
+    Считает попадания и промахи get() для бэкенда кеша
+    """
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version)
+        with _stats_lock:
+            _stats[self.stats_key]['misses' if value is _MISSING else 'hits'] += 1
+        return default if value is _MISSING else value
+
+    @property
+    def stats_key(self):
+        return f'{type(self).__name__}:{self._stats_location}'
+
+    def stats(self):
+        with _stats_lock:
+            counter = _stats[self.stats_key]
+            hits, misses = counter['hits'], counter['misses']
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / (hits + misses), 3) if hits + misses else 0.0,
+        }
+
+    def reset_stats(self):
+        with _stats_lock:
+            _stats.pop(self.stats_key, None)
+
+
+class LRULocMemCache(CacheStatsMixin, LocMemCache):
+    """
+    Кеш в памяти процесса: не больше MAX_ENTRIES записей, при переполнении
+    вытесняются давно не читавшиеся (LocMemCache уже хранит записи в порядке LRU)
+    """
+
+    def __init__(self, name, params):
+        super().__init__(name, params)
+        self._stats_location = name
+
+
+class LRUFileBasedCache(CacheStatsMixin, FileBasedCache):
+    """
+    Файловый кеш с вытеснением по давности чтения: чтение обновляет mtime
+    файла, а при переполнении удаляются файлы с самым старым mtime
+    (стандартный FileBasedCache удаляет случайные записи)
+    """
+
+    def __init__(self, dir, params):
+        super().__init__(dir, params)
+        self._stats_location = self._dir
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version)
+        if value is not _MISSING:
+            try:
+                os.utime(self._key_to_file(key, version))
+            except FileNotFoundError:
+                pass
+            return value
+        return default
+
+    def _cull(self):
+        filelist = self._list_cache_files()
+        num_entries = len(filelist)
+        if num_entries < self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            return self.clear()
+
+        def mtime(fname):
+            try:
+                return os.path.getmtime(fname)
+            except FileNotFoundError:
+                return 0
+
+        for fname in sorted(filelist, key=mtime)[:max(num_entries // self._cull_frequency, 1)]:
+            self._delete(fname)
+
+
+def catalog_cache():
+    return caches[settings.CATALOG_CACHE_ALIAS]
+
+
+def _shop_version_key(shop_id):
+    return f'catalog:shop:{shop_id}:version'
+
+
+SHOP_IDS_KEY = 'catalog:shops'
+
+
+def get_shop_ids():
+    cache = catalog_cache()
+    shop_ids = cache.get(SHOP_IDS_KEY)
+    if shop_ids is None:
+        shop_ids = sorted(Shop.objects.values_list('id', flat=True))
+        cache.set(SHOP_IDS_KEY, shop_ids, None)
+    return shop_ids
+
+
+async def aget_shop_ids():
+    cache = catalog_cache()
+    shop_ids = cache.get(SHOP_IDS_KEY)
+    if shop_ids is None:
+        shop_ids = sorted([shop_id async for shop_id in Shop.objects.values_list('id', flat=True)])
+        cache.set(SHOP_IDS_KEY, shop_ids, None)
+    return shop_ids
+
+
+def get_shop_versions(shop_ids):
+    cache = catalog_cache()
+    versions = cache.get_many([_shop_version_key(shop_id) for shop_id in shop_ids])
+    return [versions.get(_shop_version_key(shop_id), 0) for shop_id in shop_ids]
+
+
+def _shop_stock_key(shop_id):
+    return f'catalog:shop:{shop_id}:stock'
+
+
+def touch_shop_stock(shop_id):
+    """
+    Запоминает время изменения товаров и остатков магазина, в том числе
+    резервами корзин: от него считаются ETag и Last-Modified выгрузки каталога
+    """
+    catalog_cache().set(_shop_stock_key(shop_id), timezone.now(), None)
+
+
+def get_shop_stock_times(shop_ids):
+    cache = catalog_cache()
+    keys = [_shop_stock_key(shop_id) for shop_id in shop_ids]
+    times = cache.get_many(keys)
+    now = timezone.now()
+    for key in keys:
+        if key not in times:
+            # Запись вытеснена или кеш процесса ещё пуст: когда менялись
+            # остатки, неизвестно, считается, что сейчас
+            cache.add(key, now, None)
+            times[key] = cache.get(key, now)
+    return [times[key] for key in keys]
+
+
+def bump_shop_version(shop_id):
+    """
+    Делает недействительными закешированные ответы каталога, в которых есть
+    товары магазина: меняется часть ключа, старые записи вытесняются по LRU.
+    Заодно отмечает изменение остатков магазина (touch_shop_stock)
+    """
+    cache = catalog_cache()
+    key = _shop_version_key(shop_id)
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Запись успели вытеснить между add и incr
+        cache.set(key, 1, None)
+    if shop_id not in (cache.get(SHOP_IDS_KEY) or []):
+        cache.delete(SHOP_IDS_KEY)
+    touch_shop_stock(shop_id)
+
+
+def normalize_query(query_params):
+    items = []
+    for key in sorted(query_params):
+        values = query_params.getlist(key)
+        if key in ('search', 'q'):
+            values = [' '.join(tokenize(value)) for value in values]
+        items.append((key, sorted(values)))
+    return items
+
+
+def catalog_cache_key(request, prefix, shop_ids=None):
+    shop = request.query_params.get('shop', '')
+    if shop.isdigit():
+        shop_ids = [int(shop)]
+    elif shop_ids is None:
+        shop_ids = get_shop_ids()
+    payload = repr((
+        request.get_host(),
+        request.path,
+        normalize_query(request.query_params),
+        list(zip(shop_ids, get_shop_versions(shop_ids))),
+    ))
+    return f'catalog:{prefix}:{hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()}'
+
+
+async def acatalog_cache_key(request, prefix):
+    shop = request.query_params.get('shop', '')
+    return catalog_cache_key(request, prefix, None if shop.isdigit() else await aget_shop_ids())
+
+
+class CatalogCacheMixin:
+    """
+    Кеширует ответы GET представлений каталога. Ключ строится по
+    нормализованному запросу и версиям магазинов, которые увеличиваются
+    после каждого импорта
+    """
+    cache_timeout = 600
+
+    def get_cache_prefix(self):
+        return type(self).__name__
+
+    def get(self, request, *args, **kwargs):
+        cache = catalog_cache()
+        key = catalog_cache_key(request, self.get_cache_prefix())
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+
+        response = super().get(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, self.cache_timeout)
+        return response
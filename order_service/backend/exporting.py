@@ -0,0 +1,135 @@
+import csv
+import hashlib
+import io
+import json
+from collections import defaultdict
+
+import yaml
+
+from .caching import get_shop_stock_times
+from .models import Category, ProductInfo, ProductParameter
+from .renderers import DefaultJSONRenderer
+from .serializers import FastProductCatalogSerializer
+from .utils import chunked
+
+try:
+    from yaml import CSafeDumper as SafeDumper
+except ImportError:  # PyYAML собран без libyaml
+    from yaml import SafeDumper
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+def _catalog_chunks(queryset, chunk_size):
+    """
+    Строки каталога в виде ответа /api/products/, пачками по chunk_size.
+    Выборка читается курсором через iterator(), параметры запрашиваются
+    отдельно для каждой пачки, так что в памяти не больше одной пачки
+    """
+    serializer = FastProductCatalogSerializer()
+    rows = serializer.rows(queryset.order_by('id')).iterator(chunk_size=chunk_size)
+    for chunk in chunked(rows, chunk_size):
+        yield serializer.to_representation(chunk)
+
+
+def export_csv(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    CSV со столбцами ProductCatalogSerializer, parameters — JSON-объект в одной ячейке
+    """
+    fields = FastProductCatalogSerializer().fields
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for data in _catalog_chunks(queryset, chunk_size):
+        for item in data:
+            writer.writerow([
+                json.dumps(item[name], ensure_ascii=False) if name == 'parameters' else item[name]
+                for name in fields
+            ])
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def export_jsonl(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    JSON Lines: по объекту /api/products/ на строку
+    """
+    renderer = DefaultJSONRenderer()
+    for data in _catalog_chunks(queryset, chunk_size):
+        yield b''.join(renderer.render(item) + b'\n' for item in data)
+
+
+def _number(value):
+    # Цены в прайс-листе записаны числами, целые — без дробной части
+    return int(value) if value == value.to_integral_value() else float(value)
+
+
+def _dump_yaml(data):
+    return yaml.dump(data, Dumper=SafeDumper, allow_unicode=True, sort_keys=False,
+                     default_flow_style=False).encode()
+
+
+def export_yaml(shops, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Прайс-листы в формате data/shop1.yaml, по документу на магазин.
+    Товары пишутся пачками, поэтому документ не собирается в памяти целиком
+    и может быть загружен обратно через import_pricelists
+    """
+    for shop in shops:
+        categories = Category.objects.filter(shops=shop).order_by('id').values('id', 'name')
+        yield b'---\n' + _dump_yaml({'shop': shop.name, 'categories': list(categories)})
+
+        rows = ProductInfo.objects.filter(shop=shop).order_by('id').values_list(
+            'id', 'external_id', 'product__category_id', 'model', 'name', 'price', 'price_rrc', 'quantity',
+        ).iterator(chunk_size=chunk_size)
+        empty = True
+        for chunk in chunked(rows, chunk_size):
+            parameters = defaultdict(dict)
+            for product_info_id, name, value in ProductParameter.objects.filter(
+                    product_info_id__in=[row[0] for row in chunk]
+            ).order_by('id').values_list('product_info_id', 'parameter__name', 'value'):
+                parameters[product_info_id][name] = value
+
+            goods = [
+                {
+                    'id': external_id,
+                    'category': category_id,
+                    'model': model,
+                    'name': name,
+                    'price': _number(price),
+                    'price_rrc': _number(price_rrc),
+                    'quantity': quantity,
+                    'parameters': parameters[product_info_id],
+                }
+                for product_info_id, external_id, category_id, model, name, price, price_rrc, quantity in chunk
+            ]
+            yield (b'goods:\n' if empty else b'') + _dump_yaml(goods)
+            empty = False
+        if empty:
+            yield b'goods: []\n'
+
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv; charset=utf-8', export_csv),
+    'jsonl': ('application/x-ndjson', export_jsonl),
+    'yaml': ('application/yaml; charset=utf-8', export_yaml),
+}
+
+
+def export_validators(shops, export_format, gzip):
+    """
+    (ETag, Last-Modified) выгрузки выбранных магазинов. Оба меняются после
+    импорта, изменившего товары, и после изменения остатков резервами, продажей
+    или правкой в админке (отметка touch_shop_stock в кеше каталога)
+    """
+    stock_times = get_shop_stock_times([shop.id for shop in shops])
+    times = stock_times + [shop.imported_at for shop in shops if shop.imported_at is not None]
+    payload = repr((export_format, gzip, [
+        (shop.id, shop.imported_at and shop.imported_at.isoformat(), stock_time.isoformat())
+        for shop, stock_time in zip(shops, stock_times)
+    ]))
+    etag = f'W/"{hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()}"'
+    return etag, max(times) if times else None
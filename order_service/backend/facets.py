@@ -0,0 +1,76 @@
+from collections import defaultdict
+
+from django.db.models import Count, Sum
+
+from .models import ParameterFacet, ProductParameter
+
+
+def refresh_facets(category_ids):
+    """
+    Пересчитывает счётчики фасетов для указанных категорий одним агрегирующим
+    запросом; остальные категории не трогаются
+    """
+    category_ids = set(category_ids)
+    if not category_ids:
+        return
+
+    ParameterFacet.objects.filter(category_id__in=category_ids).delete()
+    rows = ProductParameter.objects.filter(product_info__product__category_id__in=category_ids) \
+        .values_list('product_info__product__category_id', 'parameter_id', 'value') \
+        .annotate(count=Count('id')) \
+        .order_by()
+    ParameterFacet.objects.bulk_create(
+        [ParameterFacet(category_id=category_id, parameter_id=parameter_id, value=value, count=count)
+         for category_id, parameter_id, value, count in rows],
+        batch_size=500,
+    )
+
+
+def rebuild_facets():
+    ParameterFacet.objects.all().delete()
+    rows = ProductParameter.objects.values_list('product_info__product__category_id', flat=True).distinct().order_by()
+    refresh_facets(list(rows))
+
+
+def _group(rows):
+    facets = defaultdict(dict)
+    for name, value, count in rows:
+        facets[name][value] = count
+    return dict(facets)
+
+
+def _stored_rows(category_id):
+    queryset = ParameterFacet.objects.all()
+    if category_id is not None:
+        queryset = queryset.filter(category_id=category_id)
+    return queryset.values_list('parameter__name', 'value').annotate(total=Sum('count')) \
+        .order_by('parameter__name', 'value')
+
+
+def _live_rows(queryset):
+    return ProductParameter.objects.filter(product_info__in=queryset.order_by().values('id')) \
+        .values_list('parameter__name', 'value').annotate(total=Count('id')) \
+        .order_by('parameter__name', 'value')
+
+
+def stored_facet_counts(category_id=None):
+    """
+    Счётчики из материализованной таблицы: весь каталог или одна категория
+    """
+    return _group(_stored_rows(category_id))
+
+
+def live_facet_counts(queryset):
+    """
+    Счётчики для произвольной выборки товаров, одним запросом по индексу
+    ProductParameter(product_info)
+    """
+    return _group(_live_rows(queryset))
+
+
+async def astored_facet_counts(category_id=None):
+    return _group([row async for row in _stored_rows(category_id)])
+
+
+async def alive_facet_counts(queryset):
+    return _group([row async for row in _live_rows(queryset)])
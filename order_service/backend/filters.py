@@ -0,0 +1,93 @@
+from collections import defaultdict
+
+from django import forms
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend, SearchFilter
+
+from .models import ProductParameter, Order
+from .search import aget_search_index, get_search_index
+
+
+class ProductSearchFilter(SearchFilter):
+    """
+    Фильтр ?search= по поисковому индексу товаров вместо icontains по таблице
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '')
+        if not query.strip():
+            return queryset
+        return get_search_index().filter(queryset, query)
+
+    async def afilter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '')
+        if not query.strip():
+            return queryset
+        return await (await aget_search_index()).afilter(queryset, query)
+
+
+class ProductFacetFilter(BaseFilterBackend):
+    """
+    Фильтры каталога: ?category=, ?shop=, диапазоны ?price_min/price_max/quantity_min/quantity_max
+    и значения параметров ?parameter=Цвет:черный (значения одного параметра
+    объединяются через OR, разные параметры — через AND)
+    """
+    range_params = {
+        'price_min': ('price__gte', forms.DecimalField()),
+        'price_max': ('price__lte', forms.DecimalField()),
+        'quantity_min': ('available__gte', forms.IntegerField(min_value=0)),
+        'quantity_max': ('available__lte', forms.IntegerField(min_value=0)),
+        'category': ('product__category_id', forms.IntegerField()),
+        'shop': ('shop_id', forms.IntegerField()),
+    }
+    facet_params = ['parameter', *range_params]
+
+    def filter_queryset(self, request, queryset, view):
+        for param, (lookup, field) in self.range_params.items():
+            value = request.query_params.get(param)
+            if value in (None, ''):
+                continue
+            try:
+                queryset = queryset.filter(**{lookup: field.clean(value)})
+            except forms.ValidationError as e:
+                raise ValidationError({param: e.messages})
+
+        for name, values in self.get_parameter_filters(request).items():
+            queryset = queryset.filter(id__in=ProductParameter.objects.filter(
+                parameter__name=name, value__in=values
+            ).values('product_info_id'))
+        return queryset
+
+    @staticmethod
+    def get_parameter_filters(request):
+        filters = defaultdict(list)
+        for item in request.query_params.getlist('parameter'):
+            name, separator, value = item.partition(':')
+            if not separator or not name:
+                raise ValidationError({'parameter': 'Ожидается формат <параметр>:<значение>'})
+            filters[name].append(value)
+        return filters
+
+
+class OrderHistoryFilter(BaseFilterBackend):
+    """
+    Фильтры истории заказов: ?status=, ?date_from=, ?date_to= (даты включительно)
+    """
+    params = {
+        'status': ('status', forms.ChoiceField(choices=[
+            choice for choice in Order.STATUS_CHOICES if choice[0] != 'new'
+        ])),
+        'date_from': ('dt__date__gte', forms.DateField()),
+        'date_to': ('dt__date__lte', forms.DateField()),
+    }
+
+    def filter_queryset(self, request, queryset, view):
+        for param, (lookup, field) in self.params.items():
+            value = request.query_params.get(param)
+            if value in (None, ''):
+                continue
+            try:
+                queryset = queryset.filter(**{lookup: field.clean(value)})
+            except forms.ValidationError as e:
+                raise ValidationError({param: e.messages})
+        return queryset
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    """
+    PBKDF2 с числом итераций из PASSWORD_HASH_WORK_FACTOR. При входе хеш с
+    другим числом итераций пересчитывается (must_update)
+    """
+
+    @property
+    def iterations(self):
+        return settings.PASSWORD_HASH_WORK_FACTOR or super().iterations
+
+
+class ScryptPasswordHasher(hashers.ScryptPasswordHasher):
+    """
+    scrypt с параметром N из PASSWORD_HASH_WORK_FACTOR
+    """
+
+    @property
+    def work_factor(self):
+        return settings.PASSWORD_HASH_WORK_FACTOR or super().work_factor
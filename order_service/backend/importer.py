@@ -0,0 +1,331 @@
+import hashlib
+import json
+from dataclasses import dataclass
+from functools import partial
+from time import perf_counter
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Shop, Category, Product, ProductInfo, Parameter, ProductParameter
+from .caching import bump_shop_version
+from .facets import refresh_facets
+from .search import get_search_index
+from .streaming import PriceListStream
+from .utils import chunked
+
+
+def delete_product_infos(queryset, search_index=None):
+    """
+    Удаляет предложения queryset вместе с параметрами и поисковыми документами
+    """
+    # Параметры и поисковые документы удаляются запросами без выборки в память,
+    # после чего у товаров не остаётся зависимых строк и их можно удалить напрямую
+    (search_index or get_search_index()).remove(queryset)
+    ProductParameter.objects.filter(product_info__in=queryset).delete()
+    queryset._raw_delete(queryset.db)
+
+
+@dataclass
+class ImportResult:
+    """
+    Итоги импорта прайс-листа
+    """
+    shop_id: int = None
+    categories: int = 0
+    products_created: int = 0
+    rows: int = 0
+    parameters: int = 0
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    removed: int = 0
+    duration: float = 0.0
+
+    @property
+    def rows_per_second(self):
+        if not self.duration:
+            return float(self.rows)
+        return self.rows / self.duration
+
+    def as_dict(self):
+        return {
+            'shop_id': self.shop_id,
+            'categories': self.categories,
+            'products_created': self.products_created,
+            'rows': self.rows,
+            'parameters': self.parameters,
+            'inserted': self.inserted,
+            'updated': self.updated,
+            'unchanged': self.unchanged,
+            'removed': self.removed,
+            'duration': round(self.duration, 3),
+            'rows_per_second': round(self.rows_per_second, 1),
+        }
+
+
+class PriceListImporter:
+    """
+    Пакетный импорт прайс-листа магазина в формате data/shop1.yaml.
+
+    Категории, товары и параметры разрешаются несколькими запросами на
+    пачку товаров, строки пишутся через bulk_create в одной транзакции.
+
+    В режиме upsert (по умолчанию) строки сопоставляются с уже загруженными
+    по (shop, external_id) и хешу содержимого: запись идёт только для новых,
+    изменённых и исчезнувших из прайс-листа товаров. Режим replace удаляет
+    все товары магазина и загружает их заново. Товары с резервом в корзинах
+    не удаляются ни в каком режиме: исчезнувшие из прайс-листа остаются с
+    нулевым остатком.
+
+    Справочники категорий, товаров и параметров кешируются в экземпляре,
+    поэтому при импорте нескольких файлов одним импортёром они разрешаются
+    один раз на весь набор файлов. Поисковый индекс и счётчики фасетов
+    обновляются только для записанных и удалённых строк.
+    """
+    UPSERT = 'upsert'
+    REPLACE = 'replace'
+
+    batch_size = 500
+
+    def __init__(self, batch_size=None, progress=None, mode=UPSERT, search_index=None):
+        if batch_size:
+            self.batch_size = batch_size
+        self.mode = mode
+        self.search_index = search_index or get_search_index()
+        # Вызывается с текущим ImportResult после записи каждой пачки
+        self.progress = progress
+        self._reset_lookups()
+        # external_id -> (product_info_id, content_hash, category_id) для товаров магазина до импорта
+        self._existing = {}
+        self._seen = set()
+        # Категории, в которых изменился состав товаров: для них пересчитываются фасеты
+        self._touched_categories = set()
+
+    def _reset_lookups(self):
+        # id категорий, которые уже есть в базе
+        self._categories = set()
+        # (category_id, name) -> product_id
+        self._products = {}
+        self._loaded_categories = set()
+        # name -> parameter_id
+        self._parameters = None
+
+    def import_data(self, data):
+        return self.run(data['shop'], data.get('categories') or [], data.get('goods') or [])
+
+    def import_stream(self, stream):
+        """
+        Импорт из файла без загрузки документа целиком: товары читаются
+        потоково и пишутся пачками по batch_size
+        """
+        price_list = PriceListStream(stream)
+        if 'shop' not in price_list.header:
+            raise ValueError("Key 'shop' must precede 'goods' in the price list")
+        with transaction.atomic():
+            result = self.run(price_list.header['shop'], price_list.header.get('categories') or [],
+                              price_list.goods())
+            # Загрузка — прайс-лист одного магазина; экспорт каталога из
+            # нескольких документов импортирует команда import_pricelists
+            if price_list.next_document():
+                self._reset_lookups()
+                raise ValueError('The price list contains several shops, import it with import_pricelists')
+        return result
+
+    def run(self, shop_name, categories, goods):
+        result = ImportResult()
+        started = perf_counter()
+        self._existing = {}
+        self._seen = set()
+        self._touched_categories = set()
+
+        try:
+            self._run(shop_name, categories, goods, result, started)
+        except Exception:
+            # После отката транзакции закешированные id новых строк недействительны
+            self._reset_lookups()
+            raise
+
+        result.duration = perf_counter() - started
+        return result
+
+    def _run(self, shop_name, categories, goods, result, started):
+        with transaction.atomic():
+            shop, _ = Shop.objects.get_or_create(name=shop_name)
+            result.shop_id = shop.id
+            result.categories = self._import_categories(shop, categories)
+            if self._parameters is None:
+                self._parameters = dict(Parameter.objects.values_list('name', 'id'))
+
+            queryset = ProductInfo.objects.filter(shop=shop)
+            if self.mode == self.REPLACE:
+                self._touched_categories.update(
+                    queryset.values_list('product__category_id', flat=True).distinct().order_by()
+                )
+                # Строки с резервом корзин не пересоздаются, а обновляются или
+                # снимаются с продажи, как при upsert: резерв хранится в строке
+                self._delete_product_infos(queryset.filter(reserved=0))
+            self._existing = {
+                external_id: (product_info_id, content_hash if self.mode == self.UPSERT else '', category_id)
+                for product_info_id, external_id, content_hash, category_id
+                in queryset.values_list('id', 'external_id', 'content_hash', 'product__category_id')
+            }
+
+            for chunk in chunked(goods, self.batch_size):
+                self._write_goods(shop, chunk, result)
+                if self.progress:
+                    result.duration = perf_counter() - started
+                    self.progress(result)
+
+            self._remove_missing(result)
+            refresh_facets(self._touched_categories)
+
+            if result.inserted or result.updated or result.removed:
+                # От времени импорта считаются ETag и Last-Modified экспорта каталога
+                Shop.objects.filter(id=shop.id).update(imported_at=timezone.now())
+                # Закешированные ответы каталога с товарами магазина устаревают
+                # только после фиксации транзакции
+                transaction.on_commit(partial(bump_shop_version, shop.id))
+
+    def _import_categories(self, shop, categories):
+        names = {int(category['id']): category['name'] for category in categories}
+        if not names:
+            return 0
+
+        unknown = names.keys() - self._categories
+        if unknown:
+            existing = set(Category.objects.filter(id__in=unknown).values_list('id', flat=True))
+            Category.objects.bulk_create(
+                [Category(id=category_id, name=names[category_id]) for category_id in unknown
+                 if category_id not in existing]
+            )
+            self._categories |= unknown
+
+        # Привязываем категории к магазину, уже существующие связи пропускаются
+        Through = Category.shops.through
+        Through.objects.bulk_create(
+            [Through(category_id=category_id, shop_id=shop.id) for category_id in names],
+            ignore_conflicts=True,
+        )
+        return len(names)
+
+    def _delete_product_infos(self, queryset):
+        delete_product_infos(queryset, self.search_index)
+
+    def _remove_missing(self, result):
+        missing = []
+        for external_id, (product_info_id, _, category_id) in self._existing.items():
+            if external_id not in self._seen:
+                missing.append(product_info_id)
+                self._touched_categories.add(category_id)
+        for ids in chunked(missing, self.batch_size):
+            queryset = ProductInfo.objects.filter(id__in=ids)
+            # Зарезервированное в корзинах остаётся без остатка: резерв снимет
+            # release(), а подтверждение такой корзины получит OutOfStock
+            queryset.filter(reserved__gt=0).update(quantity=0, content_hash='')
+            self._delete_product_infos(queryset.filter(reserved=0))
+        result.removed = len(missing)
+
+    @staticmethod
+    def content_hash(item):
+        payload = json.dumps(item, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+    def _load_products(self, category_ids):
+        missing = set(category_ids) - self._loaded_categories
+        if not missing:
+            return
+        rows = Product.objects.filter(category_id__in=missing).values_list('category_id', 'name', 'id')
+        for category_id, name, product_id in rows:
+            self._products.setdefault((category_id, name), product_id)
+        self._loaded_categories |= missing
+
+    def _resolve_products(self, goods, result):
+        self._load_products({int(item['category']) for item in goods})
+
+        new_products = {}
+        for item in goods:
+            key = (int(item['category']), item['name'])
+            if key not in self._products and key not in new_products:
+                new_products[key] = Product(category_id=key[0], name=key[1])
+
+        if new_products:
+            Product.objects.bulk_create(new_products.values(), batch_size=self.batch_size)
+            for key, product in new_products.items():
+                self._products[key] = product.id
+            result.products_created += len(new_products)
+
+    def _resolve_parameters(self, goods):
+        names = {name for item in goods for name in (item.get('parameters') or {})}
+        new_parameters = [Parameter(name=name) for name in names if name not in self._parameters]
+        if new_parameters:
+            Parameter.objects.bulk_create(new_parameters, batch_size=self.batch_size)
+            for parameter in new_parameters:
+                self._parameters[parameter.name] = parameter.id
+
+    def _write_goods(self, shop, goods, result):
+        self._resolve_products(goods, result)
+        self._resolve_parameters(goods)
+
+        to_create, to_update = [], []
+        for item in goods:
+            # Повторы external_id внутри прайс-листа пропускаются
+            if item['id'] in self._seen:
+                continue
+            self._seen.add(item['id'])
+
+            content_hash = self.content_hash(item)
+            existing = self._existing.get(item['id'])
+            if existing is None:
+                to_create.append((self._build_product_info(shop, item, content_hash), item))
+            elif existing[1] == content_hash:
+                result.unchanged += 1
+                continue
+            else:
+                product_info = self._build_product_info(shop, item, content_hash)
+                product_info.id = existing[0]
+                to_update.append((product_info, item))
+                self._touched_categories.add(existing[2])
+            self._touched_categories.add(int(item['category']))
+
+        ProductInfo.objects.bulk_create([product_info for product_info, _ in to_create], batch_size=self.batch_size)
+        if to_update:
+            ProductInfo.objects.bulk_update(
+                [product_info for product_info, _ in to_update],
+                ['product', 'model', 'name', 'price', 'price_rrc', 'quantity', 'content_hash'],
+                batch_size=self.batch_size,
+            )
+            ProductParameter.objects.filter(product_info_id__in=[product_info.id for product_info, _ in to_update]) \
+                .delete()
+
+        product_parameters = [
+            ProductParameter(
+                product_info_id=product_info.id,
+                parameter_id=self._parameters[name],
+                value=str(value),
+            )
+            for product_info, item in to_create + to_update
+            for name, value in (item.get('parameters') or {}).items()
+        ]
+        ProductParameter.objects.bulk_create(product_parameters, batch_size=self.batch_size)
+
+        if to_create or to_update:
+            self.search_index.update([product_info.id for product_info, _ in to_create + to_update])
+
+        result.rows += len(goods)
+        result.inserted += len(to_create)
+        result.updated += len(to_update)
+        result.parameters += len(product_parameters)
+
+    def _build_product_info(self, shop, item, content_hash):
+        return ProductInfo(
+            product_id=self._products[(int(item['category']), item['name'])],
+            shop=shop,
+            external_id=item['id'],
+            model=item.get('model'),
+            name=item['name'],
+            price=item['price'],
+            price_rrc=item['price_rrc'],
+            quantity=item['quantity'],
+            content_hash=content_hash,
+        )
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from backend.models import OrderItem
+
+
+class Command(BaseCommand):
+    help = 'Заполняет снимок цены и названия у позиций подтверждённых заказов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        queryset = OrderItem.objects.filter(price__isnull=True).exclude(order__status='new').order_by('id')
+        last_id = 0
+        updated = 0
+
+        # Пачки выбираются по возрастанию id, каждая в своей транзакции, так что
+        # команду можно прервать и запустить снова
+        while True:
+            ids = list(queryset.filter(id__gt=last_id).values_list('id', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            with transaction.atomic():
+                updated += OrderItem.objects.filter(id__in=ids).snapshot()
+            last_id = ids[-1]
+            self.stdout.write(f'{updated} items processed')
+
+        missing = queryset.count()
+        self.stdout.write(self.style.SUCCESS(
+            f'Done: {updated} items processed, {missing} without a matching ProductInfo'
+        ))
@@ -0,0 +1,95 @@
+import glob
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+from pathlib import Path
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.importer import PriceListImporter
+from backend.streaming import load_price_lists
+
+
+class Command(BaseCommand):
+    help = 'Импорт прайс-листов магазинов из каталога или по glob-шаблону'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='Каталог с YAML-файлами или glob-шаблон')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Количество процессов для разбора файлов')
+        parser.add_argument('--mode', choices=[PriceListImporter.UPSERT, PriceListImporter.REPLACE],
+                            default=PriceListImporter.UPSERT)
+        parser.add_argument('--batch-size', type=int, default=PriceListImporter.batch_size)
+
+    def handle(self, *args, **options):
+        paths = self.find_files(options['source'])
+        if not paths:
+            raise CommandError(f'No price lists found: {options["source"]}')
+
+        # Разбор YAML идёт параллельно в пуле процессов, а запись в базу
+        # выполняется последовательно в этом процессе: так импорты разных
+        # магазинов не конкурируют за блокировки, а один импортёр переиспользует
+        # закешированные категории, товары и параметры для всех файлов
+        importer = PriceListImporter(batch_size=options['batch_size'], mode=options['mode'])
+        started = perf_counter()
+        total_rows = 0
+        failed = 0
+
+        with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+            # Разобранный файл возвращается в этот процесс целиком, поэтому
+            # в работе не больше двух файлов на процесс, а импортированные сразу
+            # освобождаются: память не растёт с числом файлов
+            remaining = iter(paths)
+            pending = {}
+            while True:
+                for path in islice(remaining, 2 * options['workers'] - len(pending)):
+                    pending[executor.submit(load_price_lists, path)] = path
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    rows, ok = self.import_file(importer, pending.pop(future), future)
+                    total_rows += rows
+                    failed += not ok
+
+        duration = perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Total: {len(paths) - failed}/{len(paths)} files, {total_rows} rows, {duration:.2f}s, '
+            f'{total_rows / duration if duration else total_rows:.0f} rows/s'
+        ))
+
+    def import_file(self, importer, path, future):
+        """Импортирует разобранный файл, возвращает (строк записано, без ошибок ли)"""
+        try:
+            price_lists, parse_time = future.result()
+        except Exception as e:
+            self.stderr.write(f'{path}: {e}')
+            return 0, False
+
+        rows = 0
+        ok = True
+        for data in price_lists:
+            # Экспорт каталога содержит документ на магазин: ошибка одного
+            # магазина не отменяет импорт остальных
+            name = f'{path} [{data.get("shop")}]' if len(price_lists) > 1 else path
+            try:
+                result = importer.import_data(data)
+            except Exception as e:
+                self.stderr.write(f'{name}: {e}')
+                ok = False
+                continue
+            rows += result.rows
+            self.stdout.write(
+                f'{name}: {result.rows} rows, parse {parse_time:.2f}s, write {result.duration:.2f}s, '
+                f'{result.rows_per_second:.0f} rows/s (+{result.inserted} ~{result.updated} '
+                f'={result.unchanged} -{result.removed})'
+            )
+        return rows, ok
+
+    @staticmethod
+    def find_files(source):
+        path = Path(source)
+        if path.is_dir():
+            return sorted(str(p) for p in [*path.glob('*.yaml'), *path.glob('*.yml')])
+        return sorted(glob.glob(source))
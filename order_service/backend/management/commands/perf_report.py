@@ -0,0 +1,64 @@
+import json
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.profiling import profile_store
+
+SORT_KEYS = {'total': 'total_ms', 'p99': 'p99_ms', 'queries': 'avg_queries', 'db': 'avg_db_ms', 'count': 'count'}
+
+
+class Command(BaseCommand):
+    help = ('Отчёт о горячих путях по данным профилирования: с работающего сервера (--url), '
+            'из сохранённого ответа /api/_metrics/ (--file) или этого процесса')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help='Адрес /api/_metrics/ работающего сервера')
+        parser.add_argument('--token', help='Токен сотрудника для --url')
+        parser.add_argument('--file', help='JSON-ответ /api/_metrics/')
+        parser.add_argument('--sort', choices=SORT_KEYS, default='total')
+        parser.add_argument('--limit', type=int, default=20, help='Сколько эндпоинтов вывести')
+
+    def handle(self, *args, **options):
+        report = self.load_report(options)
+        endpoints = sorted(report['endpoints'].items(), key=lambda item: item[1][SORT_KEYS[options['sort']]],
+                           reverse=True)[:options['limit']]
+        if not endpoints:
+            raise CommandError('No profiled requests: check PROFILING_SAMPLE_RATE or the report source')
+
+        self.stdout.write(f'{"endpoint":50} {"count":>7} {"total s":>9} {"p50":>7} {"p99":>7} '
+                          f'{"queries":>8} {"db ms":>8} {"ser ms":>8}')
+        for endpoint, stats in endpoints:
+            self.stdout.write(
+                f'{endpoint[:50]:50} {stats["count"]:7} {stats["total_ms"] / 1000:9.2f} {stats["p50_ms"]:7.0f} '
+                f'{stats["p99_ms"]:7.0f} {stats["avg_queries"]:8.1f} {stats["avg_db_ms"]:8.1f} '
+                f'{stats["avg_serialization_ms"]:8.1f}'
+            )
+            for duplicate in stats['duplicates'][:3]:
+                self.stdout.write(f'    repeated in {duplicate["requests"]} requests: {duplicate["sql"][:120]}')
+
+        buffer = report['buffer']
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(endpoints)} endpoints, {buffer["used"]}/{buffer["size"]} profiles in buffer, '
+            f'sample rate {report["sample_rate"]}'
+        ))
+
+    @staticmethod
+    def load_report(options):
+        if options['url']:
+            headers = {'Authorization': f'Token {options["token"]}'} if options['token'] else {}
+            try:
+                response = requests.get(options['url'], params={'recent': 0}, headers=headers, timeout=10)
+                response.raise_for_status()
+            except requests.RequestException as e:
+                raise CommandError(f'Cannot fetch {options["url"]}: {e}')
+            return response.json()
+        if options['file']:
+            try:
+                with open(options['file'], encoding='utf-8') as f:
+                    return json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f'Cannot read {options["file"]}: {e}')
+        # Буфер живёт в памяти процесса: без --url/--file отчёт полезен только
+        # при вызове call_command() из того же процесса, что обслуживает запросы
+        return profile_store.report(recent=0)
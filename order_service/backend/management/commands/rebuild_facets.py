@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from backend.facets import rebuild_facets
+from backend.models import ParameterFacet
+
+
+class Command(BaseCommand):
+    help = 'Полный пересчёт материализованных счётчиков фасетов'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            rebuild_facets()
+        self.stdout.write(self.style.SUCCESS(f'{ParameterFacet.objects.count()} facet rows'))
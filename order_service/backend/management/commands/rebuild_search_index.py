@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from backend.models import ProductSearchDocument
+from backend.search import get_search_index
+
+
+class Command(BaseCommand):
+    help = 'Полная перестройка поискового индекса товаров'
+
+    def handle(self, *args, **options):
+        search_index = get_search_index()
+        with transaction.atomic():
+            search_index.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'{type(search_index).__name__}: {ProductSearchDocument.objects.count()} documents indexed'
+        ))
@@ -0,0 +1,87 @@
+import json
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from backend.authentication import last_seen
+from benchmarks.suite import BENCHMARKS, Context, compare, run
+
+
+class Command(BaseCommand):
+    help = ('Набор бенчмарков на синтетических данных во временной тестовой базе: импорт, каталог, поиск, '
+            'корзина, подтверждение и история заказов. Результаты пишутся в JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shops', type=int, default=4, help='Магазинов (не меньше 2: первый — прогрев импорта)')
+        parser.add_argument('--goods', type=int, default=2000, help='Товаров в прайс-листе магазина')
+        parser.add_argument('--parameters', type=int, default=4, help='Параметров у товара')
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--orders-per-user', type=int, default=20)
+        parser.add_argument('--cart-items', type=int, default=3, help='Позиций в корзине')
+        parser.add_argument('--iterations', type=int, default=200, help='Замеров каждого бенчмарка, кроме импорта')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), help='Только эти бенчмарки')
+        parser.add_argument('--output', help='Файл результатов, по умолчанию benchmark-results/<время>.json')
+        parser.add_argument('--compare', help='JSON предыдущего запуска для сравнения')
+        parser.add_argument('--catalog-cache', action='store_true', help='Не отключать кеш ответов каталога')
+
+    def handle(self, *args, **options):
+        if options['shops'] < 2:
+            raise CommandError('--shops must be at least 2')
+        if min(options['users'], options['iterations'], options['goods']) < 1:
+            raise CommandError('--users, --iterations and --goods must be positive')
+        baseline = self.load(options['compare']) if options['compare'] else None
+
+        context = Context(options['shops'], options['goods'], options['parameters'], options['users'],
+                          options['orders_per_user'], options['cart_items'], options['iterations'], options['seed'])
+        # Задачи уведомлений после подтверждения заказа уходят в брокер в памяти
+        overrides = {'PROFILING_SAMPLE_RATE': 0, 'CELERY_BROKER_URL': 'memory://'}
+        # Без --catalog-cache страницы каталога отдавались бы из кеша и замерялось
+        # бы чтение кеша; с ним кеш свой, в памяти: общий файловый кеш содержит
+        # ответы рабочей базы с теми же id магазинов
+        overrides['CACHES'] = {**settings.CACHES, settings.CATALOG_CACHE_ALIAS: {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache' if options['catalog_cache']
+            else 'django.core.cache.backends.dummy.DummyCache',
+            'LOCATION': 'benchmarks',
+        }}
+
+        # Тестовое окружение: testserver в ALLOWED_HOSTS, письма в locmem;
+        # данные создаются в тестовой базе, рабочая не затрагивается
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(**overrides):
+                result = run(context, options['only'],
+                             log=lambda name: self.stdout.write(f'{name}...'))
+        finally:
+            # Отметки визитов пользователей тестовой базы не должны попасть в рабочую при выходе
+            last_seen.flush()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        output = Path(options['output'] or Path(settings.BASE_DIR) / 'benchmark-results'
+                      / f'{datetime.now():%Y%m%d-%H%M%S}.json')
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(result, indent=2, ensure_ascii=False), encoding='utf-8')
+
+        self.stdout.write(f'{"benchmark":15} {"ops/s":>9} {"p50 ms":>9} {"p99 ms":>9} {"queries":>8} {"peak KB":>9}')
+        for name, stats in result['benchmarks'].items():
+            self.stdout.write(f'{name:15} {stats["ops_per_second"] or 0:9.1f} {stats["p50_ms"] or 0:9.2f} '
+                              f'{stats["p99_ms"] or 0:9.2f} {stats["queries_per_op"] or 0:8.1f} '
+                              f'{stats["peak_memory_kb"]:9.0f}')
+        if baseline:
+            for line in compare(baseline, result):
+                self.stdout.write(line)
+        self.stdout.write(self.style.SUCCESS(f'Results: {output} ({result["meta"]["duration"]}s)'))
+
+    @staticmethod
+    def load(path):
+        try:
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Cannot read {path}: {e}')
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:51
+
+import django.db.models.deletion
+from django.db import migrations, models, transaction
+from django.db.utils import OperationalError
+
+
+def create_fts_table(apps, schema_editor):
+    # Полнотекстовый индекс доступен только в SQLite, собранном с FTS5;
+    # в остальных случаях поиск работает через индекс на Python
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        with transaction.atomic(using=schema_editor.connection.alias):
+            schema_editor.execute(
+                "CREATE VIRTUAL TABLE backend_productsearch_fts "
+                "USING fts5(document, tokenize='unicode61 remove_diacritics 0')"
+            )
+    except OperationalError:
+        pass
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS backend_productsearch_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0005_productinfo_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchDocument',
+            fields=[
+                ('product_info', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='backend.productinfo', verbose_name='Продуктовая информация')),
+                ('document', models.TextField(verbose_name='Токены')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлён')),
+            ],
+        ),
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
@@ -0,0 +1,95 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:56
+
+from django.db import migrations, models
+from django.db.models import Count, F
+
+
+def duplicates(queryset, fields):
+    """Группы строк с одинаковыми fields: (id первой строки, id остальных)"""
+    for group in queryset.values(*fields).annotate(rows=Count('id')).filter(rows__gt=1).order_by():
+        ids = list(queryset.filter(**{field: group[field] for field in fields}).order_by('id')
+                   .values_list('id', flat=True))
+        yield ids[0], ids[1:]
+
+
+def merge_duplicates(apps, schema_editor):
+    """
+    До появления ограничений импорт и корзина могли создавать дубли. Строки
+    сливаются в первую по id: ссылки переносятся, количества в корзине
+    складываются, лишние строки удаляются
+    """
+    Parameter = apps.get_model('backend', 'Parameter')
+    ParameterFacet = apps.get_model('backend', 'ParameterFacet')
+    ProductParameter = apps.get_model('backend', 'ProductParameter')
+    Product = apps.get_model('backend', 'Product')
+    ProductInfo = apps.get_model('backend', 'ProductInfo')
+    Order = apps.get_model('backend', 'Order')
+    OrderItem = apps.get_model('backend', 'OrderItem')
+
+    for first_id, other_ids in duplicates(Parameter.objects.all(), ['name']):
+        ProductParameter.objects.filter(parameter_id__in=other_ids).update(parameter_id=first_id)
+        for facet in ParameterFacet.objects.filter(parameter_id__in=other_ids):
+            if not ParameterFacet.objects.filter(category_id=facet.category_id, parameter_id=first_id,
+                                                 value=facet.value).update(count=F('count') + facet.count):
+                ParameterFacet.objects.create(category_id=facet.category_id, parameter_id=first_id,
+                                              value=facet.value, count=facet.count)
+        Parameter.objects.filter(id__in=other_ids).delete()
+
+    for first_id, other_ids in duplicates(Product.objects.all(), ['category', 'name']):
+        ProductInfo.objects.filter(product_id__in=other_ids).update(product_id=first_id)
+        OrderItem.objects.filter(product_id__in=other_ids).update(product_id=first_id)
+        Product.objects.filter(id__in=other_ids).delete()
+
+    # Импорт находит строку по (shop, external_id): остальные строки с тем же
+    # ключом не обновлялись, их параметры и поисковые документы удаляются каскадом
+    for first_id, other_ids in duplicates(ProductInfo.objects.filter(external_id__isnull=False),
+                                          ['shop', 'external_id']):
+        ProductInfo.objects.filter(id__in=other_ids).delete()
+
+    for first_id, other_ids in duplicates(Order.objects.filter(status='new'), ['user']):
+        OrderItem.objects.filter(order_id__in=other_ids).update(order_id=first_id)
+        Order.objects.filter(id__in=other_ids).delete()
+
+    for first_id, other_ids in duplicates(OrderItem.objects.all(), ['order', 'product', 'shop']):
+        quantity = sum(OrderItem.objects.filter(id__in=other_ids).values_list('quantity', flat=True))
+        OrderItem.objects.filter(id=first_id).update(quantity=F('quantity') + quantity)
+        OrderItem.objects.filter(id__in=other_ids).delete()
+
+
+class Migration(migrations.Migration):
+    # Слияние дублей фиксируется отдельной транзакцией до изменения схемы:
+    # PostgreSQL не даёт менять таблицу с отложенными проверками внешних ключей
+    atomic = False
+
+    dependencies = [
+        ('backend', '0007_parameterfacet'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop, atomic=True),
+        migrations.AlterField(
+            model_name='parameter',
+            name='name',
+            field=models.CharField(max_length=255, unique=True, verbose_name='Название параметра'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'status'], name='order_user_status_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'new')), fields=('user',), name='unique_new_order_per_user'),
+        ),
+        migrations.AddConstraint(
+            model_name='orderitem',
+            constraint=models.UniqueConstraint(fields=('order', 'product', 'shop'), name='unique_orderitem_order_product_shop'),
+        ),
+        migrations.AddConstraint(
+            model_name='product',
+            constraint=models.UniqueConstraint(fields=('category', 'name'), name='unique_product_category_name'),
+        ),
+        migrations.AddConstraint(
+            model_name='productinfo',
+            constraint=models.UniqueConstraint(fields=('shop', 'external_id'), name='unique_productinfo_shop_external_id'),
+        ),
+    ]
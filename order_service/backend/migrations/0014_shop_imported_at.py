@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0013_customuser_last_seen'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shop',
+            name='imported_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Время последнего импорта'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:52
+
+from collections import Counter
+
+import django.db.models.expressions
+from django.db import migrations, models
+from django.db.models import F
+
+
+def move_reservations(apps, schema_editor):
+    # Действующие резервы корзин раньше вычитались из quantity: единицы
+    # возвращаются в остаток и учитываются в reserved
+    OrderItem = apps.get_model('backend', 'OrderItem')
+    ProductInfo = apps.get_model('backend', 'ProductInfo')
+    reserved = Counter()
+    for product_id, shop_id, quantity in OrderItem.objects \
+            .filter(order__status='new', reserved_until__isnull=False) \
+            .values_list('product_id', 'shop_id', 'quantity'):
+        reserved[product_id, shop_id] += quantity
+    for (product_id, shop_id), quantity in reserved.items():
+        # Резерв списывался с первой по id строки товара в магазине, как в reservations._stock()
+        product_info_id = ProductInfo.objects.filter(product_id=product_id, shop_id=shop_id) \
+            .order_by('id').values_list('id', flat=True).first()
+        if product_info_id is not None:
+            ProductInfo.objects.filter(id=product_info_id) \
+                .update(quantity=F('quantity') + quantity, reserved=quantity)
+
+
+def restore_reservations(apps, schema_editor):
+    ProductInfo = apps.get_model('backend', 'ProductInfo')
+    ProductInfo.objects.filter(reserved__gt=0).update(quantity=F('quantity') - F('reserved'), reserved=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0016_order_status_idx'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='productinfo',
+            name='productinfo_best_offer_idx',
+        ),
+        migrations.AddField(
+            model_name='productinfo',
+            name='reserved',
+            field=models.PositiveIntegerField(default=0, verbose_name='В резерве'),
+        ),
+        migrations.RunPython(move_reservations, restore_reservations),
+        migrations.AddField(
+            model_name='productinfo',
+            name='available',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.expressions.CombinedExpression(models.F('quantity'), '-', models.F('reserved')), output_field=models.IntegerField(), verbose_name='Доступно'),
+        ),
+        migrations.AddIndex(
+            model_name='productinfo',
+            index=models.Index(condition=models.Q(('available__gt', 0)), fields=['product', 'price', 'id'], name='productinfo_best_offer_idx'),
+        ),
+    ]
@@ -1,6 +1,11 @@
+from decimal import Decimal
+
 from django.db import models
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User, AbstractUser
 from django.conf import settings
+from django.utils import timezone
 
 
 
@@ -12,6 +17,8 @@ class CustomUser(AbstractUser):
     ]
 
     type = models.CharField(max_length=10, choices=USER_TYPES, default='customer')
+    # Обновляется пачками из backend.authentication.LastSeenBuffer
+    last_seen = models.DateTimeField(null=True, blank=True, verbose_name="Последний визит")
 
 
 
@@ -27,6 +34,8 @@ class Shop(models.Model):
         null=True,  # Если поле необязательно
         blank=True  # Если поле может быть пустым
     )
+    # Меняется только импортом, изменившим товары магазина: от него считаются ETag и Last-Modified экспорта
+    imported_at = models.DateTimeField(verbose_name="Время последнего импорта", null=True, blank=True)
 
     def __str__(self):
         return self.name
@@ -46,10 +55,27 @@ class Product(models.Model):
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name="products", verbose_name="Категория")
     name = models.CharField(max_length=255, verbose_name="Название продукта")
 
+    class Meta:
+        constraints = [
+            # Поиск товара по (name, category) при импорте
+            models.UniqueConstraint(fields=["category", "name"], name="unique_product_category_name"),
+        ]
+
     def __str__(self):
         return self.name
 
 
+class ProductInfoQuerySet(models.QuerySet):
+
+    def offers(self):
+        """
+        Предложения в наличии, лучшее (самое дешёвое) первым. Условие и порядок
+        совпадают с частичным индексом productinfo_best_offer_idx, поэтому
+        выбор лучшего предложения товара — один поиск по индексу
+        """
+        return self.filter(available__gt=0).order_by('price', 'id')
+
+
 # Модель дополнительной информации о продукте
 class ProductInfo(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="product_infos", verbose_name="Продукт")
@@ -58,8 +84,28 @@ class ProductInfo(models.Model):
     model = models.CharField(max_length=255, verbose_name="Модель", null=True, blank=True)
     name = models.CharField(max_length=255, verbose_name="Название информации")
     quantity = models.PositiveIntegerField(verbose_name="Количество")
+    # Резервы корзин хранятся отдельно от остатка магазина: импорт перезаписывает
+    # quantity данными прайс-листа и не теряет зарезервированные единицы
+    reserved = models.PositiveIntegerField(default=0, verbose_name="В резерве")
+    available = models.GeneratedField(expression=F("quantity") - F("reserved"), output_field=models.IntegerField(),
+                                      db_persist=True, verbose_name="Доступно")
     price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Цена")
     price_rrc = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Рекомендуемая цена")
+    content_hash = models.CharField(max_length=32, blank=True, default="", verbose_name="Хеш строки прайс-листа")
+
+    objects = ProductInfoQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Предложения товара в наличии по возрастанию цены. Индекс обновляется
+            # самой базой при импорте и резервировании, отдельно пересчитывать нечего
+            models.Index(fields=["product", "price", "id"], condition=models.Q(available__gt=0),
+                         name="productinfo_best_offer_idx"),
+        ]
+        constraints = [
+            # Ключ сопоставления строк прайс-листа при импорте
+            models.UniqueConstraint(fields=["shop", "external_id"], name="unique_productinfo_shop_external_id"),
+        ]
 
     def __str__(self):
         return f"{self.product.name} ({self.shop.name})"
@@ -67,7 +113,7 @@ class ProductInfo(models.Model):
 
 # Модель параметров для продукта
 class Parameter(models.Model):
-    name = models.CharField(max_length=255, verbose_name="Название параметра")
+    name = models.CharField(max_length=255, unique=True, verbose_name="Название параметра")
 
     def __str__(self):
         return self.name
@@ -81,10 +127,67 @@ class ProductParameter(models.Model):
                                   verbose_name="Параметр")
     value = models.CharField(max_length=255, verbose_name="Значение параметра")
 
+    class Meta:
+        indexes = [
+            # Фильтрация каталога по значению параметра
+            models.Index(fields=["parameter", "value"], name="productparameter_value_idx"),
+        ]
+
     def __str__(self):
         return f"{self.parameter.name}: {self.value}"
 
 
+# Материализованные счётчики фасетов: число товаров категории с данным значением параметра
+class ParameterFacet(models.Model):
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name="facets", verbose_name="Категория")
+    parameter = models.ForeignKey(Parameter, on_delete=models.CASCADE, related_name="facets", verbose_name="Параметр")
+    value = models.CharField(max_length=255, verbose_name="Значение параметра")
+    count = models.PositiveIntegerField(verbose_name="Количество товаров")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["category", "parameter", "value"], name="unique_parameter_facet"),
+        ]
+
+    def __str__(self):
+        return f"{self.parameter.name}: {self.value} ({self.count})"
+
+
+# Нормализованный поисковый документ товара (см. backend/search.py)
+class ProductSearchDocument(models.Model):
+    product_info = models.OneToOneField(ProductInfo, on_delete=models.CASCADE, primary_key=True,
+                                        related_name="search_document", verbose_name="Продуктовая информация")
+    document = models.TextField(verbose_name="Токены")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Обновлён")
+
+    def __str__(self):
+        return self.document
+
+
+class OrderQuerySet(models.QuerySet):
+
+    @staticmethod
+    def items_total():
+        """
+        Сумма заказа в базе: quantity * цена позиции. Для подтверждённых позиций
+        берётся зафиксированная OrderItem.price, иначе цена ProductInfo магазина
+        """
+        price = Coalesce('price', Subquery(OrderItem.objects.live_values('price')))
+        items_total = OrderItem.objects.filter(order=OuterRef('pk')).order_by().values('order') \
+            .annotate(total=Sum(F('quantity') * price, output_field=DecimalField())) \
+            .values('total')
+        return Coalesce(Subquery(items_total), Value(Decimal('0')),
+                        output_field=DecimalField(max_digits=12, decimal_places=2))
+
+    def with_totals(self):
+        """
+        Добавляет total_price: сохранённый Order.total либо сумма, посчитанная в базе
+        """
+        return self.annotate(total_price=Coalesce(
+            'total', self.items_total(), output_field=DecimalField(max_digits=12, decimal_places=2)
+        ))
+
+
 # Модель заказа
 class Order(models.Model):
     STATUS_CHOICES = [
@@ -101,22 +204,102 @@ class Order(models.Model):
     )
     dt = models.DateTimeField(auto_now_add=True, verbose_name="Дата и время")
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="new", verbose_name="Статус заказа")
+    # Денормализованная сумма, фиксируется при подтверждении заказа
+    total = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True, verbose_name="Сумма заказа")
+
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Корзина и история заказов пользователя
+            models.Index(fields=["user", "status"], name="order_user_status_idx"),
+            # Список заказов в админке с фильтром по статусу, новые первыми
+            models.Index(fields=["status", "id"], name="order_status_idx"),
+        ]
+        constraints = [
+            # У пользователя может быть только одна корзина
+            models.UniqueConstraint(fields=["user"], condition=models.Q(status="new"), name="unique_new_order_per_user"),
+        ]
 
     def __str__(self):
         return f"Order {self.id} ({self.get_status_display()})"
 
 
+class OrderItemQuerySet(models.QuerySet):
+
+    @staticmethod
+    def live_values(field):
+        """
+        Подзапрос к полю ProductInfo, соответствующей товару и магазину позиции
+        """
+        return ProductInfo.objects.filter(product=OuterRef('product'), shop=OuterRef('shop')).values(field)[:1]
+
+    def snapshot(self):
+        """
+        Фиксирует в позициях текущие цену и название из ProductInfo магазина
+        """
+        return self.update(
+            price=Subquery(self.live_values('price')),
+            product_name=Coalesce(Subquery(self.live_values('name')), Value('')),
+        )
+
+
 # Модель элемента заказа
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="items", verbose_name="Заказ")
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="order_items", verbose_name="Продукт")
     shop = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name="order_items", verbose_name="Магазин")
     quantity = models.PositiveIntegerField(verbose_name="Количество")
+    # Снимок цены и названия на момент подтверждения заказа
+    price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, verbose_name="Цена")
+    product_name = models.CharField(max_length=255, blank=True, default="", verbose_name="Название товара")
+    # Пока заказ не подтверждён, количество позиции учтено в ProductInfo.reserved,
+    # остаток магазина (quantity) не меняется до продажи при подтверждении. После
+    # этого срока резерв снимается и позиция удаляется из корзины; у подтверждённых
+    # позиций и позиций без резерва — NULL
+    reserved_until = models.DateTimeField(null=True, blank=True, verbose_name="Резерв до")
+
+    objects = OrderItemQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Поиск просроченных резервов
+            models.Index(fields=["reserved_until"], name="orderitem_reserved_until_idx"),
+        ]
+        constraints = [
+            # Одна позиция корзины на товар магазина
+            models.UniqueConstraint(fields=["order", "product", "shop"], name="unique_orderitem_order_product_shop"),
+        ]
 
     def __str__(self):
         return f"{self.product.name} x {self.quantity}"
 
 
+# Outbox уведомлений о заказе: строка пишется в транзакции подтверждения,
+# письма рассылает задача send_order_notifications
+class OrderNotification(models.Model):
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="notifications", verbose_name="Заказ")
+    contact = models.ForeignKey("Contact", on_delete=models.SET_NULL, related_name="notifications", null=True,
+                                blank=True, verbose_name="Контакт покупателя")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создано")
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name="Отправлено")
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Попыток отправки")
+    last_error = models.TextField(blank=True, default="", verbose_name="Последняя ошибка")
+    # Воркер помечает взятые строки своим токеном, чтобы параллельные
+    # воркеры не отправили письма дважды; по истечении срока строку можно взять снова
+    claimed_by = models.CharField(max_length=32, blank=True, default="", verbose_name="Взято воркером")
+    claimed_until = models.DateTimeField(null=True, blank=True, verbose_name="Взято до")
+
+    class Meta:
+        indexes = [
+            # Очередь неотправленных уведомлений
+            models.Index(fields=["id"], condition=models.Q(sent_at__isnull=True), name="notification_pending_idx"),
+        ]
+
+    def __str__(self):
+        return f"Notification {self.id} for order {self.order_id}"
+
+
 # Модель для контактов
 class Contact(models.Model):
     CONTACT_TYPE_CHOICES = [
@@ -134,4 +317,41 @@ class Contact(models.Model):
     value = models.CharField(max_length=255, verbose_name="Значение")
 
     def __str__(self):
-        return f"{self.get_type_display()}: {self.value}"
\ No newline at end of file
+        return f"{self.get_type_display()}: {self.value}"
+
+
+# Модель задачи фонового импорта прайс-листа
+class ImportJob(models.Model):
+    STATUS_CHOICES = [
+        ("pending", "В очереди"),
+        ("running", "Выполняется"),
+        ("done", "Завершён"),
+        ("failed", "Ошибка"),
+    ]
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="import_jobs",
+        verbose_name="Пользователь"
+    )
+    shop = models.ForeignKey(Shop, on_delete=models.SET_NULL, related_name="import_jobs", null=True, blank=True,
+                             verbose_name="Магазин")
+    file = models.FileField(upload_to="imports/%Y/%m/%d/", verbose_name="Файл прайс-листа")
+    task_id = models.CharField(max_length=255, blank=True, verbose_name="ID задачи Celery")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending", verbose_name="Статус")
+    rows_processed = models.PositiveIntegerField(default=0, verbose_name="Обработано строк")
+    errors = models.JSONField(default=list, blank=True, verbose_name="Ошибки")
+    summary = models.JSONField(default=dict, blank=True, verbose_name="Итоги импорта")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создана")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="Запущена")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Завершена")
+
+    @property
+    def duration(self):
+        if not self.started_at:
+            return None
+        return ((self.finished_at or timezone.now()) - self.started_at).total_seconds()
+
+    def __str__(self):
+        return f"Import {self.id} ({self.get_status_display()})"
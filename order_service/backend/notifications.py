@@ -0,0 +1,120 @@
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import OrderItem, OrderNotification
+
+
+def _order_lines(items):
+    lines = [f'{item.product_name or item.product_id} x {item.quantity}: {item.price} руб.' for item in items]
+    return '\n'.join(lines)
+
+
+def customer_email(notification):
+    contact = notification.contact
+    if contact is not None and contact.type == 'email':
+        return contact.value
+    return notification.order.user.email or None
+
+
+def build_messages(notification, items):
+    """
+    Письма по подтверждённому заказу: покупателю — весь заказ, каждому
+    магазину — одно письмо с его позициями. Магазины без владельца с email
+    и покупатель без email пропускаются
+    """
+    order = notification.order
+    messages = []
+    recipient = customer_email(notification)
+    if recipient:
+        messages.append(EmailMessage(
+            f'Заказ №{order.id} подтверждён',
+            f'{_order_lines(items)}\n\nИтого: {order.total} руб.',
+            to=[recipient],
+        ))
+
+    by_shop = defaultdict(list)
+    for item in items:
+        by_shop[item.shop].append(item)
+    for shop, shop_items in by_shop.items():
+        if shop.user is None or not shop.user.email:
+            continue
+        messages.append(EmailMessage(
+            f'Новый заказ №{order.id} в магазине {shop.name}',
+            _order_lines(shop_items),
+            to=[shop.user.email],
+        ))
+    return messages
+
+
+def _claim(batch_size, now, after_id):
+    pending = OrderNotification.objects.filter(
+        Q(claimed_until__isnull=True) | Q(claimed_until__lt=now),
+        sent_at__isnull=True, attempts__lt=settings.NOTIFICATION_MAX_ATTEMPTS, id__gt=after_id,
+    )
+    ids = list(pending.order_by('id').values_list('id', flat=True)[:batch_size])
+    if not ids:
+        return []
+    token = uuid.uuid4().hex
+    # Условия повторяются в UPDATE: строки, взятые другим воркером между
+    # выборкой и обновлением, не перезаписываются
+    pending.filter(id__in=ids).update(
+        claimed_by=token, claimed_until=now + timedelta(seconds=settings.NOTIFICATION_CLAIM_TIMEOUT),
+    )
+    return list(
+        OrderNotification.objects.filter(claimed_by=token)
+        .select_related('order__user', 'contact').order_by('id')
+    )
+
+
+def send_pending_notifications(batch_size=None):
+    """
+    Рассылает неотправленные уведомления пачками по batch_size. Позиции всех
+    заказов пачки читаются одним запросом, письма пачки идут через одно
+    SMTP-соединение. Неудачная отправка не мешает остальным: уведомление
+    остаётся в очереди до NOTIFICATION_MAX_ATTEMPTS попыток.
+
+    Возвращает число отправленных уведомлений
+    """
+    batch_size = batch_size or settings.NOTIFICATION_BATCH_SIZE
+    sent_total = 0
+    # Пачки идут по возрастанию id: неудачные уведомления повторяются при следующем запуске, а не в этом
+    last_id = 0
+    while True:
+        notifications = _claim(batch_size, timezone.now(), last_id)
+        if not notifications:
+            return sent_total
+        last_id = notifications[-1].id
+
+        items = defaultdict(list)
+        for item in OrderItem.objects.filter(
+                order_id__in={notification.order_id for notification in notifications}, quantity__gt=0,
+        ).select_related('shop__user').order_by('id'):
+            items[item.order_id].append(item)
+
+        sent, failed = [], []
+        with get_connection() as connection:
+            for notification in notifications:
+                try:
+                    connection.send_messages(build_messages(notification, items[notification.order_id]))
+                except Exception as e:
+                    notification.last_error = str(e)
+                    failed.append(notification)
+                else:
+                    sent.append(notification.id)
+
+        OrderNotification.objects.filter(id__in=sent).update(
+            sent_at=timezone.now(), attempts=F('attempts') + 1, last_error='', claimed_by='', claimed_until=None,
+        )
+        for notification in failed:
+            OrderNotification.objects.filter(id=notification.id).update(
+                attempts=F('attempts') + 1, last_error=notification.last_error, claimed_by='', claimed_until=None,
+            )
+        sent_total += len(sent)
+        if len(notifications) < batch_size:
+            return sent_total
@@ -0,0 +1,138 @@
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.db.models import Max, Min
+from django.utils.functional import cached_property
+from rest_framework.pagination import CursorPagination
+
+
+def estimated_count(queryset):
+    """
+    Примерное число строк таблицы модели queryset без COUNT(*): статистика
+    планировщика (pg_class.reltuples, sqlite_stat1 после ANALYZE), а без неё —
+    диапазон первичных ключей, который читается из индекса. None, если
+    оценить не удалось
+    """
+    model = queryset.model
+    connection = connections[queryset.db]
+    table = model._meta.db_table
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+                row = cursor.fetchone()
+                if row and row[0] >= 0:
+                    return row[0]
+            elif connection.vendor == 'sqlite':
+                cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table])
+                row = cursor.fetchone()
+                if row:
+                    return int(row[0].split()[0])
+    except DatabaseError:
+        # sqlite_stat1 появляется только после первого ANALYZE
+        pass
+    bounds = model._default_manager.using(queryset.db).aggregate(low=Min('pk'), high=Max('pk'))
+    if not isinstance(bounds['high'], int):
+        return None
+    return bounds['high'] - bounds['low'] + 1
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator списков админки по большим таблицам. Для списка без фильтров
+    число строк оценивается через estimated_count(), для отфильтрованного
+    COUNT(*) останавливается на max_count строках: страницы дальше недоступны,
+    но запрос не читает миллион строк ради номера последней страницы
+    """
+    max_count = 10_000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_count(queryset)
+            if estimate is not None:
+                return estimate
+        return queryset.order_by()[:self.max_count].count()
+
+
+class AsyncCursorPagination(CursorPagination):
+    """
+    CursorPagination с apaginate_queryset() для асинхронных представлений.
+
+    Синхронный paginate_queryset() остаётся из DRF. Асинхронный строит запрос
+    страницы по тем же курсорам в page_queryset(), выбирает её через async for
+    в цикле событий и разбирает строки в set_page()
+    """
+
+    def page_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        offset, reverse, current_position = self.cursor or (0, False, None)
+
+        ordering = self.ordering
+        if reverse:
+            ordering = [field[1:] if field.startswith('-') else f'-{field}' for field in ordering]
+        queryset = queryset.order_by(*ordering)
+
+        if current_position is not None:
+            order = self.ordering[0]
+            # Курсор назад по убывающему порядку (и наоборот) идёт к меньшим значениям
+            lookup = 'lt' if reverse != order.startswith('-') else 'gt'
+            queryset = queryset.filter(**{f'{order.lstrip("-")}__{lookup}': current_position})
+
+        # Лишняя строка показывает, есть ли следующая страница
+        return queryset[offset:offset + self.page_size + 1]
+
+    def set_page(self, results):
+        offset, reverse, current_position = self.cursor or (0, False, None)
+        self.page = results[:self.page_size]
+        if len(results) > len(self.page):
+            following_position = self._get_position_from_instance(results[-1], self.ordering)
+        else:
+            following_position = None
+
+        if reverse:
+            self.page.reverse()
+            self.has_next = current_position is not None or offset > 0
+            self.has_previous = following_position is not None
+            self.next_position, self.previous_position = current_position, following_position
+        else:
+            self.has_next = following_position is not None
+            self.has_previous = current_position is not None or offset > 0
+            self.next_position, self.previous_position = following_position, current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        queryset = self.page_queryset(queryset, request, view)
+        if queryset is None:
+            return None
+        return self.set_page([row async for row in queryset])
+
+
+class CatalogCursorPagination(AsyncCursorPagination):
+    """
+    Keyset-пагинация каталога по id: страница выбирается условием id > курсор,
+    без OFFSET и без COUNT(*) по всей таблице
+    """
+    ordering = 'id'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class OrderHistoryPagination(AsyncCursorPagination):
+    """
+    Keyset-пагинация истории заказов: сначала новые
+    """
+    ordering = '-id'
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
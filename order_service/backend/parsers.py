@@ -0,0 +1,44 @@
+import codecs
+
+import ujson
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+
+from .renderers import orjson, ORJSONRenderer, UJSONRenderer
+
+
+class FastJSONParser(JSONParser):
+    """
+    Основа парсеров на быстрых JSON-библиотеках, разбирающих байты напрямую
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        body = stream.read() if stream is not None else b''
+        if codecs.lookup(encoding).name != 'utf-8':
+            body = body.decode(encoding)
+        try:
+            return self.loads(body)
+        except ValueError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
+
+    def loads(self, body):
+        raise NotImplementedError
+
+
+class UJSONParser(FastJSONParser):
+    renderer_class = UJSONRenderer
+
+    def loads(self, body):
+        return ujson.loads(body)
+
+
+class ORJSONParser(FastJSONParser):
+    renderer_class = ORJSONRenderer
+
+    def loads(self, body):
+        return orjson.loads(body)
+
+
+DefaultJSONParser = ORJSONParser if orjson is not None else UJSONParser
@@ -0,0 +1,293 @@
+import random
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+# Верхние границы корзин гистограммы задержек, мс
+LATENCY_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+# Сколько разных повторяющихся запросов хранится на эндпоинт
+MAX_DUPLICATES_PER_ENDPOINT = 20
+
+_IN_LIST = re.compile(r'\((?:%s, )+%s\)')
+_NUMBER = re.compile(r'\b\d+\b')
+
+# Профиль текущего запроса; contextvars переходят и в потоки sync_to_async
+_current_profile = ContextVar('request_profile', default=None)
+
+
+def fingerprint(sql):
+    """
+    Отпечаток запроса: значения уже вынесены в параметры, остаётся свернуть
+    IN-списки разной длины и числа в LIMIT/OFFSET
+    """
+    return _NUMBER.sub('?', _IN_LIST.sub('(%s, ...)', sql))
+
+
+def _query_wrapper(execute, sql, params, many, context):
+    profile = _current_profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.add_query(sql, time.perf_counter() - started)
+
+
+def install_query_wrapper(connection, **kwargs):
+    # Обёртка ставится первой: execute_wrapper() снимает с конца списка только свои обёртки
+    if _query_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _query_wrapper)
+
+
+connection_created.connect(install_query_wrapper)
+
+
+@contextmanager
+def serialization_timer():
+    """
+    Засчитывает время блока в сериализацию профилируемого запроса: для
+    ответов, которые отрисовываются сразу, а не после представления
+    """
+    profile = _current_profile.get()
+    if profile is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.serialization_time += time.perf_counter() - started
+
+
+@dataclass
+class RequestProfile:
+    method: str
+    path: str
+    endpoint: str = ''
+    status: int = 0
+    started_at: float = field(default_factory=time.time)
+    duration: float = 0.0
+    queries: int = 0
+    db_time: float = 0.0
+    serialization_time: float = 0.0
+    # Запросы, выполненные больше одного раза (признак N+1): [(отпечаток, сколько раз)]
+    duplicates: list = field(default_factory=list)
+    _fingerprints: Counter = field(default_factory=Counter, repr=False)
+
+    def add_query(self, sql, elapsed):
+        self.queries += 1
+        self.db_time += elapsed
+        self._fingerprints[fingerprint(sql)] += 1
+
+    def finish(self, endpoint, status, duration):
+        self.endpoint = endpoint
+        self.status = status
+        self.duration = duration
+        self.duplicates = [(sql, count) for sql, count in self._fingerprints.most_common(5) if count > 1]
+        # В кольцевом буфере остаются только повторы, а не все запросы
+        self._fingerprints = None
+
+    def as_dict(self):
+        return {
+            'method': self.method, 'path': self.path, 'endpoint': self.endpoint, 'status': self.status,
+            'started_at': self.started_at, 'duration_ms': self.duration * 1000, 'queries': self.queries,
+            'db_ms': self.db_time * 1000, 'serialization_ms': self.serialization_time * 1000,
+            'duplicates': [{'sql': sql, 'count': count} for sql, count in self.duplicates],
+        }
+
+
+class EndpointStats:
+    """
+    Накопленные показатели эндпоинта с гистограммой задержек: память не
+    зависит от числа запросов
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.max_duration = 0.0
+        self.queries = 0
+        self.max_queries = 0
+        self.db_time = 0.0
+        self.serialization_time = 0.0
+        self.histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+        # отпечаток -> в скольких запросах он повторялся
+        self.duplicates = Counter()
+
+    def add(self, profile):
+        self.count += 1
+        self.duration += profile.duration
+        self.max_duration = max(self.max_duration, profile.duration)
+        self.queries += profile.queries
+        self.max_queries = max(self.max_queries, profile.queries)
+        self.db_time += profile.db_time
+        self.serialization_time += profile.serialization_time
+        duration_ms = profile.duration * 1000
+        self.histogram[next((i for i, bound in enumerate(LATENCY_BUCKETS) if duration_ms <= bound),
+                            len(LATENCY_BUCKETS))] += 1
+        for sql, _ in profile.duplicates:
+            if sql in self.duplicates or len(self.duplicates) < MAX_DUPLICATES_PER_ENDPOINT:
+                self.duplicates[sql] += 1
+
+    def percentile(self, q):
+        """
+        Верхняя граница корзины, в которую попадает квантиль q, мс; для
+        последней корзины — максимальная задержка
+        """
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.histogram):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max_duration * 1000
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'total_ms': self.duration * 1000,
+            'avg_ms': self.duration / self.count * 1000,
+            'p50_ms': self.percentile(0.5),
+            'p95_ms': self.percentile(0.95),
+            'p99_ms': self.percentile(0.99),
+            'max_ms': self.max_duration * 1000,
+            'avg_queries': self.queries / self.count,
+            'max_queries': self.max_queries,
+            'avg_db_ms': self.db_time / self.count * 1000,
+            'avg_serialization_ms': self.serialization_time / self.count * 1000,
+            'histogram': {
+                **{f'le_{bound}': count for bound, count in zip(LATENCY_BUCKETS, self.histogram)},
+                'inf': self.histogram[-1],
+            },
+            'duplicates': [{'sql': sql, 'requests': count} for sql, count in self.duplicates.most_common()],
+        }
+
+
+class ProfileStore:
+    """
+    Кольцевой буфер последних профилей и накопленные показатели по эндпоинтам
+    """
+
+    def __init__(self, size):
+        self.lock = threading.Lock()
+        self.recent = deque(maxlen=size)
+        self.endpoints = {}
+
+    def add(self, profile):
+        with self.lock:
+            self.recent.append(profile)
+            stats = self.endpoints.get(profile.endpoint)
+            if stats is None:
+                stats = self.endpoints[profile.endpoint] = EndpointStats()
+            stats.add(profile)
+
+    def reset(self):
+        with self.lock:
+            self.recent.clear()
+            self.endpoints.clear()
+
+    def report(self, recent=50):
+        """
+        Эндпоинты по убыванию суммарного времени (горячие пути первыми) и
+        последние recent профилей
+        """
+        with self.lock:
+            endpoints = {endpoint: stats.as_dict() for endpoint, stats in self.endpoints.items()}
+            profiles = list(self.recent)[-recent:] if recent else []
+            used = len(self.recent)
+        return {
+            'sample_rate': settings.PROFILING_SAMPLE_RATE,
+            'buffer': {'size': self.recent.maxlen, 'used': used},
+            'endpoints': dict(sorted(endpoints.items(), key=lambda item: item[1]['total_ms'], reverse=True)),
+            'recent': [profile.as_dict() for profile in reversed(profiles)],
+        }
+
+
+profile_store = ProfileStore(settings.PROFILING_BUFFER_SIZE)
+
+
+class ProfilingMiddleware:
+    """
+    Профилирует долю PROFILING_SAMPLE_RATE запросов: число и время запросов к
+    базе, время отрисовки ответа (сериализации в JSON), повторяющиеся запросы.
+    Запросы без выборки проходят с одним вызовом random(), обёртка курсора для
+    них проверяет только ContextVar.
+
+    Работает и под WSGI, и под ASGI без перехода в поток
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        # Соединения, открытые до загрузки middleware, сигнал connection_created уже пропустили
+        for connection in connections.all(initialized_only=True):
+            install_query_wrapper(connection)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        profile = self.start(request)
+        if profile is None:
+            return self.get_response(request)
+        token = _current_profile.set(profile)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_profile.reset(token)
+        self.finish(request, response, profile)
+        return response
+
+    async def __acall__(self, request):
+        profile = self.start(request)
+        if profile is None:
+            return await self.get_response(request)
+        token = _current_profile.set(profile)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_profile.reset(token)
+        self.finish(request, response, profile)
+        return response
+
+    @staticmethod
+    def start(request):
+        if random.random() >= settings.PROFILING_SAMPLE_RATE:
+            return None
+        request._profile = RequestProfile(request.method, request.path)
+        request._profile_started = time.perf_counter()
+        return request._profile
+
+    def process_template_response(self, request, response):
+        # Ответы DRF рисуются после представления: время отрисовки — между
+        # этим вызовом и post-render callback. Асинхронные представления
+        # рисуют ответ сами, внутри serialization_timer()
+        profile = getattr(request, '_profile', None)
+        if profile is not None:
+            started = time.perf_counter()
+
+            def rendered(response):
+                profile.serialization_time += time.perf_counter() - started
+
+            response.add_post_render_callback(rendered)
+        return response
+
+    @staticmethod
+    def finish(request, response, profile):
+        match = getattr(request, 'resolver_match', None)
+        endpoint = f'{request.method} /{match.route}' if match else f'{request.method} <unresolved>'
+        profile.finish(endpoint, response.status_code, time.perf_counter() - request._profile_started)
+        profile_store.add(profile)
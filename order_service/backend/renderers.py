@@ -0,0 +1,55 @@
+import ujson
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # orjson необязателен, без него используется ujson
+    orjson = None
+
+# Всё, что быстрые кодировщики не умеют сами (datetime для ujson, Decimal для
+# orjson, ленивые строки, timedelta...), преобразуется так же, как в
+# JSONEncoder DRF: datetime в ISO 8601 с Z для UTC, Decimal в число
+json_default = JSONEncoder().default
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    Основа рендереров на быстрых JSON-библиотеках. Вывод совпадает с
+    JSONRenderer; запросы с отступами (?indent, Browsable API) отдаются им же
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = self.dumps(data)
+        # Как и JSONRenderer, экранируем разделители строк, недопустимые в JavaScript
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+    def dumps(self, data):
+        raise NotImplementedError
+
+
+class UJSONRenderer(FastJSONRenderer):
+
+    def dumps(self, data):
+        return ujson.dumps(data, ensure_ascii=self.ensure_ascii, escape_forward_slashes=False,
+                           allow_nan=not self.strict, default=json_default).encode()
+
+
+class ORJSONRenderer(FastJSONRenderer):
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # orjson пишет только UTF-8; ASCII-вывод (UNICODE_JSON = False) отдаём JSONRenderer
+        if self.ensure_ascii:
+            return JSONRenderer.render(self, data, accepted_media_type, renderer_context)
+        return super().render(data, accepted_media_type, renderer_context)
+
+    def dumps(self, data):
+        return orjson.dumps(data, default=json_default, option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS)
+
+
+DefaultJSONRenderer = ORJSONRenderer if orjson is not None else UJSONRenderer
@@ -0,0 +1,249 @@
+from collections import Counter
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Subquery
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .caching import bump_shop_version, touch_shop_stock
+from .models import Order, OrderItem, OrderNotification, ProductInfo
+
+
+class OutOfStock(Exception):
+    """
+    На складе магазина не хватает товара для резерва
+    """
+
+
+def reservation_deadline():
+    return timezone.now() + timedelta(seconds=settings.CART_RESERVATION_TTL)
+
+
+def _stock(product_id, shop_id):
+    # Остаток позиции заказа хранится в ProductInfo товара в магазине
+    first = ProductInfo.objects.filter(product_id=product_id, shop_id=shop_id).order_by('id').values('id')[:1]
+    return ProductInfo.objects.filter(id=Subquery(first))
+
+
+def _stock_changed(shop_id, in_stock_changed):
+    # Закешированные ответы каталога устаревают, только когда товар появился
+    # в наличии или пропал (available > 0 — фильтр витрины и лучших
+    # предложений): иначе каждый резерв сбрасывал бы кеш всего магазина.
+    # Выгружаемый остаток меняется всегда, от него считается ETag выгрузки
+    transaction.on_commit(partial(bump_shop_version if in_stock_changed else touch_shop_stock, shop_id))
+
+
+def reserve(product_id, shop_id, quantity):
+    """
+    Резервирует quantity одним условным UPDATE ... WHERE available > n, а
+    последние единицы — вторым UPDATE ... WHERE available = n. Проверка и
+    резерв атомарны на уровне строки, поэтому параллельные резервы не
+    превышают остаток. Остаток магазина (quantity) не меняется: его
+    перезаписывает импорт прайс-листа. Возвращает False, если товара не хватает
+    """
+    stock = _stock(product_id, shop_id)
+    reserved = F('reserved') + quantity
+    if stock.filter(available__gt=quantity).update(reserved=reserved):
+        _stock_changed(shop_id, in_stock_changed=False)
+        return True
+    if stock.filter(available=quantity).update(reserved=reserved):
+        _stock_changed(shop_id, in_stock_changed=True)
+        return True
+    return False
+
+
+def release(product_id, shop_id, quantity):
+    stock = _stock(product_id, shop_id)
+    reserved = Greatest(F('reserved') - quantity, 0)
+    if stock.filter(available__gt=0).update(reserved=reserved):
+        _stock_changed(shop_id, in_stock_changed=False)
+    elif stock.update(reserved=reserved):
+        # Товара не было в наличии, резерв возвращает его на витрину
+        _stock_changed(shop_id, in_stock_changed=True)
+
+
+def sell(product_id, shop_id, quantity):
+    """
+    Продажа зарезервированного товара: единицы уходят из резерва и из остатка
+    магазина, доступный остаток не меняется. Возвращает False, если остатка
+    меньше (после импорта или снятия с продажи остаток мог стать меньше резерва)
+    """
+    stock = _stock(product_id, shop_id).filter(quantity__gte=quantity)
+    values = {'quantity': F('quantity') - quantity, 'reserved': Greatest(F('reserved') - quantity, 0)}
+    if stock.filter(reserved__gte=quantity).update(**values):
+        _stock_changed(shop_id, in_stock_changed=False)
+        return True
+    # Проданы и незарезервированные единицы: доступный остаток уменьшился
+    updated = stock.update(**values)
+    if updated:
+        _stock_changed(shop_id, in_stock_changed=True)
+    return bool(updated)
+
+
+def _reserved(item):
+    # Позиции, добавленные до появления резервов, со склада не списывались
+    return item.quantity if item is not None and item.reserved_until is not None else 0
+
+
+def _release_items(items):
+    quantities = Counter()
+    for item in items:
+        quantities[item.product_id, item.shop_id] += _reserved(item)
+    for (product_id, shop_id), quantity in quantities.items():
+        if quantity:
+            release(product_id, shop_id, quantity)
+
+
+def set_cart_item(user, product_id, shop_id, quantity):
+    """
+    Устанавливает количество товара магазина в корзине пользователя:
+    разница с прежним количеством резервируется или возвращается на склад,
+    срок резерва продлевается
+    """
+    with transaction.atomic():
+        cart, _ = Order.objects.get_or_create(user=user, status='new')
+        item = OrderItem.objects.select_for_update() \
+            .filter(order=cart, product_id=product_id, shop_id=shop_id).first()
+
+        delta = quantity - _reserved(item)
+        if delta > 0 and not reserve(product_id, shop_id, delta):
+            raise OutOfStock('Недостаточно товара на складе')
+        if delta < 0:
+            release(product_id, shop_id, -delta)
+
+        if item is None:
+            item = OrderItem(order=cart, product_id=product_id, shop_id=shop_id)
+        item.quantity = quantity
+        item.reserved_until = reservation_deadline()
+        item.save()
+        return item
+
+
+def set_cart_items(user, lines):
+    """
+    Пакетный вариант set_cart_item для строк (product_id, shop_id, quantity).
+
+    Остатки всех строк блокируются одним запросом (в порядке id, чтобы
+    параллельные корзины не блокировали друг друга), проверяются в памяти и
+    записываются bulk_update; позиции корзины создаются и обновляются пачками.
+    Строки, для которых не хватает товара, пропускаются. Возвращает для каждой
+    строки позицию корзины или None
+    """
+    product_ids = {product_id for product_id, _, _ in lines}
+    shop_ids = {shop_id for _, shop_id, _ in lines}
+    with transaction.atomic():
+        cart, _ = Order.objects.get_or_create(user=user, status='new')
+        stock = {}
+        for product_info in ProductInfo.objects.select_for_update() \
+                .filter(product_id__in=product_ids, shop_id__in=shop_ids) \
+                .only('id', 'product_id', 'shop_id', 'quantity', 'reserved').order_by('id'):
+            stock.setdefault((product_info.product_id, product_info.shop_id), product_info)
+        items = {(item.product_id, item.shop_id): item for item in OrderItem.objects.select_for_update()
+                 .filter(order=cart, product_id__in=product_ids, shop_id__in=shop_ids)}
+
+        deadline = reservation_deadline()
+        results = []
+        changed_stock = {}
+        changed_items = {}
+        crossed_shops = set()
+        for product_id, shop_id, quantity in lines:
+            key = product_id, shop_id
+            product_info = stock.get(key)
+            item = items.get(key)
+            delta = quantity - _reserved(item)
+            if product_info is None or product_info.quantity - product_info.reserved < delta:
+                results.append(None)
+                continue
+
+            in_stock = product_info.quantity > product_info.reserved
+            product_info.reserved = max(product_info.reserved + delta, 0)
+            if in_stock != (product_info.quantity > product_info.reserved):
+                crossed_shops.add(shop_id)
+            changed_stock[product_info.id] = product_info
+            if item is None:
+                item = items[key] = OrderItem(order=cart, product_id=product_id, shop_id=shop_id)
+            item.quantity = quantity
+            item.reserved_until = deadline
+            changed_items[key] = item
+            results.append(item)
+
+        ProductInfo.objects.bulk_update(changed_stock.values(), ['reserved'])
+        for shop_id in {product_info.shop_id for product_info in changed_stock.values()}:
+            _stock_changed(shop_id, in_stock_changed=shop_id in crossed_shops)
+        OrderItem.objects.bulk_create([item for item in changed_items.values() if item.pk is None])
+        OrderItem.objects.bulk_update([item for item in changed_items.values() if item.pk is not None],
+                                      ['quantity', 'reserved_until'])
+    return results
+
+
+def remove_cart_items(user, item_ids):
+    """
+    Удаляет позиции из корзины пользователя и возвращает их резерв на склад
+    """
+    with transaction.atomic():
+        items = list(OrderItem.objects.select_for_update(of=('self',))
+                     .filter(order__user=user, order__status='new', id__in=item_ids))
+        _release_items(items)
+        OrderItem.objects.filter(id__in=[item.id for item in items]).delete()
+    return len(items)
+
+
+def confirm_cart(user, order_id, contact=None):
+    """
+    Подтверждает корзину: зарезервированный товар списывается с остатка
+    магазина (позиции без резерва сначала резервируются), цены и названия
+    фиксируются в позициях, сумма — в заказе. В той же транзакции в outbox
+    пишется уведомление о заказе для покупателя (contact) и магазинов.
+
+    Возвращает заказ или None, если корзина не найдена или пуста (например,
+    резерв истёк и позиции удалены); при нехватке товара бросает OutOfStock
+    """
+    with transaction.atomic():
+        order = Order.objects.select_for_update().filter(id=order_id, user=user, status='new').first()
+        if order is None:
+            return None
+        items = OrderItem.objects.filter(order=order)
+        quantities = Counter()
+        for item in items.select_for_update():
+            if item.reserved_until is None and item.quantity \
+                    and not reserve(item.product_id, item.shop_id, item.quantity):
+                raise OutOfStock('Недостаточно товара на складе')
+            quantities[item.product_id, item.shop_id] += item.quantity
+        if not quantities:
+            return None
+        for (product_id, shop_id), quantity in quantities.items():
+            if quantity and not sell(product_id, shop_id, quantity):
+                raise OutOfStock('Недостаточно товара на складе')
+        items.update(reserved_until=None)
+        items.snapshot()
+        Order.objects.filter(id=order.id).update(status='in_progress', total=Order.objects.items_total())
+        OrderNotification.objects.create(order=order, contact=contact)
+    return order
+
+
+def release_expired(now=None, batch_size=500):
+    """
+    Снимает просроченные резервы неподтверждённых корзин: товар возвращается
+    на склад, позиции удаляются. Возвращает число удалённых позиций
+    """
+    expired = OrderItem.objects.filter(order__status='new', reserved_until__lt=now or timezone.now()) \
+        .order_by('id')
+    last_id = 0
+    released = 0
+
+    while True:
+        ids = list(expired.filter(id__gt=last_id).values_list('id', flat=True)[:batch_size])
+        if not ids:
+            break
+        with transaction.atomic():
+            # Условия перепроверяются под блокировкой: позицию могли продлить,
+            # удалить или подтвердить заказ после выборки id
+            items = list(expired.select_for_update(of=('self',)).filter(id__in=ids))
+            _release_items(items)
+            OrderItem.objects.filter(id__in=[item.id for item in items]).delete()
+        released += len(items)
+        last_id = ids[-1]
+    return released
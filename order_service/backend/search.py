@@ -0,0 +1,307 @@
+import math
+import re
+import uuid
+from bisect import bisect_left
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.db.models.expressions import RawSQL
+
+from .utils import chunked
+from .models import ProductInfo, ProductParameter, ProductSearchDocument
+
+TOKEN_RE = re.compile(r'[^\W_]+')
+
+FTS_TABLE = 'backend_productsearch_fts'
+
+SEARCH_VERSION_KEY = 'catalog:search:version'
+
+
+def normalize(text):
+    """
+    Приводит текст к виду, в котором он хранится в индексе: casefold и ё -> е
+    """
+    return str(text).casefold().replace('ё', 'е')
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(normalize(text))
+
+
+class ProductSearchIndex:
+    """
+    Поисковый индекс по ProductInfo: название, модель, категория и значения
+    параметров.
+
+    Нормализованные токены каждого товара хранятся в ProductSearchDocument,
+    поверх которой подклассы строят структуру для быстрого поиска по
+    префиксам. Индекс обновляется точечно, для изменившихся товаров.
+    """
+    batch_size = 500
+
+    def update(self, product_info_ids):
+        documents = self.build_documents(product_info_ids)
+        ProductSearchDocument.objects.filter(product_info_id__in=documents).delete()
+        ProductSearchDocument.objects.bulk_create(
+            [ProductSearchDocument(product_info_id=product_info_id, document=document)
+             for product_info_id, document in documents.items()],
+            batch_size=self.batch_size,
+        )
+        return documents
+
+    def remove(self, queryset):
+        ProductSearchDocument.objects.filter(product_info__in=queryset).delete()
+
+    def rebuild(self):
+        ProductSearchDocument.objects.all().delete()
+        ids = ProductInfo.objects.order_by('id').values_list('id', flat=True)
+        for chunk in chunked(ids.iterator(), self.batch_size):
+            self.update(chunk)
+
+    def search(self, query, limit=20):
+        """
+        Возвращает id товаров, отсортированные по релевантности
+        """
+        raise NotImplementedError
+
+    def filter(self, queryset, query):
+        """
+        Ограничивает queryset товарами, подходящими под запрос
+        """
+        raise NotImplementedError
+
+    async def afilter(self, queryset, query):
+        """
+        filter() для асинхронных представлений; индексы, которым для этого не
+        нужна база, переопределяют его без перехода в поток
+        """
+        return await sync_to_async(self.filter)(queryset, query)
+
+    @staticmethod
+    def build_documents(product_info_ids):
+        rows = ProductInfo.objects.filter(id__in=product_info_ids) \
+            .values_list('id', 'name', 'model', 'product__category__name')
+        parameters = defaultdict(list)
+        for product_info_id, value in ProductParameter.objects.filter(product_info_id__in=product_info_ids) \
+                .values_list('product_info_id', 'value'):
+            parameters[product_info_id].append(value)
+
+        return {
+            product_info_id: ' '.join(tokenize(' '.join(
+                part for part in [name, model, category, *parameters[product_info_id]] if part
+            )))
+            for product_info_id, name, model, category in rows
+        }
+
+
+class Fts5ProductSearchIndex(ProductSearchIndex):
+    """
+    Индекс на виртуальной таблице SQLite FTS5, ранжирование по bm25
+    """
+
+    def update(self, product_info_ids):
+        documents = super().update(product_info_ids)
+        with connection.cursor() as cursor:
+            for ids in chunked(list(product_info_ids), self.batch_size):
+                cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({", ".join(["%s"] * len(ids))})', ids)
+            cursor.executemany(f'INSERT INTO {FTS_TABLE} (rowid, document) VALUES (%s, %s)', list(documents.items()))
+        return documents
+
+    def remove(self, queryset):
+        sql, params = queryset.values('id').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({sql})', params)
+        super().remove(queryset)
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        super().rebuild()
+
+    @staticmethod
+    def match_expression(query):
+        # Каждый токен ищется как префикс, токены объединяются через AND
+        return ' '.join('"{}"*'.format(token.replace('"', '""')) for token in tokenize(query))
+
+    def search(self, query, limit=20):
+        match = self.match_expression(query)
+        if not match:
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s ORDER BY rank, rowid LIMIT %s',
+                [match, limit]
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def filter(self, queryset, query):
+        match = self.match_expression(query)
+        if not match:
+            return queryset
+        return queryset.filter(id__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match]))
+
+    async def afilter(self, queryset, query):
+        # Условие MATCH попадает в запрос страницы, отдельного чтения базы нет
+        return self.filter(queryset, query)
+
+
+class InvertedIndex:
+    """
+    Инвертированный индекс в памяти: токен -> {id документа: частота}
+    """
+
+    def __init__(self):
+        self.postings = defaultdict(dict)
+        self.documents = {}
+        self._tokens = None
+
+    def add(self, doc_id, tokens):
+        self.remove(doc_id)
+        self.documents[doc_id] = tokens
+        for token in tokens:
+            self.postings[token][doc_id] = self.postings[token].get(doc_id, 0) + 1
+        self._tokens = None
+
+    def remove(self, doc_id):
+        for token in self.documents.pop(doc_id, ()):
+            postings = self.postings.get(token)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self.postings[token]
+        self._tokens = None
+
+    def expand(self, prefix):
+        if self._tokens is None:
+            self._tokens = sorted(self.postings)
+        position = bisect_left(self._tokens, prefix)
+        while position < len(self._tokens) and self._tokens[position].startswith(prefix):
+            yield self._tokens[position]
+            position += 1
+
+    def search(self, tokens, limit=None):
+        scores = None
+        for query_token in tokens:
+            # Для префиксного запроса баллы всех подходящих токенов суммируются
+            token_scores = defaultdict(float)
+            for token in self.expand(query_token):
+                postings = self.postings[token]
+                idf = math.log(1 + len(self.documents) / len(postings))
+                for doc_id, frequency in postings.items():
+                    token_scores[doc_id] += frequency * idf
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {doc_id: score + token_scores[doc_id] for doc_id, score in scores.items()
+                          if doc_id in token_scores}
+            if not scores:
+                return []
+
+        ranked = sorted((scores or {}).items(), key=lambda item: (-item[1], item[0]))
+        return [doc_id for doc_id, _ in ranked[:limit]]
+
+
+class PythonProductSearchIndex(ProductSearchIndex):
+    """
+    Запасной индекс для баз без FTS5: инвертированный индекс в памяти процесса,
+    построенный по ProductSearchDocument. После каждого изменения документов
+    в кеше каталога записывается новая версия индекса; процесс, у которого
+    она другая, перестраивает индекс. Поиск читает только версию из кеша, а
+    изменения из других процессов видны при общем для них кеше каталога
+    (CATALOG_CACHE_DIR), как и у закешированных ответов каталога.
+    """
+
+    def __init__(self):
+        self.index = InvertedIndex()
+        self._stamp = None
+
+    def update(self, product_info_ids):
+        documents = super().update(product_info_ids)
+        for product_info_id in product_info_ids:
+            self.index.remove(product_info_id)
+        for product_info_id, document in documents.items():
+            self.index.add(product_info_id, document.split())
+        self._mark_dirty()
+        return documents
+
+    def remove(self, queryset):
+        for product_info_id in queryset.values_list('id', flat=True):
+            self.index.remove(product_info_id)
+        super().remove(queryset)
+        self._mark_dirty()
+
+    def rebuild(self):
+        self.index = InvertedIndex()
+        super().rebuild()
+        self._mark_dirty()
+
+    def search(self, query, limit=20):
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        self._refresh()
+        return self.index.search(tokens, limit)
+
+    def filter(self, queryset, query):
+        tokens = tokenize(query)
+        if not tokens:
+            return queryset
+        self._refresh()
+        return queryset.filter(id__in=self.index.search(tokens))
+
+    def _mark_dirty(self):
+        # До фиксации транзакции индекс в памяти может разойтись с базой (при
+        # откате), поэтому отметка сбрасывается и выставляется только на commit
+        self._stamp = None
+        transaction.on_commit(self._store_stamp)
+
+    def _store_stamp(self):
+        stamp = uuid.uuid4().hex
+        caches[settings.CATALOG_CACHE_ALIAS].set(SEARCH_VERSION_KEY, stamp, None)
+        self._stamp = stamp
+
+    @staticmethod
+    def _current_stamp():
+        # Версия — случайная строка, а не счётчик: после вытеснения записи
+        # новая версия не совпадёт ни с одной из прежних
+        cache = caches[settings.CATALOG_CACHE_ALIAS]
+        stamp = cache.get(SEARCH_VERSION_KEY)
+        if stamp is None:
+            stamp = uuid.uuid4().hex
+            cache.add(SEARCH_VERSION_KEY, stamp, None)
+            stamp = cache.get(SEARCH_VERSION_KEY, stamp)
+        return stamp
+
+    def _refresh(self):
+        stamp = self._current_stamp()
+        if stamp == self._stamp:
+            return
+        self.index = InvertedIndex()
+        for product_info_id, document in ProductSearchDocument.objects.values_list('product_info_id', 'document') \
+                .iterator():
+            self.index.add(product_info_id, document.split())
+        self._stamp = stamp
+
+
+_search_index = None
+
+
+def fts5_available():
+    return connection.vendor == 'sqlite' and FTS_TABLE in connection.introspection.table_names()
+
+
+def get_search_index():
+    global _search_index
+    if _search_index is None:
+        _search_index = Fts5ProductSearchIndex() if fts5_available() else PythonProductSearchIndex()
+    return _search_index
+
+
+async def aget_search_index():
+    if _search_index is None:
+        # Выбор индекса читает схему базы, это происходит один раз за процесс
+        await sync_to_async(get_search_index)()
+    return _search_index
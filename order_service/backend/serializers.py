@@ -1,20 +1,198 @@
+from collections import defaultdict
+
 from rest_framework import serializers
-from .models import ProductInfo, OrderItem, Contact
+from rest_framework.relations import RelatedField
+from rest_framework.settings import api_settings
+from .models import ProductInfo, ProductParameter, OrderItem, Contact, ImportJob, Order
+
+
+class DynamicFieldsMixin:
+    """
+    Позволяет ограничить набор полей сериализатора аргументом fields
+    """
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
 
 
 class ProductInfoSerializer(serializers.ModelSerializer):
+    # Покупателю доступен остаток без резервов чужих корзин
+    quantity = serializers.IntegerField(source='available', read_only=True)
+
     class Meta:
         model = ProductInfo
         fields = ['id', 'name', 'price', 'quantity', 'shop', 'product']
 
 
+class ProductCatalogSerializer(DynamicFieldsMixin, ProductInfoSerializer):
+    shop_name = serializers.CharField(source='shop.name', read_only=True)
+    category = serializers.IntegerField(source='product.category_id', read_only=True)
+    category_name = serializers.CharField(source='product.category.name', read_only=True)
+    parameters = serializers.SerializerMethodField()
+
+    class Meta(ProductInfoSerializer.Meta):
+        fields = ProductInfoSerializer.Meta.fields + ['model', 'price_rrc', 'shop_name', 'category', 'category_name',
+                                                     'parameters']
+
+    def get_parameters(self, obj):
+        return {parameter.parameter.name: parameter.value for parameter in obj.parameters.all()}
+
+
 class OrderItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = OrderItem
-        fields = ['id', 'product', 'shop', 'quantity', 'order']
+        fields = ['id', 'product', 'shop', 'quantity', 'order', 'price', 'product_name', 'reserved_until']
 
 
 class ContactSerializer(serializers.ModelSerializer):
     class Meta:
         model = Contact
         fields = ['id', 'type', 'value']
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    duration = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = ImportJob
+        fields = ['id', 'status', 'shop', 'rows_processed', 'errors', 'summary', 'created_at', 'started_at',
+                  'finished_at', 'duration']
+
+
+class OrderHistorySerializer(serializers.ModelSerializer):
+    date = serializers.DateTimeField(source='dt', read_only=True)
+    total_price = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = Order
+        fields = ['id', 'date', 'status', 'total_price']
+
+
+class FastReadSerializer:
+    """
+    Быстрый путь чтения для списков: строки values_list() превращаются в
+    словари функцией, сгенерированной один раз на набор полей, без создания
+    моделей и обхода полей DRF на каждую строку.
+
+    Поля, их источники и преобразования берутся из serializer_class, поэтому
+    вывод совпадает с обычным сериализатором. Значения полей, для которых
+    to_representation не меняет значение из базы, копируются как есть.
+    SerializerMethodField заполняются в add_method_fields (и в
+    aadd_method_fields для асинхронных представлений, если нужна база).
+    """
+    serializer_class = None
+    # Поля, которые DRF отдаёт без изменений (первичные ключи связей — уже id)
+    identity_fields = (serializers.CharField, serializers.IntegerField, serializers.BooleanField,
+                       serializers.ChoiceField, RelatedField)
+    _compiled = {}
+
+    def __init__(self, fields=None):
+        names = list(self.serializer_class.Meta.fields)
+        self.fields = [name for name in names if fields is None or name in fields]
+
+    def compile(self):
+        key = type(self), tuple(self.fields)
+        if key not in self._compiled:
+            declared = self.serializer_class().fields
+            # id всегда выбирается первым: по нему работают курсорная пагинация и method-поля
+            lookups = ['id']
+            items = []
+            namespace = {}
+            for name in self.fields:
+                field = declared[name]
+                if isinstance(field, serializers.SerializerMethodField):
+                    items.append(f'{name!r}: None')
+                    continue
+                lookup = field.source.replace('.', '__')
+                if lookup not in lookups:
+                    lookups.append(lookup)
+                value = f'row[{lookups.index(lookup)}]'
+                converter = self.converter(field)
+                if converter is not None:
+                    namespace[f'convert_{name}'] = converter
+                    value = f'(None if {value} is None else convert_{name}({value}))'
+                items.append(f'{name!r}: {value}')
+            exec(f'def to_dict(row):\n    return {{{", ".join(items)}}}', namespace)
+            self._compiled[key] = lookups, namespace['to_dict']
+        return self._compiled[key]
+
+    def converter(self, field):
+        if isinstance(field, self.identity_fields):
+            return None
+        if isinstance(field, serializers.DecimalField) and not field.localize \
+                and getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING):
+            # ORM уже возвращает Decimal с decimal_places поля модели, и
+            # quantize() в DecimalField.to_representation ничего не меняет
+            return str
+        return field.to_representation
+
+    def rows(self, queryset):
+        """
+        Выборка строк для to_representation; строки с именами, чтобы курсорная
+        пагинация могла взять из них id
+        """
+        lookups, _ = self.compile()
+        return queryset.values_list(*lookups, named=True)
+
+    def to_representation(self, rows):
+        _, to_dict = self.compile()
+        data = [to_dict(row) for row in rows]
+        if data:
+            self.add_method_fields([row[0] for row in rows], data)
+        return data
+
+    def serialize(self, queryset):
+        return self.to_representation(list(self.rows(queryset)))
+
+    async def ato_representation(self, rows):
+        _, to_dict = self.compile()
+        data = [to_dict(row) for row in rows]
+        if data:
+            await self.aadd_method_fields([row[0] for row in rows], data)
+        return data
+
+    async def aserialize(self, queryset):
+        return await self.ato_representation([row async for row in self.rows(queryset)])
+
+    def add_method_fields(self, ids, data):
+        pass
+
+    async def aadd_method_fields(self, ids, data):
+        self.add_method_fields(ids, data)
+
+
+class FastProductCatalogSerializer(FastReadSerializer):
+    serializer_class = ProductCatalogSerializer
+
+    @staticmethod
+    def parameter_rows(ids):
+        return ProductParameter.objects.filter(product_info_id__in=ids) \
+            .order_by('id').values_list('product_info_id', 'parameter__name', 'value')
+
+    @staticmethod
+    def fill_parameters(ids, data, rows):
+        parameters = defaultdict(dict)
+        for product_info_id, name, value in rows:
+            parameters[product_info_id][name] = value
+        for product_info_id, item in zip(ids, data):
+            item['parameters'] = parameters[product_info_id]
+
+    def add_method_fields(self, ids, data):
+        if 'parameters' in self.fields:
+            self.fill_parameters(ids, data, self.parameter_rows(ids))
+
+    async def aadd_method_fields(self, ids, data):
+        if 'parameters' in self.fields:
+            self.fill_parameters(ids, data, [row async for row in self.parameter_rows(ids)])
+
+
+class FastOrderItemSerializer(FastReadSerializer):
+    serializer_class = OrderItemSerializer
+
+
+class FastContactSerializer(FastReadSerializer):
+    serializer_class = ContactSerializer
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import invalidate_tokens
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    invalidate_tokens([instance.key])
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def user_saved(sender, instance, created, **kwargs):
+    if created:
+        return
+    tokens = Token.objects.filter(user=instance)
+    # set_password() хранит новый пароль в _password до конца save():
+    # при смене пароля токен отзывается, иначе обновляется закешированный пользователь
+    if getattr(instance, '_password', None) is not None:
+        tokens.delete()
+    else:
+        invalidate_tokens(tokens.values_list('key', flat=True))
@@ -0,0 +1,151 @@
+from time import perf_counter
+
+import yaml
+from yaml.events import (
+    AliasEvent, ScalarEvent, SequenceStartEvent, SequenceEndEvent, MappingStartEvent, MappingEndEvent,
+    StreamStartEvent, StreamEndEvent, DocumentStartEvent, DocumentEndEvent,
+)
+from yaml.nodes import ScalarNode, SequenceNode, MappingNode
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:  # PyYAML собран без libyaml
+    from yaml import SafeLoader
+
+
+class PriceListStream:
+    """
+    Потоковое чтение прайс-листа в формате data/shop1.yaml.
+
+    Документ разбирается по событиям парсера: всё, что стоит до ключа goods
+    (shop, categories), читается сразу в header, а товары отдаются генератором
+    goods() по одному, так что в памяти одновременно находится один товар.
+    Файл может содержать несколько документов, разделённых "---" (например,
+    экспорт каталога всех магазинов): next_document() переходит к следующему.
+    """
+
+    def __init__(self, stream, loader_class=SafeLoader):
+        self.loader = loader_class(stream)
+        self.header = {}
+        self._anchors = {}
+        self._goods_pending = False
+        self._finished = False
+        self._expect(StreamStartEvent)
+        self._read_header()
+
+    def goods(self):
+        if not self._goods_pending:
+            return
+        self._goods_pending = False
+
+        while not self.loader.check_event(SequenceEndEvent):
+            yield self._construct(self._compose(self.loader.get_event()))
+        self.loader.get_event()
+
+        # Ключи после goods дочитываются в header
+        self._read_mapping()
+
+    def next_document(self):
+        """
+        Переходит к следующему документу потока: непрочитанные товары текущего
+        пропускаются, header и goods() относятся к новому прайс-листу.
+        Возвращает False, если документов больше нет
+        """
+        for _ in self.goods():
+            pass
+        if self._finished:
+            return False
+        self.header = {}
+        self._anchors = {}
+        self._read_header()
+        return True
+
+    def documents(self):
+        """Прайс-листы потока по одному: header и goods() текущего документа"""
+        yield self
+        while self.next_document():
+            yield self
+
+    def _read_header(self):
+        self._expect(DocumentStartEvent)
+        if not self.loader.check_event(MappingStartEvent):
+            raise yaml.YAMLError('Price list must be a mapping')
+        self.loader.get_event()
+        self._read_mapping()
+
+    def _read_mapping(self):
+        while not self.loader.check_event(MappingEndEvent):
+            key = self._construct(self._compose(self.loader.get_event()))
+            if key == 'goods' and self.loader.check_event(SequenceStartEvent):
+                self.loader.get_event()
+                self._goods_pending = True
+                return
+            self.header[key] = self._construct(self._compose(self.loader.get_event()))
+
+        self.loader.get_event()
+        self._expect(DocumentEndEvent)
+        if self.loader.check_event(StreamEndEvent):
+            self.loader.get_event()
+            self.loader.dispose()
+            self._finished = True
+
+    def _expect(self, event_class):
+        event = self.loader.get_event()
+        if not isinstance(event, event_class):
+            raise yaml.YAMLError(f'Expected {event_class.__name__}, got {type(event).__name__}')
+
+    def _compose(self, event):
+        # Упрощённый аналог yaml.composer.Composer, работающий поверх событий
+        # как Python-, так и C-парсера (у CParser нет compose_node)
+        if isinstance(event, AliasEvent):
+            if event.anchor not in self._anchors:
+                raise yaml.YAMLError(f'Found undefined alias {event.anchor!r}')
+            return self._anchors[event.anchor]
+
+        if isinstance(event, ScalarEvent):
+            tag = event.tag
+            if tag is None or tag == '!':
+                tag = self.loader.resolve(ScalarNode, event.value, event.implicit)
+            node = ScalarNode(tag, event.value, event.start_mark, event.end_mark, style=event.style)
+        elif isinstance(event, SequenceStartEvent):
+            tag = event.tag
+            if tag is None or tag == '!':
+                tag = self.loader.resolve(SequenceNode, None, event.implicit)
+            node = SequenceNode(tag, [], event.start_mark, None, flow_style=event.flow_style)
+            while not self.loader.check_event(SequenceEndEvent):
+                node.value.append(self._compose(self.loader.get_event()))
+            node.end_mark = self.loader.get_event().end_mark
+        elif isinstance(event, MappingStartEvent):
+            tag = event.tag
+            if tag is None or tag == '!':
+                tag = self.loader.resolve(MappingNode, None, event.implicit)
+            node = MappingNode(tag, [], event.start_mark, None, flow_style=event.flow_style)
+            while not self.loader.check_event(MappingEndEvent):
+                key = self._compose(self.loader.get_event())
+                node.value.append((key, self._compose(self.loader.get_event())))
+            node.end_mark = self.loader.get_event().end_mark
+        else:
+            raise yaml.YAMLError(f'Unexpected {type(event).__name__}')
+
+        if event.anchor is not None:
+            self._anchors[event.anchor] = node
+        return node
+
+    def _construct(self, node):
+        return self.loader.construct_document(node)
+
+
+def load_price_lists(path):
+    """
+    Читает прайс-листы из файла потоковым парсером и возвращает список
+    словарей того же вида, что и yaml.safe_load, по одному на документ, вместе
+    со временем разбора. Не зависит от Django, поэтому пригодна для запуска в
+    дочерних процессах пула.
+    """
+    started = perf_counter()
+    price_lists = []
+    with open(path, 'rb') as f:
+        for price_list in PriceListStream(f).documents():
+            goods = list(price_list.goods())
+            price_lists.append({**price_list.header, 'goods': goods})
+    return price_lists, perf_counter() - started
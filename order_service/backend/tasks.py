@@ -0,0 +1,58 @@
+from celery import shared_task
+from django.utils import timezone
+
+from .importer import PriceListImporter
+from .models import ImportJob
+from .notifications import send_pending_notifications
+from .reservations import release_expired
+
+
+@shared_task(bind=True)
+def import_price_list(self, job_id):
+    """
+    Фоновый импорт прайс-листа, загруженного через ImportProductsAPIView
+    """
+    job = ImportJob.objects.get(id=job_id)
+    job.status = 'running'
+    job.started_at = timezone.now()
+    job.save(update_fields=['status', 'started_at'])
+
+    # Импорт идёт в одной транзакции, поэтому промежуточный прогресс
+    # публикуется через result backend Celery, а не в строку задачи
+    def progress(result):
+        self.update_state(state='PROGRESS', meta={'rows_processed': result.rows})
+
+    try:
+        with job.file.open('rb') as f:
+            result = PriceListImporter(progress=progress).import_stream(f)
+    except Exception as e:
+        job.status = 'failed'
+        job.errors = [*job.errors, str(e)]
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'errors', 'finished_at'])
+        return {'status': job.status, 'errors': job.errors}
+
+    job.status = 'done'
+    job.shop_id = result.shop_id
+    job.rows_processed = result.rows
+    job.summary = result.as_dict()
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'shop', 'rows_processed', 'summary', 'finished_at'])
+    return {'status': job.status, **result.as_dict()}
+
+
+@shared_task
+def release_expired_reservations():
+    """
+    Снимает просроченные резервы корзин, запускается по расписанию CELERY_BEAT_SCHEDULE
+    """
+    return release_expired()
+
+
+@shared_task
+def send_order_notifications():
+    """
+    Рассылает письма из outbox OrderNotification. Запускается после
+    подтверждения заказа и по расписанию CELERY_BEAT_SCHEDULE для повторов
+    """
+    return send_pending_notifications()
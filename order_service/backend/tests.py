@@ -1,6 +1,94 @@
-from django.test import TestCase
-from django.contrib.auth.models import User
-from .models import Shop, Category, Product, ProductInfo, Parameter, ProductParameter, Order, OrderItem, Contact
+import csv
+import gzip
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import BytesIO, StringIO
+from pathlib import Path
+from smtplib import SMTPException
+from types import SimpleNamespace
+from unittest import mock
+
+import yaml
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from celery.contrib.testing.worker import start_worker
+from celery.result import AsyncResult
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core import mail
+from django.core.mail import get_connection
+from django.core.mail.backends import locmem
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, transaction, IntegrityError
+from django.db.models import Sum
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from django.contrib.auth import get_user_model
+from .models import Shop, Category, Product, ProductInfo, Parameter, ProductParameter, Order, OrderItem, Contact, \
+    ImportJob, ProductSearchDocument, OrderNotification
+from .importer import PriceListImporter
+from .serializers import ProductCatalogSerializer, OrderItemSerializer, ContactSerializer, \
+    FastProductCatalogSerializer, FastOrderItemSerializer, FastContactSerializer
+from .streaming import PriceListStream, SafeLoader
+from .facets import stored_facet_counts, live_facet_counts
+from .authentication import token_cache, last_seen
+from .throttling import TokenBucketLimiter, reset_limiters
+from .renderers import orjson, DefaultJSONRenderer, ORJSONRenderer, UJSONRenderer
+from .parsers import ORJSONParser, UJSONParser
+from .caching import catalog_cache, get_shop_ids, get_shop_versions, LRUFileBasedCache
+from .notifications import send_pending_notifications
+from .pagination import EstimatedCountPaginator
+from .reservations import OutOfStock, confirm_cart, release_expired, reserve
+from .tasks import release_expired_reservations
+from .views import CatalogExportAPIView
+from .async_views import AsyncProductListAPIView, AsyncCartAPIView, AsyncOrderHistoryAPIView
+from .profiling import ProfileStore, ProfilingMiddleware, RequestProfile, fingerprint, profile_store
+from orders.celery import app as celery_app
+from benchmarks import generator
+from benchmarks.suite import measure
+from .search import tokenize, fts5_available, get_search_index, Fts5ProductSearchIndex, PythonProductSearchIndex
+
+
+User = get_user_model()
+
+# Кеш токенов тестов в памяти процесса, даже если AUTH_CACHE_DIR задан в окружении
+LOCMEM_AUTH_CACHES = {**settings.CACHES, 'auth': {
+    'BACKEND': 'backend.caching.LRULocMemCache', 'LOCATION': 'test-auth', 'OPTIONS': {'MAX_ENTRIES': 10000},
+}}
+
+
+def reset_result_backend():
+    # app.backend создаётся один раз (для file:// — свой в каждом потоке)
+    celery_app._backend_cache = None
+    celery_app._local.__dict__.pop('backend', None)
+
+
+class TemporaryResultBackendMixin:
+    """Результаты задач Celery пишутся во временный каталог, а не в celery-results/ проекта"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.result_directory = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.result_directory, ignore_errors=True)
+        cls.enterClassContext(override_settings(CELERY_RESULT_BACKEND=f'file://{cls.result_directory}'))
+        reset_result_backend()
+        cls.addClassCleanup(reset_result_backend)
+        super().setUpClass()
 
 
 class ModelsTestCase(TestCase):
@@ -93,4 +181,1762 @@ class ModelsTestCase(TestCase):
         """Тест создания контакта пользователя"""
         self.assertEqual(self.contact.user, self.user)
         self.assertEqual(self.contact.type, "email")
-        self.assertEqual(self.contact.value, "testuser@example.com")
\ No newline at end of file
+        self.assertEqual(self.contact.value, "testuser@example.com")
+
+    def test_single_new_order_per_user(self):
+        """Тест: у пользователя может быть только одна корзина"""
+        Order.objects.create(user=self.user, status="completed")
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Order.objects.create(user=self.user, status="new")
+
+    def test_unique_order_item(self):
+        """Тест: одна позиция заказа на товар магазина"""
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            OrderItem.objects.create(order=self.order, product=self.product, shop=self.shop, quantity=1)
+
+def make_price_list(goods_count, shop_name="Generated Shop"):
+    """Генерирует прайс-лист в формате data/shop1.yaml"""
+    return {
+        'shop': shop_name,
+        'categories': [{'id': 224, 'name': 'Смартфоны'}, {'id': 15, 'name': 'Аксессуары'}],
+        'goods': [
+            {
+                'id': 1000 + i,
+                'category': 224 if i % 2 else 15,
+                'model': f'model/{i}',
+                'name': f'Товар {i}',
+                'price': 100 + i,
+                'price_rrc': 120 + i,
+                'quantity': i % 7,
+                'parameters': {'Цвет': 'черный', 'Встроенная память (Гб)': 64 * (i % 4 + 1)},
+            }
+            for i in range(goods_count)
+        ],
+    }
+
+
+class PriceListImporterTestCase(TestCase):
+
+    def test_import_shop1(self):
+        """Тест импорта data/shop1.yaml"""
+        with open(Path(settings.BASE_DIR) / 'data' / 'shop1.yaml', encoding='utf-8') as f:
+            data = yaml.safe_load(f)
+
+        result = PriceListImporter().import_data(data)
+
+        shop = Shop.objects.get(name=data['shop'])
+        self.assertEqual(result.rows, len(data['goods']))
+        self.assertEqual(ProductInfo.objects.filter(shop=shop).count(), len(data['goods']))
+        self.assertEqual(
+            ProductParameter.objects.filter(product_info__shop=shop).count(),
+            sum(len(item['parameters']) for item in data['goods'])
+        )
+        self.assertEqual(set(shop.categories.values_list('id', flat=True)),
+                         {category['id'] for category in data['categories']})
+
+        item = data['goods'][0]
+        product_info = ProductInfo.objects.get(shop=shop, external_id=item['id'])
+        self.assertEqual(product_info.name, item['name'])
+        self.assertEqual(product_info.product.category_id, item['category'])
+        self.assertEqual(product_info.parameters.get(parameter__name='Цвет').value, item['parameters']['Цвет'])
+
+    def test_reimport_replaces_rows(self):
+        """Тест повторного импорта: товары магазина заменяются, продукты и параметры переиспользуются"""
+        PriceListImporter().import_data(make_price_list(10))
+        result = PriceListImporter(mode=PriceListImporter.REPLACE).import_data(make_price_list(4))
+
+        self.assertEqual(result.products_created, 0)
+        self.assertEqual(ProductInfo.objects.count(), 4)
+        self.assertEqual(ProductParameter.objects.count(), 8)
+        self.assertEqual(Product.objects.count(), 10)
+        self.assertEqual(Parameter.objects.count(), 2)
+
+    def test_upsert_touches_only_changed_rows(self):
+        """Тест upsert-режима: вставка, обновление, удаление и неизменённые строки"""
+        PriceListImporter().import_data(make_price_list(5))
+        ids = dict(ProductInfo.objects.values_list('external_id', 'id'))
+
+        data = make_price_list(5)
+        data['goods'][0]['price'] = 999
+        data['goods'][1]['parameters']['Цвет'] = 'белый'
+        del data['goods'][2]
+        data['goods'].append(make_price_list(6)['goods'][5])
+        result = PriceListImporter().import_data(data)
+
+        self.assertEqual((result.inserted, result.updated, result.unchanged, result.removed), (1, 2, 2, 1))
+        self.assertEqual(ProductInfo.objects.get(external_id=1000).price, 999)
+        self.assertEqual(ProductParameter.objects.get(product_info__external_id=1001, parameter__name='Цвет').value,
+                         'белый')
+        self.assertFalse(ProductInfo.objects.filter(external_id=1002).exists())
+        # Первичные ключи сохранившихся товаров не меняются
+        for external_id in (1000, 1001, 1003, 1004):
+            self.assertEqual(ProductInfo.objects.get(external_id=external_id).id, ids[external_id])
+
+    def test_upsert_unchanged_list_does_not_write(self):
+        """Тест: повторная загрузка того же прайс-листа не пишет в базу"""
+        PriceListImporter().import_data(make_price_list(20))
+        with CaptureQueriesContext(connection) as queries:
+            result = PriceListImporter().import_data(make_price_list(20))
+
+        self.assertEqual(result.unchanged, 20)
+        writes = [query['sql'] for query in queries if query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))]
+        self.assertFalse([sql for sql in writes if 'backend_productinfo' in sql or 'backend_productparameter' in sql])
+
+    def test_query_count_does_not_grow_with_goods(self):
+        """Тест: количество запросов не зависит от числа товаров в пачке"""
+        # Категории и параметры создаются при первом импорте, дальше сравниваем одинаковые сценарии
+        PriceListImporter().import_data(make_price_list(1, shop_name='Warmup'))
+        with CaptureQueriesContext(connection) as small:
+            PriceListImporter().import_data(make_price_list(3, shop_name='Small'))
+        with CaptureQueriesContext(connection) as large:
+            PriceListImporter().import_data(make_price_list(60, shop_name='Large'))
+
+        self.assertEqual(len(small), len(large))
+
+
+class PriceListStreamTestCase(TestCase):
+
+    def test_stream_matches_safe_load(self):
+        """Тест: потоковый разбор даёт те же данные, что и yaml.safe_load"""
+        path = Path(settings.BASE_DIR) / 'data' / 'shop1.yaml'
+        data = yaml.safe_load(path.read_bytes())
+        for loader_class in {yaml.SafeLoader, SafeLoader}:
+            with open(path, 'rb') as f:
+                price_list = PriceListStream(f, loader_class)
+                self.assertEqual(price_list.header, {'shop': data['shop'], 'categories': data['categories']})
+                self.assertEqual(list(price_list.goods()), data['goods'])
+
+    def test_stream_aliases_and_trailing_keys(self):
+        """Тест: якоря внутри goods и ключи после goods"""
+        content = (
+            "shop: S\n"
+            "goods:\n"
+            "  - &first {id: 1, parameters: {Цвет: черный}}\n"
+            "  - *first\n"
+            "url: http://example.com\n"
+        )
+        price_list = PriceListStream(content)
+        goods = list(price_list.goods())
+        self.assertEqual(goods, [{'id': 1, 'parameters': {'Цвет': 'черный'}}] * 2)
+        self.assertEqual(price_list.header, {'shop': 'S', 'url': 'http://example.com'})
+
+    def test_stream_documents(self):
+        """Тест: документы потока читаются по очереди, непрочитанные товары пропускаются"""
+        content = "---\nshop: A\ngoods:\n  - {id: 1}\n---\nshop: B\ngoods: []\n---\nshop: C\ngoods:\n  - {id: 3}\n"
+        price_list = PriceListStream(content)
+        self.assertEqual(price_list.header, {'shop': 'A'})
+        self.assertTrue(price_list.next_document())
+        self.assertEqual((price_list.header, list(price_list.goods())), ({'shop': 'B'}, []))
+        self.assertEqual([(document.header['shop'], list(document.goods())) for document in price_list.documents()],
+                         [('B', []), ('C', [{'id': 3}])])
+        self.assertFalse(price_list.next_document())
+
+    def test_import_stream(self):
+        """Тест потокового импорта пачками"""
+        content = yaml.safe_dump(make_price_list(25), allow_unicode=True, sort_keys=False)
+        result = PriceListImporter(batch_size=10).import_stream(content)
+        self.assertEqual(result.rows, 25)
+        self.assertEqual(ProductInfo.objects.count(), 25)
+        self.assertEqual(ProductParameter.objects.count(), 50)
+
+    def test_import_stream_requires_shop_first(self):
+        """Тест: ключ shop должен стоять до goods"""
+        with self.assertRaises(ValueError):
+            PriceListImporter().import_stream("goods: []\nshop: S\n")
+
+
+class ImportPricelistsCommandTestCase(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        for i in range(3):
+            with open(Path(self.directory) / f'shop{i}.yaml', 'w', encoding='utf-8') as f:
+                yaml.safe_dump(make_price_list(5 + i, shop_name=f'Shop {i}'), f, allow_unicode=True, sort_keys=False)
+
+    def test_import_directory(self):
+        """Тест импорта каталога прайс-листов пулом процессов"""
+        out = StringIO()
+        call_command('import_pricelists', self.directory, workers=2, stdout=out)
+
+        self.assertEqual(ProductInfo.objects.count(), 5 + 6 + 7)
+        self.assertEqual(Shop.objects.count(), 3)
+        self.assertIn('Total: 3/3 files, 18 rows', out.getvalue())
+
+    def test_bounded_pending_files(self):
+        """Тест: в работе не больше двух файлов на процесс, ошибка файла не прерывает импорт"""
+        (Path(self.directory) / 'broken.yaml').write_text('shop: [', encoding='utf-8')
+        from backend.management.commands import import_pricelists
+        pending_sizes = []
+
+        def wait(futures, **kwargs):
+            pending_sizes.append(len(futures))
+            return wait_futures(futures, **kwargs)
+
+        out, err = StringIO(), StringIO()
+        with mock.patch.object(import_pricelists, 'wait', wait):
+            call_command('import_pricelists', self.directory, workers=1, stdout=out, stderr=err)
+        self.assertLessEqual(max(pending_sizes), 2)
+        self.assertIn('broken.yaml', err.getvalue())
+        self.assertIn('Total: 3/4 files, 18 rows', out.getvalue())
+
+    def test_lookups_shared_between_files(self):
+        """Тест: параметры загружаются из базы один раз на все файлы"""
+        importer = PriceListImporter()
+        with CaptureQueriesContext(connection) as queries:
+            for i in range(3):
+                importer.import_data(make_price_list(3, shop_name=f'Shop {i}'))
+        parameter_selects = [query for query in queries
+                             if query['sql'].startswith('SELECT') and 'FROM "backend_parameter"' in query['sql']]
+        self.assertEqual(len(parameter_selects), 1)
+
+
+class ImportJobTestCase(TemporaryResultBackendMixin, TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        # Задачи Celery выполняются синхронно в процессе теста
+        cls.settings_override = override_settings(MEDIA_ROOT=cls.media_root, CELERY_TASK_ALWAYS_EAGER=True)
+        cls.settings_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="shop@example.com", password="testpassword", type="shop")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload(self, content):
+        return self.client.post('/api/import-products/', {
+            'file': SimpleUploadedFile('price.yaml', content, content_type='application/x-yaml')
+        })
+
+    def test_import_job_done(self):
+        """Тест фонового импорта: задача создаётся, статус доступен по id"""
+        content = (Path(settings.BASE_DIR) / 'data' / 'shop1.yaml').read_bytes()
+        response = self.upload(content)
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json()['job_id']
+
+        response = self.client.get(f'/api/import-jobs/{job_id}/')
+        self.assertEqual(response.status_code, 200)
+        goods = yaml.safe_load(content)['goods']
+        self.assertEqual(response.data['status'], 'done')
+        self.assertEqual(response.data['rows_processed'], len(goods))
+        self.assertEqual(response.data['errors'], [])
+        self.assertIsNotNone(response.data['duration'])
+        self.assertEqual(ProductInfo.objects.count(), len(goods))
+
+    def test_import_job_failed(self):
+        """Тест фонового импорта с ошибкой разбора YAML"""
+        response = self.upload(b'shop: [unclosed')
+        job = ImportJob.objects.get(id=response.json()['job_id'])
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(len(job.errors), 1)
+
+    def test_import_job_of_other_user(self):
+        """Тест: чужая задача импорта недоступна"""
+        other = User.objects.create_user(username="other@example.com", password="testpassword", type="shop")
+        job = ImportJob.objects.create(user=other, file='imports/price.yaml')
+        response = self.client.get(f'/api/import-jobs/{job.id}/')
+        self.assertEqual(response.status_code, 404)
+
+
+class ImportJobProgressTestCase(TemporaryResultBackendMixin, TransactionTestCase):
+
+    def setUp(self):
+        # Пул продюсеров Celery запоминает брокер первой отправки задачи (в
+        # том числе eager); тест отправляет задачу в брокер в памяти
+        self.reset_producer_pool()
+        self.addCleanup(self.reset_producer_pool)
+
+    @staticmethod
+    def reset_producer_pool():
+        celery_app.__dict__.pop('amqp', None)
+
+    def test_progress_from_worker(self):
+        """Тест: прогресс импорта из воркера Celery виден веб-процессу до завершения задачи"""
+        reported, release = threading.Event(), threading.Event()
+
+        class SlowImporter(PriceListImporter):
+            def import_stream(self, stream):
+                self.progress(SimpleNamespace(rows=42))
+                reported.set()
+                release.wait(10)
+                return super().import_stream(stream)
+
+        user = User.objects.create_user(username="shop@example.com", password="testpassword", type="shop")
+        client = APIClient()
+        client.force_authenticate(user)
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        content = (Path(settings.BASE_DIR) / 'data' / 'shop1.yaml').read_bytes()
+
+        with override_settings(MEDIA_ROOT=media_root, CELERY_BROKER_URL='memory://'), \
+                mock.patch('backend.tasks.PriceListImporter', SlowImporter), \
+                start_worker(celery_app, perform_ping_check=False):
+            job_id = client.post('/api/import-products/', {
+                'file': SimpleUploadedFile('price.yaml', content, content_type='application/x-yaml')
+            }).json()['job_id']
+            self.assertTrue(reported.wait(10))
+            response = client.get(f'/api/import-jobs/{job_id}/')
+            self.assertEqual((response.data['status'], response.data['rows_processed']), ('running', 42))
+            # Состояние видно и из другого процесса
+            task_id = ImportJob.objects.get(id=job_id).task_id
+            state = subprocess.run(
+                [sys.executable, 'manage.py', 'shell', '-c',
+                 f'from celery.result import AsyncResult; print(AsyncResult({task_id!r}).state)'],
+                cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+                env={**os.environ, 'CELERY_RESULT_BACKEND': settings.CELERY_RESULT_BACKEND},
+            ).stdout.split()[-1]
+            self.assertEqual(state, 'PROGRESS')
+
+            release.set()
+            AsyncResult(task_id).get(timeout=10)
+        self.assertEqual(client.get(f'/api/import-jobs/{job_id}/').data['status'], 'done')
+
+
+class CatalogTestCase(TestCase):
+    """Базовый класс тестов каталога: кеш ответов не переживает откат транзакции теста"""
+
+    def setUp(self):
+        catalog_cache().clear()
+
+
+class ProductListTestCase(CatalogTestCase):
+
+    def setUp(self):
+        super().setUp()
+        PriceListImporter().import_data(make_price_list(60))
+        self.client = APIClient()
+
+    def count_queries(self, url):
+        # Считаем запросы без кеша ответов, но с уже закешированным списком магазинов
+        catalog_cache().clear()
+        get_shop_ids()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        """Тест: число запросов на страницу не зависит от её размера"""
+        self.assertEqual(self.count_queries('/api/products/?page_size=5'),
+                         self.count_queries('/api/products/?page_size=50'))
+        self.assertEqual(self.count_queries('/api/products/?page_size=50'), 2)
+
+    def test_cursor_pagination(self):
+        """Тест: курсорная пагинация обходит весь каталог по возрастанию id"""
+        ids = []
+        url = '/api/products/?page_size=25'
+        while url:
+            response = self.client.get(url)
+            ids += [item['id'] for item in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(ids, list(ProductInfo.objects.order_by('id').values_list('id', flat=True)))
+
+    def test_fields_projection(self):
+        """Тест выбора полей через ?fields"""
+        self.assertEqual(self.count_queries('/api/products/?fields=id,name,price'), 1)
+        response = self.client.get('/api/products/?fields=id,name,price')
+        self.assertEqual(set(response.data['results'][0]), {'id', 'name', 'price'})
+
+        item = self.client.get('/api/products/?fields=id,parameters,category_name&page_size=1').data['results'][0]
+        product_info = ProductInfo.objects.get(id=item['id'])
+        self.assertEqual(item['category_name'], product_info.product.category.name)
+        self.assertEqual(item['parameters'], {p.parameter.name: p.value for p in product_info.parameters.all()})
+
+
+class ProductSearchTestCase(CatalogTestCase):
+
+    def setUp(self):
+        super().setUp()
+        data = make_price_list(6)
+        data['goods'][0].update(name='Смартфон Apple iPhone XS Max 512GB (золотистый)', model='apple/iphone/xs-max')
+        data['goods'][1].update(name='Смартфон Apple iPhone XR 256GB (красный)', model='apple/iphone/xr')
+        data['goods'][2].update(name='Смартфон Samsung Galaxy S9 (Ёлочный)', model='samsung/galaxy-s9')
+        PriceListImporter().import_data(data)
+        self.client = APIClient()
+        self.ids = dict(ProductInfo.objects.values_list('external_id', 'id'))
+
+    def test_tokenize(self):
+        """Тест нормализации: регистр, ё, разделители"""
+        self.assertEqual(tokenize('Ёлка apple/iPhone_XS 6.5'), ['елка', 'apple', 'iphone', 'xs', '6', '5'])
+
+    def test_search_backends(self):
+        """Тест префиксного и многословного поиска в FTS5 и в индексе на Python"""
+        backends = [PythonProductSearchIndex()]
+        if fts5_available():
+            backends.append(Fts5ProductSearchIndex())
+        for search_index in backends:
+            with self.subTest(search_index=type(search_index).__name__):
+                self.assertEqual(set(search_index.search('смарт appl')), {self.ids[1000], self.ids[1001]})
+                self.assertEqual(search_index.search('iphone красн'), [self.ids[1001]])
+                self.assertEqual(search_index.search('елоч'), [self.ids[1002]])
+                # Категория и значения параметров тоже индексируются
+                self.assertEqual(len(search_index.search('аксессуары', limit=100)), 3)
+                self.assertEqual(search_index.search('белый'), [])
+
+    def test_python_index_version(self):
+        """Тест: индекс на Python не читает базу, пока версия в кеше не изменится"""
+        search_index, other = PythonProductSearchIndex(), PythonProductSearchIndex()
+        self.assertEqual(other.search('galaxy'), [self.ids[1002]])
+        with self.assertNumQueries(0):
+            self.assertEqual(other.search('iphone xr'), [self.ids[1001]])
+
+        ProductInfo.objects.filter(id=self.ids[1002]).update(name='Смартфон Xiaomi', model='xiaomi')
+        with self.captureOnCommitCallbacks(execute=True):
+            search_index.update([self.ids[1002]])
+        # Второй экземпляр (как другой процесс с общим кешем) перестраивает индекс
+        self.assertEqual(other.search('xiaomi'), [self.ids[1002]])
+        self.assertEqual(other.search('galaxy'), [])
+
+    def test_index_updated_on_import(self):
+        """Тест: индекс обновляется при импорте, удалённые товары исчезают из выдачи"""
+        data = make_price_list(5)
+        data['goods'][0]['name'] = 'Флешка SanDisk'
+        PriceListImporter().import_data(data)
+
+        search_index = get_search_index()
+        self.assertEqual(search_index.search('sandisk'), [self.ids[1000]])
+        self.assertEqual(search_index.search('iphone'), [])
+        self.assertEqual(search_index.search('galaxy'), [])
+        self.assertFalse(ProductSearchDocument.objects.filter(product_info_id=self.ids[1005]).exists())
+
+    def test_search_endpoints(self):
+        """Тест поиска через API: ранжированная выдача и фильтр списка"""
+        response = self.client.get('/api/products/search/?q=iphone xr&fields=id,name')
+        self.assertEqual([item['id'] for item in response.data], [self.ids[1001]])
+
+        response = self.client.get('/api/products/?search=Apple')
+        self.assertEqual({item['id'] for item in response.data['results']}, {self.ids[1000], self.ids[1001]})
+
+
+class ProductFacetTestCase(CatalogTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # make_price_list: чётные товары в категории 15, нечётные в 224,
+        # память 64 * (i % 4 + 1), цена 100 + i, остаток i % 7
+        PriceListImporter().import_data(make_price_list(8))
+        self.client = APIClient()
+
+    def test_facets_maintained_by_import(self):
+        """Тест: таблица фасетов совпадает с живым подсчётом после импорта и повторного импорта"""
+        self.assertEqual(stored_facet_counts(), live_facet_counts(ProductInfo.objects.all()))
+        self.assertEqual(stored_facet_counts()['Цвет'], {'черный': 8})
+
+        data = make_price_list(6)
+        data['goods'][0]['parameters']['Цвет'] = 'белый'
+        data['goods'][1]['category'] = 15
+        PriceListImporter().import_data(data)
+
+        self.assertEqual(stored_facet_counts(), live_facet_counts(ProductInfo.objects.all()))
+        self.assertEqual(stored_facet_counts()['Цвет'], {'белый': 1, 'черный': 5})
+        self.assertEqual(stored_facet_counts(category_id=15)['Встроенная память (Гб)'], {'64': 2, '128': 1, '192': 1})
+
+    def test_filters(self):
+        """Тест фильтров по параметрам, цене и остатку"""
+        def ids(query):
+            response = self.client.get(f'/api/products/?fields=id,external_id&{query}')
+            self.assertEqual(response.status_code, 200)
+            return sorted(ProductInfo.objects.filter(id__in=[item['id'] for item in response.data['results']])
+                          .values_list('external_id', flat=True))
+
+        self.assertEqual(ids('parameter=Встроенная память (Гб):64'), [1000, 1004])
+        self.assertEqual(ids('parameter=Встроенная память (Гб):64&parameter=Встроенная память (Гб):128'),
+                         [1000, 1001, 1004, 1005])
+        self.assertEqual(ids('parameter=Встроенная память (Гб):64&parameter=Цвет:белый'), [])
+        self.assertEqual(ids('price_min=102&price_max=104.5'), [1002, 1003, 1004])
+        self.assertEqual(ids('quantity_min=5&category=224'), [1005])
+        self.assertEqual(self.client.get('/api/products/?price_min=abc').status_code, 400)
+        self.assertEqual(self.client.get('/api/products/?parameter=Цвет').status_code, 400)
+
+    def test_facet_counts_in_response(self):
+        """Тест фасетов в ответе: из таблицы без фильтров и живой подсчёт с фильтрами"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/products/?facets=1&category=15')
+        self.assertEqual(response.data['facets']['Встроенная память (Гб)'], {'64': 2, '192': 2})
+        # Список магазинов для ключа кеша, страница, параметры и фасеты
+        self.assertEqual(len(queries), 4)
+
+        response = self.client.get('/api/products/?facets=1&price_max=103')
+        self.assertEqual(response.data['facets']['Встроенная память (Гб)'], {'64': 1, '128': 1, '192': 1, '256': 1})
+
+
+class CatalogCacheTestCase(CatalogTestCase):
+
+    def setUp(self):
+        super().setUp()
+        PriceListImporter().import_data(make_price_list(5, shop_name='Shop A'))
+        PriceListImporter().import_data(make_price_list(3, shop_name='Shop B'))
+        self.shop_a, self.shop_b = Shop.objects.order_by('id')
+        self.client = APIClient()
+        catalog_cache().reset_stats()
+
+    def reimport(self, shop_name, goods_count):
+        with self.captureOnCommitCallbacks(execute=True):
+            PriceListImporter().import_data(make_price_list(goods_count, shop_name=shop_name))
+
+    def test_cached_response(self):
+        """Тест: повторный запрос обслуживается из кеша, порядок параметров не важен"""
+        first = self.client.get('/api/products/?page_size=3&fields=id,name')
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get('/api/products/?fields=id,name&page_size=3')
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(first.data, second.data)
+        self.assertGreaterEqual(catalog_cache().stats()['hits'], 1)
+
+    def test_import_invalidates_shop_entries(self):
+        """Тест: импорт магазина делает устаревшими только ответы с его товарами"""
+        self.client.get('/api/products/')
+        self.client.get(f'/api/products/?shop={self.shop_b.id}')
+
+        self.reimport('Shop A', 2)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/api/products/?shop={self.shop_b.id}')
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(len(response.data['results']), 3)
+
+        response = self.client.get('/api/products/')
+        self.assertEqual(len(response.data['results']), 2 + 3)
+
+    def test_reservation_invalidates_shop_entries(self):
+        """Тест: резерв сбрасывает кеш каталога магазина, только когда товар пропадает из наличия или появляется"""
+        product_info = ProductInfo.objects.get(shop=self.shop_a, external_id=1004)
+        url = f'/api/products/?shop={self.shop_a.id}'
+
+        def quantity():
+            return next(item['quantity'] for item in self.client.get(url).data['results']
+                        if item['id'] == product_info.id)
+
+        self.assertEqual(quantity(), 4)
+        buyer = APIClient()
+        buyer.force_authenticate(User.objects.create_user(username="buyer@example.com", password="testpassword"))
+
+        def set_cart(count):
+            with self.captureOnCommitCallbacks(execute=True):
+                buyer.post('/api/cart/', {'product_id': product_info.product_id, 'shop_id': self.shop_a.id,
+                                          'quantity': count})
+
+        set_cart(1)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(quantity(), 4)
+        self.assertEqual(len(queries), 0)
+
+        set_cart(4)
+        self.assertEqual(quantity(), 0)
+        self.assertNotIn(product_info.id, [item['id'] for item in self.client.get(f'{url}&quantity_min=1').data['results']])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            buyer.delete('/api/cart/', {'item_id': OrderItem.objects.get().id})
+        self.assertEqual(quantity(), 4)
+
+    def test_unchanged_import_keeps_cache(self):
+        """Тест: импорт без изменений не сбрасывает кеш"""
+        self.client.get('/api/products/')
+        self.reimport('Shop A', 5)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/products/')
+        self.assertEqual(len(queries), 0)
+
+
+class CatalogExportTestCase(CatalogTestCase):
+
+    def setUp(self):
+        super().setUp()
+        PriceListImporter().import_data(make_price_list(5, shop_name='Shop A'))
+        PriceListImporter().import_data(make_price_list(3, shop_name='Shop B'))
+        self.shop_a, self.shop_b = Shop.objects.order_by('id')
+        self.client = APIClient()
+
+    def export(self, url, **extra):
+        response = self.client.get(url, **extra)
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content)
+
+    def test_csv(self):
+        """Тест: CSV со столбцами каталога, параметры — JSON в ячейке"""
+        _, body = self.export(f'/api/products/export/csv/?shop={self.shop_b.id}')
+        rows = list(csv.DictReader(StringIO(body.decode())))
+        self.assertEqual(list(rows[0]), list(ProductCatalogSerializer.Meta.fields))
+        self.assertEqual([int(row['id']) for row in rows],
+                         list(ProductInfo.objects.filter(shop=self.shop_b).order_by('id').values_list('id', flat=True)))
+        self.assertEqual(json.loads(rows[0]['parameters']), {'Цвет': 'черный', 'Встроенная память (Гб)': '64'})
+        self.assertEqual(rows[1]['price'], '101.00')
+
+    def test_jsonl_matches_product_list(self):
+        """Тест: строки JSONL совпадают с объектами /api/products/"""
+        response, body = self.export('/api/products/export/jsonl/')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        items = [json.loads(line) for line in body.decode().splitlines()]
+        self.assertEqual(items, FastProductCatalogSerializer().serialize(ProductInfo.objects.order_by('id')))
+
+    def test_yaml_round_trip(self):
+        """Тест: выгрузка магазина в YAML загружается обратно импортом"""
+        _, body = self.export(f'/api/products/export/yaml/?shop={self.shop_a.id}')
+        data = yaml.safe_load(body)
+        self.assertEqual(data['shop'], 'Shop A')
+        self.assertEqual(data['categories'], [{'id': 15, 'name': 'Аксессуары'}, {'id': 224, 'name': 'Смартфоны'}])
+        self.assertEqual(data['goods'][1], {
+            'id': 1001, 'category': 224, 'model': 'model/1', 'name': 'Товар 1', 'price': 101, 'price_rrc': 121,
+            'quantity': 1, 'parameters': {'Цвет': 'черный', 'Встроенная память (Гб)': '128'},
+        })
+
+        data['shop'] = 'Shop A copy'
+        PriceListImporter().import_data(data)
+        fields = ('external_id', 'product_id', 'model', 'name', 'price', 'price_rrc', 'quantity')
+        self.assertEqual(list(ProductInfo.objects.filter(shop__name='Shop A copy').order_by('id').values_list(*fields)),
+                         list(ProductInfo.objects.filter(shop=self.shop_a).order_by('id').values_list(*fields)))
+
+        _, body = self.export('/api/products/export/yaml/')
+        documents = list(yaml.safe_load_all(body))
+        self.assertEqual([document['shop'] for document in documents], ['Shop A', 'Shop B', 'Shop A copy'])
+        self.assertEqual([len(document['goods']) for document in documents], [5, 3, 5])
+
+    def test_catalog_yaml_reimport(self):
+        """Тест: выгрузка всех магазинов загружается обратно import_pricelists и даёт ту же выгрузку"""
+        _, body = self.export('/api/products/export/yaml/')
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        (Path(directory) / 'catalog.yaml').write_bytes(body)
+        ProductInfo.objects.update(price=1)
+
+        out = StringIO()
+        call_command('import_pricelists', directory, workers=1, stdout=out)
+        self.assertIn('Total: 1/1 files, 8 rows', out.getvalue())
+        self.assertEqual(Shop.objects.count(), 2)
+        self.assertEqual(self.export('/api/products/export/yaml/')[1], body)
+
+        # Загрузка через API принимает прайс-лист одного магазина
+        with self.assertRaisesMessage(ValueError, 'several shops'):
+            PriceListImporter().import_stream(body)
+        self.assertFalse(ProductInfo.objects.filter(price=1).exists())
+
+    def test_gzip(self):
+        """Тест: при Accept-Encoding: gzip поток сжимается, ETag у вариантов разный"""
+        plain_response, plain = self.export('/api/products/export/csv/')
+        response, body = self.export('/api/products/export/csv/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(body), plain)
+        self.assertNotEqual(response['ETag'], plain_response['ETag'])
+
+    def test_conditional_requests(self):
+        """Тест: ETag и Last-Modified меняются только после импорта с изменениями"""
+        response, _ = self.export('/api/products/export/jsonl/')
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/api/products/export/jsonl/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        response = self.client.get('/api/products/export/jsonl/', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+        PriceListImporter().import_data(make_price_list(5, shop_name='Shop A'))
+        self.assertEqual(self.client.get('/api/products/export/jsonl/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        Shop.objects.filter(id=self.shop_a.id).update(imported_at=timezone.now() + timedelta(minutes=1))
+        response, _ = self.export('/api/products/export/jsonl/', HTTP_IF_NONE_MATCH=etag)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.client.get(f'/api/products/export/jsonl/?shop={self.shop_b.id}',
+                                         HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_stock_changes_invalidate_validators(self):
+        """Тест: резерв корзины меняет выгружаемый остаток, а с ним ETag и Last-Modified"""
+        response, _ = self.export('/api/products/export/jsonl/')
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        offer = ProductInfo.objects.filter(shop=self.shop_b, quantity__gt=0).first()
+        with mock.patch('backend.caching.timezone.now', return_value=timezone.now() + timedelta(minutes=1)), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(reserve(offer.product_id, offer.shop_id, 1))
+
+        response, _ = self.export('/api/products/export/jsonl/', HTTP_IF_NONE_MATCH=etag)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.client.get('/api/products/export/jsonl/', HTTP_IF_MODIFIED_SINCE=last_modified)
+                         .status_code, 200)
+        self.assertEqual(self.client.get(f'/api/products/export/jsonl/?shop={self.shop_a.id}',
+                                         HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+    def test_reads_in_chunks(self):
+        """Тест: товары читаются одним курсором, параметры — запросом на пачку"""
+        with mock.patch.object(CatalogExportAPIView, 'chunk_size', 3):
+            for export_format in ('csv', 'jsonl', 'yaml'):
+                with CaptureQueriesContext(connection) as queries:
+                    self.export(f'/api/products/export/{export_format}/')
+                sql = [query['sql'] for query in queries]
+                # 5 + 3 товара: три пачки целиком или 2 + 1 по магазинам для yaml
+                self.assertEqual(len([q for q in sql if 'FROM "backend_productparameter"' in q]), 3)
+                self.assertEqual(len([q for q in sql if 'FROM "backend_productinfo"' in q]),
+                                 2 if export_format == 'yaml' else 1)
+
+    def test_errors(self):
+        """Тест: неизвестный формат или магазин"""
+        self.assertEqual(self.client.get('/api/products/export/xml/').status_code, 404)
+        self.assertEqual(self.client.get('/api/products/export/csv/?shop=999999').status_code, 404)
+        self.assertEqual(self.client.get('/api/products/export/csv/?shop=abc').status_code, 400)
+
+
+class LRUFileBasedCacheTestCase(TestCase):
+
+    def test_evicts_least_recently_read(self):
+        """Тест: файловый кеш вытесняет давно не читавшиеся записи"""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        cache = LRUFileBasedCache(directory, {'OPTIONS': {'MAX_ENTRIES': 3, 'CULL_FREQUENCY': 3}})
+        cache.reset_stats()
+
+        for i, key in enumerate(['a', 'b', 'c']):
+            cache.set(key, key)
+            path = cache._key_to_file(key)
+            os.utime(path, (1000 + i, 1000 + i))
+        cache.get('a')  # 'a' становится самой свежей записью
+        cache.set('d', 'd')
+
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual([cache.get(key) for key in 'acd'], ['a', 'c', 'd'])
+        self.assertEqual(cache.stats(), {'hits': 4, 'misses': 1, 'hit_ratio': 0.8})
+
+
+class OrderFixturesMixin:
+    """Пользователь и один товар в двух магазинах по разным ценам"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="buyer@example.com", password="testpassword")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        category = Category.objects.create(name="Смартфоны")
+        self.product = Product.objects.create(name="Телефон", category=category)
+        self.shop_a = Shop.objects.create(name="Shop A", url="http://a.example.com")
+        self.shop_b = Shop.objects.create(name="Shop B", url="http://b.example.com")
+        # Один и тот же товар в двух магазинах по разным ценам
+        for shop, price in ((self.shop_a, 100), (self.shop_b, 150)):
+            ProductInfo.objects.create(product=self.product, shop=shop, name="Телефон", quantity=10, price=price,
+                                       price_rrc=price)
+
+    def create_order(self, status='completed', quantities=(1, 2)):
+        order = Order.objects.create(user=self.user, status=status)
+        for shop, quantity in zip((self.shop_a, self.shop_b), quantities):
+            OrderItem.objects.create(order=order, product=self.product, shop=shop, quantity=quantity)
+        return order
+
+
+class OrderHistoryTestCase(OrderFixturesMixin, TestCase):
+
+    def test_totals_use_shop_price(self):
+        """Тест: сумма заказа считается по цене ProductInfo магазина позиции"""
+        order = self.create_order(quantities=(1, 2))
+        self.create_order(status='new')
+        response = self.client.get('/api/orders/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(item['id'], item['total_price']) for item in response.data['results']],
+                         [(order.id, '400.00')])
+
+    def test_constant_query_count(self):
+        """Тест: число запросов не зависит от количества заказов и позиций"""
+        self.create_order()
+        with CaptureQueriesContext(connection) as small:
+            self.client.get('/api/orders/')
+        for _ in range(10):
+            self.create_order(quantities=(3, 4))
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get('/api/orders/')
+        self.assertEqual(len(response.data['results']), 11)
+        self.assertEqual(len(small), len(large))
+
+    def test_filters_and_pagination(self):
+        """Тест фильтров по статусу и дате и постраничного вывода"""
+        orders = [self.create_order() for _ in range(3)]
+        in_progress = self.create_order(status='in_progress')
+        Order.objects.filter(id=orders[0].id).update(dt=timezone.now() - timedelta(days=10))
+
+        response = self.client.get('/api/orders/?status=in_progress')
+        self.assertEqual([item['id'] for item in response.data['results']], [in_progress.id])
+
+        date_from = (timezone.now() - timedelta(days=1)).date().isoformat()
+        response = self.client.get(f'/api/orders/?date_from={date_from}')
+        self.assertNotIn(orders[0].id, [item['id'] for item in response.data['results']])
+        self.assertEqual(len(response.data['results']), 3)
+
+        response = self.client.get('/api/orders/?page_size=2')
+        self.assertEqual([item['id'] for item in response.data['results']], [in_progress.id, orders[2].id])
+        self.assertIsNotNone(response.data['next'])
+        self.assertEqual(self.client.get('/api/orders/?status=new').status_code, 400)
+
+    def test_confirmation_stores_total(self):
+        """Тест: при подтверждении сумма сохраняется и не зависит от последующих изменений цен"""
+        order = self.create_order(status='new', quantities=(2, 0))
+        contact = Contact.objects.create(user=self.user, type='email', value='buyer@example.com')
+        response = self.client.post('/api/confirm-order/', {'order_id': order.id, 'contact_id': contact.id})
+        self.assertEqual(response.status_code, 200)
+
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.total), ('in_progress', Decimal('200.00')))
+
+        ProductInfo.objects.filter(shop=self.shop_a).update(price=1)
+        response = self.client.get('/api/orders/')
+        self.assertEqual(response.data['results'][0]['total_price'], '200.00')
+
+
+class OrderItemSnapshotTestCase(OrderFixturesMixin, TestCase):
+
+    def test_confirmation_snapshots_items(self):
+        """Тест: при подтверждении позиции получают снимок цены и названия"""
+        order = self.create_order(status='new', quantities=(1, 2))
+        contact = Contact.objects.create(user=self.user, type='email', value='buyer@example.com')
+        self.client.post('/api/confirm-order/', {'order_id': order.id, 'contact_id': contact.id})
+
+        # Переимпорт магазина удаляет его ProductInfo, но не влияет на прошлые заказы
+        ProductInfo.objects.filter(shop=self.shop_b).delete()
+        items = {item.shop_id: item for item in order.items.all()}
+        self.assertEqual((items[self.shop_a.id].price, items[self.shop_a.id].product_name),
+                         (Decimal('100.00'), 'Телефон'))
+        self.assertEqual(items[self.shop_b.id].price, Decimal('150.00'))
+        Order.objects.filter(id=order.id).update(total=None)
+        self.assertEqual(Order.objects.with_totals().get(id=order.id).total_price, Decimal('400.00'))
+
+    def test_backfill_command(self):
+        """Тест заполнения снимков у существующих позиций пачками"""
+        orders = [self.create_order() for _ in range(3)]
+        cart = self.create_order(status='new')
+        out = StringIO()
+        call_command('backfill_order_snapshots', batch_size=4, stdout=out)
+
+        self.assertFalse(OrderItem.objects.filter(order__in=orders, price__isnull=True).exists())
+        self.assertTrue(all(item.price is None for item in cart.items.all()))
+        self.assertIn('Done: 6 items processed, 0 without a matching ProductInfo', out.getvalue())
+
+
+class CartReservationTestCase(TemporaryResultBackendMixin, OrderFixturesMixin, TestCase):
+
+    def stock(self, shop):
+        return ProductInfo.objects.get(product=self.product, shop=shop).available
+
+    def add(self, quantity, shop):
+        return self.client.post('/api/cart/', {'product_id': self.product.id, 'shop_id': shop.id,
+                                               'quantity': quantity})
+
+    def test_cart_reserves_stock(self):
+        """Тест: добавление и изменение количества в корзине резервирует разницу на складе"""
+        self.assertEqual(self.add(3, self.shop_a).status_code, 201)
+        self.assertEqual(self.stock(self.shop_a), 7)
+        self.add(5, self.shop_a)
+        self.assertEqual(self.stock(self.shop_a), 5)
+        self.add(1, self.shop_a)
+        self.assertEqual(self.stock(self.shop_a), 9)
+        self.assertEqual(self.stock(self.shop_b), 10)
+
+        response = self.add(11, self.shop_a)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.stock(self.shop_a), 9)
+        self.assertEqual(OrderItem.objects.get().quantity, 1)
+
+    def test_invalid_ids(self):
+        """Тест: нечисловые id и тело-массив в корзине и подтверждении — ошибка 400, а не 500"""
+        for data in ({'product_id': self.product.id, 'shop_id': 'abc'}, {'product_id': 'abc'},
+                     {'product_id': self.product.id, 'shop_id': [1]}):
+            response = self.client.post('/api/cart/', {**data, 'quantity': 1}, format='json')
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.post('/api/cart/', [1, 2], format='json').status_code, 400)
+        self.assertFalse(OrderItem.objects.exists())
+
+        self.add(2, self.shop_a)
+        for data in ({'item_id': 'x'}, [1]):
+            self.assertEqual(self.client.delete('/api/cart/', data, format='json').status_code, 400)
+        self.assertEqual(self.stock(self.shop_a), 8)
+
+        cart = Order.objects.get(user=self.user, status='new')
+        contact = Contact.objects.create(user=self.user, type='email', value='buyer@example.com')
+        for data in ({'order_id': 'x', 'contact_id': contact.id}, {'order_id': cart.id, 'contact_id': 'x'},
+                     [cart.id, contact.id]):
+            self.assertEqual(self.client.post('/api/confirm-order/', data, format='json').status_code, 400)
+        self.assertEqual(Order.objects.get(id=cart.id).status, 'new')
+
+    def test_delete_releases_only_own_items(self):
+        """Тест: удаление позиции возвращает резерв, чужие позиции не удаляются"""
+        self.add(4, self.shop_a)
+        item = OrderItem.objects.get()
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user(username="other@example.com", password="testpassword"))
+        other.delete('/api/cart/', {'item_id': item.id})
+        self.assertTrue(OrderItem.objects.filter(id=item.id).exists())
+
+        self.client.delete('/api/cart/', {'item_id': item.id})
+        self.assertFalse(OrderItem.objects.exists())
+        self.assertEqual(self.stock(self.shop_a), 10)
+
+    def test_confirmation_keeps_reservation(self):
+        """Тест: подтверждение делает резерв постоянным, позиции без резерва резервируются"""
+        self.add(2, self.shop_a)
+        cart = Order.objects.get(user=self.user, status='new')
+        OrderItem.objects.create(order=cart, product=self.product, shop=self.shop_b, quantity=3)
+        contact = Contact.objects.create(user=self.user, type='email', value='buyer@example.com')
+        response = self.client.post('/api/confirm-order/', {'order_id': cart.id, 'contact_id': contact.id})
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual((self.stock(self.shop_a), self.stock(self.shop_b)), (8, 7))
+        self.assertFalse(OrderItem.objects.filter(reserved_until__isnull=False).exists())
+        self.assertEqual(self.client.post('/api/confirm-order/', {'order_id': cart.id, 'contact_id': contact.id})
+                         .status_code, 404)
+
+    def test_release_expired(self):
+        """Тест: просроченные резервы возвращаются на склад, позиции удаляются"""
+        self.add(2, self.shop_a)
+        self.add(3, self.shop_b)
+        OrderItem.objects.filter(shop=self.shop_a).update(reserved_until=timezone.now() - timedelta(seconds=1))
+
+        with override_settings(CELERY_TASK_ALWAYS_EAGER=True):
+            released = release_expired_reservations.delay().get()
+        self.assertEqual(released, 1)
+        self.assertEqual((self.stock(self.shop_a), self.stock(self.shop_b)), (10, 7))
+        self.assertEqual(list(OrderItem.objects.values_list('shop_id', flat=True)), [self.shop_b.id])
+
+    def test_reimport_keeps_reservations(self):
+        """Тест: импорт перезаписывает остаток магазина, резерв и его снятие учитываются отдельно"""
+        data = make_price_list(2, shop_name='Shop I')
+        data['goods'][0]['quantity'] = 10
+        PriceListImporter().import_data(data)
+        product_info = ProductInfo.objects.get(shop__name='Shop I', external_id=1000)
+        self.client.post('/api/cart/', {'product_id': product_info.product_id, 'shop_id': product_info.shop_id,
+                                        'quantity': 5})
+
+        data['goods'][0]['price'] += 1
+        PriceListImporter().import_data(data)
+        product_info.refresh_from_db()
+        self.assertEqual((product_info.quantity, product_info.reserved, product_info.available), (10, 5, 5))
+
+        OrderItem.objects.update(reserved_until=timezone.now() - timedelta(seconds=1))
+        release_expired()
+        product_info.refresh_from_db()
+        self.assertEqual((product_info.quantity, product_info.available), (10, 10))
+
+        # Снятие с продажи при действующем резерве: после истечения резерва товара нет
+        self.client.post('/api/cart/', {'product_id': product_info.product_id, 'shop_id': product_info.shop_id,
+                                        'quantity': 3})
+        ProductInfo.objects.filter(id=product_info.id).update(quantity=0)
+        OrderItem.objects.update(reserved_until=timezone.now() - timedelta(seconds=1))
+        release_expired()
+        product_info.refresh_from_db()
+        self.assertEqual((product_info.quantity, product_info.reserved), (0, 0))
+
+    def test_replace_import_keeps_reservations(self):
+        """Тест: импорт replace и удаление из прайс-листа не теряют резерв корзины"""
+        data = make_price_list(3, shop_name='Shop R')
+        for item in data['goods']:
+            item['quantity'] = 10
+        PriceListImporter().import_data(data)
+        kept, dropped = ProductInfo.objects.filter(shop__name='Shop R').order_by('external_id')[:2]
+        for product_info in (kept, dropped):
+            self.client.post('/api/cart/', {'product_id': product_info.product_id,
+                                            'shop_id': product_info.shop_id, 'quantity': 4})
+
+        result = PriceListImporter(mode=PriceListImporter.REPLACE).import_data(
+            {**data, 'goods': [item for item in data['goods'] if item['id'] != dropped.external_id]}
+        )
+        self.assertEqual((result.inserted, result.updated, result.removed), (1, 1, 1))
+        kept.refresh_from_db()
+        dropped.refresh_from_db()
+        self.assertEqual((kept.quantity, kept.reserved, kept.available), (10, 4, 6))
+        self.assertEqual((dropped.quantity, dropped.reserved), (0, 4))
+
+        # Снятый с продажи товар не продаётся, его резерв возвращается при удалении из корзины
+        cart = Order.objects.get(user=self.user, status='new')
+        contact = Contact.objects.create(user=self.user, type='email', value='buyer@example.com')
+        response = self.client.post('/api/confirm-order/', {'order_id': cart.id, 'contact_id': contact.id})
+        self.assertEqual(response.status_code, 409)
+        self.client.delete('/api/cart/', {'item_id': cart.items.get(shop=dropped.shop, product=dropped.product).id})
+        dropped.refresh_from_db()
+        self.assertEqual(dropped.reserved, 0)
+
+        response = self.client.post('/api/confirm-order/', {'order_id': cart.id, 'contact_id': contact.id})
+        self.assertEqual(response.status_code, 200)
+        kept.refresh_from_db()
+        self.assertEqual((kept.quantity, kept.reserved), (6, 0))
+
+    def test_confirm_checks_supplier_stock(self):
+        """Тест: подтверждение не продаёт больше остатка, уменьшенного импортом после резерва"""
+        self.add(5, self.shop_a)
+        ProductInfo.objects.filter(shop=self.shop_a).update(quantity=3)
+        cart = Order.objects.get(user=self.user, status='new')
+        contact = Contact.objects.create(user=self.user, type='email', value='buyer@example.com')
+        response = self.client.post('/api/confirm-order/', {'order_id': cart.id, 'contact_id': contact.id})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(ProductInfo.objects.filter(shop=self.shop_a).values_list('quantity', 'reserved').get(),
+                         (3, 5))
+
+
+class CartConcurrencyTestCase(TransactionTestCase):
+
+    def test_stock_never_goes_negative(self):
+        """Тест: параллельные покупатели не уводят остаток в минус и не создают лишних корзин"""
+        category = Category.objects.create(name="Распродажа")
+        product = Product.objects.create(name="Товар дня", category=category)
+        shop = Shop.objects.create(name="Shop", url="http://shop.example.com")
+        ProductInfo.objects.create(product=product, shop=shop, name="Товар дня", quantity=25, price=10, price_rrc=10)
+        users = [User.objects.create_user(username=f"buyer{i}@example.com", password="x") for i in range(10)]
+        statuses = []
+
+        def buy(user):
+            client = APIClient()
+            client.force_authenticate(user)
+            try:
+                for quantity in (1, 2, 3, 2, 4):
+                    response = client.post('/api/cart/', {'product_id': product.id, 'quantity': quantity})
+                    statuses.append(response.status_code)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=len(users)) as executor:
+            list(executor.map(buy, users))
+
+        stock = ProductInfo.objects.get(product=product).available
+        reserved = OrderItem.objects.aggregate(total=Sum('quantity'))['total']
+        self.assertGreaterEqual(stock, 0)
+        self.assertEqual(stock + reserved, 25)
+        self.assertEqual(Order.objects.filter(status='new').count(), len(set(
+            OrderItem.objects.values_list('order__user', flat=True))))
+        self.assertIn(409, statuses)
+        self.assertTrue(set(statuses) <= {201, 409})
+
+
+class CartBulkTestCase(OrderFixturesMixin, TestCase):
+
+    def add_products(self, count):
+        category = Category.objects.get()
+        start = Product.objects.count()
+        products = Product.objects.bulk_create(Product(name=f"Товар {start + i}", category=category)
+                                               for i in range(count))
+        ProductInfo.objects.bulk_create(
+            ProductInfo(product=product, shop=self.shop_b, name=product.name, quantity=5, price=10, price_rrc=10)
+            for product in products
+        )
+        return products
+
+    def test_per_line_results(self):
+        """Тест: результат по каждой строке, магазин выбирается явно"""
+        response = self.client.post('/api/cart/bulk/', {'items': [
+            {'product_id': self.product.id, 'shop_id': self.shop_b.id, 'quantity': 4},
+            {'product_id': self.product.id, 'quantity': 2},
+            {'product_id': self.product.id, 'shop_id': self.shop_b.id, 'quantity': 1},
+            {'product_id': 999999, 'quantity': 1},
+            {'product_id': self.product.id, 'quantity': 'много'},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results']
+        self.assertEqual([result['status'] for result in results], ['ok', 'ok', 'error', 'error', 'error'])
+        self.assertEqual(results[1]['shop_id'], self.shop_a.id)
+
+        stock = dict(ProductInfo.objects.values_list('shop_id', 'available'))
+        self.assertEqual((stock[self.shop_a.id], stock[self.shop_b.id]), (8, 6))
+
+        response = self.client.post('/api/cart/bulk/', {'items': [
+            {'product_id': self.product.id, 'shop_id': self.shop_b.id, 'quantity': 11},
+            {'product_id': self.product.id, 'shop_id': self.shop_a.id, 'quantity': 1},
+        ]}, format='json')
+        results = response.data['results']
+        self.assertEqual(results[0]['error'], 'Недостаточно товара на складе')
+        self.assertEqual(results[1]['item_id'], OrderItem.objects.get(shop=self.shop_a).id)
+        self.assertEqual(dict(OrderItem.objects.values_list('shop_id', 'quantity')),
+                         {self.shop_a.id: 1, self.shop_b.id: 4})
+        self.assertEqual(ProductInfo.objects.get(shop=self.shop_a).available, 9)
+
+    def test_non_object_body(self):
+        """Тест: тело-массив вместо объекта — ошибка 400, а не 500"""
+        response = self.client.post('/api/cart/bulk/', [1, 2], format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_constant_query_count(self):
+        """Тест: число запросов не зависит от количества строк"""
+        def lines(products):
+            return {'items': [{'product_id': product.id, 'shop_id': self.shop_b.id, 'quantity': 2}
+                              for product in products]}
+
+        small, large = self.add_products(10), self.add_products(100)
+        # В обоих запросах есть и новые, и уже лежащие в корзине позиции
+        self.client.post('/api/cart/bulk/', lines([small[0], large[0]]), format='json')
+        with CaptureQueriesContext(connection) as small_queries:
+            self.client.post('/api/cart/bulk/', lines(small), format='json')
+        with CaptureQueriesContext(connection) as large_queries:
+            response = self.client.post('/api/cart/bulk/', lines(large), format='json')
+        self.assertEqual({result['status'] for result in response.data['results']}, {'ok'})
+        self.assertEqual(len(small_queries), len(large_queries))
+        self.assertEqual(OrderItem.objects.count(), 110)
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class OrderNotificationTestCase(TemporaryResultBackendMixin, OrderFixturesMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        for shop in (self.shop_a, self.shop_b):
+            shop.user = User.objects.create_user(username=f'owner-{shop.id}', email=f'owner-{shop.id}@example.com',
+                                                 type='shop')
+            shop.save()
+        self.contact = Contact.objects.create(user=self.user, type='email', value='buyer@example.com')
+
+    def confirm(self, quantities=(1, 2)):
+        order = self.create_order(status='new', quantities=quantities)
+        self.assertIsNotNone(confirm_cart(self.user, order.id, self.contact))
+        return order
+
+    @override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+    def test_confirmation_sends_one_email_per_shop(self):
+        """Тест: после подтверждения покупатель и каждый магазин получают по письму"""
+        order = self.create_order(status='new', quantities=(1, 2))
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/confirm-order/', {'order_id': order.id, 'contact_id': self.contact.id})
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox),
+                         ['buyer@example.com', self.shop_a.user.email, self.shop_b.user.email])
+        shop_b_mail = next(message for message in mail.outbox if message.to == [self.shop_b.user.email])
+        self.assertEqual(shop_b_mail.body, 'Телефон x 2: 150.00 руб.')
+        self.assertIsNotNone(OrderNotification.objects.get(order=order).sent_at)
+
+    def test_outbox_row_is_part_of_confirmation(self):
+        """Тест: неудачное подтверждение не оставляет уведомления"""
+        order = self.create_order(status='new', quantities=(11, 0))
+        with self.assertRaises(OutOfStock):
+            confirm_cart(self.user, order.id, self.contact)
+        self.assertFalse(OrderNotification.objects.exists())
+        self.assertEqual(send_pending_notifications(), 0)
+        self.assertEqual(mail.outbox, [])
+
+    def test_batch_reuses_connection(self):
+        """Тест: письма пачки уходят через одно соединение"""
+        for _ in range(3):
+            self.confirm()
+        with mock.patch('backend.notifications.get_connection', wraps=get_connection) as connection:
+            self.assertEqual(send_pending_notifications(batch_size=2), 3)
+        self.assertEqual(connection.call_count, 2)
+        self.assertEqual(len(mail.outbox), 3 * 3)
+        self.assertEqual(send_pending_notifications(), 0)
+
+    def test_failed_notification_is_retried(self):
+        """Тест: ошибка отправки не мешает остальным уведомлениям, неудачное повторяется"""
+        failed, ok = self.confirm(), self.confirm()
+        with mock.patch.object(locmem.EmailBackend, 'send_messages', side_effect=[SMTPException('boom'), 3]):
+            self.assertEqual(send_pending_notifications(), 1)
+        notification = OrderNotification.objects.get(order=failed)
+        self.assertEqual((notification.sent_at, notification.attempts, notification.last_error), (None, 1, 'boom'))
+        self.assertIsNotNone(OrderNotification.objects.get(order=ok).sent_at)
+
+        self.assertEqual(send_pending_notifications(), 1)
+        self.assertEqual([message.subject for message in mail.outbox][0], f'Заказ №{failed.id} подтверждён')
+
+        OrderNotification.objects.update(sent_at=None, attempts=settings.NOTIFICATION_MAX_ATTEMPTS)
+        self.assertEqual(send_pending_notifications(), 0)
+
+    def test_claimed_notifications_are_skipped(self):
+        """Тест: уведомления, взятые другим воркером, не отправляются повторно до истечения срока"""
+        self.confirm()
+        OrderNotification.objects.update(claimed_by='other', claimed_until=timezone.now() + timedelta(minutes=1))
+        self.assertEqual(send_pending_notifications(), 0)
+        OrderNotification.objects.update(claimed_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(send_pending_notifications(), 1)
+
+
+class ProductOffersTestCase(OrderFixturesMixin, TestCase):
+
+    def test_offers_endpoint(self):
+        """Тест: предложения в наличии от самого дешёвого"""
+        response = self.client.get(f'/api/products/{self.product.id}/offers/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['best']['shop_name'], 'Shop A')
+        self.assertEqual([offer['price'] for offer in response.data['offers']], ['100.00', '150.00'])
+
+        ProductInfo.objects.filter(shop=self.shop_a).update(quantity=0)
+        response = self.client.get(f'/api/products/{self.product.id}/offers/')
+        self.assertEqual([offer['shop'] for offer in response.data['offers']], [self.shop_b.id])
+        self.assertEqual(self.client.get('/api/products/999999/offers/').status_code, 404)
+
+    def test_cart_uses_best_offer(self):
+        """Тест: без shop_id корзина берёт самое дешёвое предложение в наличии"""
+        ProductInfo.objects.filter(shop=self.shop_a).update(quantity=2)
+        self.client.post('/api/cart/', {'product_id': self.product.id, 'quantity': 2})
+        self.client.post('/api/cart/bulk/', {'items': [{'product_id': self.product.id, 'quantity': 3}]},
+                         format='json')
+        self.assertEqual(dict(OrderItem.objects.values_list('shop_id', 'quantity')),
+                         {self.shop_a.id: 2, self.shop_b.id: 3})
+
+    def test_best_offer_uses_index(self):
+        """Тест: выбор лучшего предложения идёт по частичному индексу"""
+        if connection.vendor != 'sqlite':
+            self.skipTest('План запроса проверяется только для SQLite')
+        sql, params = ProductInfo.objects.filter(product=self.product).offers()[:1].query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+        self.assertIn('productinfo_best_offer_idx', plan)
+
+
+@override_settings(LAST_SEEN_FLUSH_INTERVAL=3600, CACHES=LOCMEM_AUTH_CACHES)
+class AsyncViewsTestCase(OrderFixturesMixin, TestCase):
+    """Асинхронные представления отвечают так же, как синхронные"""
+
+    def setUp(self):
+        super().setUp()
+        catalog_cache().clear()
+        PriceListImporter().import_data(make_price_list(30))
+        self.token = Token.objects.create(user=self.user)
+        self.factory = AsyncRequestFactory()
+
+    def tearDown(self):
+        last_seen.pending.clear()
+
+    async def call(self, view_class, url, method='get', data=None, token=True):
+        headers = {'Authorization': f'Token {self.token.key}'} if token else {}
+        if method == 'get':
+            request = self.factory.get(url, headers=headers)
+        else:
+            request = getattr(self.factory, method)(url, json.dumps(data), content_type='application/json',
+                                                    headers=headers)
+        response = await view_class.as_view()(request)
+        return response.status_code, json.loads(response.content)
+
+    async def sync_get(self, url):
+        # Ответы каталога кешируются с общим ключом, сравниваются ответы без кеша
+        catalog_cache().clear()
+        response = await sync_to_async(self.client.get)(url)
+        catalog_cache().clear()
+        return response.status_code, json.loads(response.content)
+
+    async def test_product_list(self):
+        """Тест: страницы каталога, фильтры, поиск и фасеты совпадают с синхронным представлением"""
+        for url in ('/api/products/?page_size=7', '/api/products/?fields=id,name,parameters&page_size=3',
+                    '/api/products/?category=224&price_min=110&page_size=5', '/api/products/?search=model&page_size=4',
+                    '/api/products/?facets=1&page_size=2'):
+            expected = await self.sync_get(url)
+            self.assertEqual(await self.call(AsyncProductListAPIView, url), expected, url)
+            following = await self.call(AsyncProductListAPIView, expected[1]['next'])
+            self.assertEqual(following, await self.sync_get(expected[1]['next']), url)
+            # Курсор назад: запрос в обратном порядке и разворот страницы
+            self.assertEqual(await self.call(AsyncProductListAPIView, following[1]['previous']),
+                             await self.sync_get(following[1]['previous']), url)
+
+    async def test_cart_and_order_history(self):
+        """Тест: GET корзины и истории заказов асинхронный, изменения корзины идут через синхронный обработчик"""
+        status_code, _ = await self.call(AsyncCartAPIView, '/api/cart/', 'post',
+                                         {'product_id': self.product.id, 'shop_id': self.shop_a.id, 'quantity': 2})
+        self.assertEqual(status_code, 201)
+        cart = await self.call(AsyncCartAPIView, '/api/cart/')
+        self.assertEqual(cart, await self.sync_get('/api/cart/'))
+        self.assertEqual(cart[1][0]['quantity'], 2)
+
+        for _ in range(3):
+            await sync_to_async(self.create_order)()
+        for url in ('/api/orders/?page_size=2', '/api/orders/?status=completed'):
+            expected = await self.sync_get(url)
+            self.assertEqual(await self.call(AsyncOrderHistoryAPIView, url), expected)
+        self.assertEqual(await self.call(AsyncOrderHistoryAPIView, expected[1]['next'] or '/api/orders/'),
+                         await self.sync_get(expected[1]['next'] or '/api/orders/'))
+
+    async def test_authentication(self):
+        """Тест: без токена или с неверным токеном асинхронные представления отвечают 401"""
+        self.assertEqual((await self.call(AsyncCartAPIView, '/api/cart/', token=False))[0], 401)
+        self.token.key = 'invalid'
+        self.assertEqual((await self.call(AsyncOrderHistoryAPIView, '/api/orders/'))[0], 401)
+        self.assertEqual((await self.call(AsyncProductListAPIView, '/api/products/', token=False))[0], 200)
+
+    def test_views_are_async(self):
+        """Тест: представления помечены как асинхронные, включая унаследованные синхронные обработчики"""
+        for view_class in (AsyncProductListAPIView, AsyncCartAPIView, AsyncOrderHistoryAPIView):
+            self.assertTrue(iscoroutinefunction(view_class.as_view()))
+
+
+@override_settings(LAST_SEEN_FLUSH_INTERVAL=3600, CACHES=LOCMEM_AUTH_CACHES)
+class CachedTokenAuthenticationTestCase(TestCase):
+
+    def setUp(self):
+        token_cache().clear()
+        self.user = User.objects.create_user(username="buyer@example.com", password="testpassword")
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def tearDown(self):
+        last_seen.pending.clear()
+
+    def get_contacts(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/contacts/')
+        return response.status_code, [query['sql'] for query in queries if 'authtoken_token' in query['sql']]
+
+    def test_token_is_cached(self):
+        """Тест: токен читается из базы только на первом запросе"""
+        self.assertEqual(self.get_contacts()[0], 200)
+        self.assertEqual(self.get_contacts(), (200, []))
+
+    def test_logout_revokes_token(self):
+        """Тест: после logout токен сразу перестаёт приниматься"""
+        self.get_contacts()
+        self.assertEqual(self.client.post('/api/logout/').status_code, 200)
+        self.assertEqual(self.get_contacts()[0], 401)
+
+    def test_revocation_is_shared(self):
+        """Тест: с AUTH_CACHE_DIR кеш токенов общий для процессов, logout отзывает токен и в других процессах"""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        shared = {'BACKEND': 'backend.caching.LRUFileBasedCache', 'LOCATION': directory, 'TIMEOUT': 600}
+        self.enterContext(override_settings(CACHES={**settings.CACHES, 'auth': shared}))
+
+        def cached_in_other_process():
+            return subprocess.run(
+                [sys.executable, 'manage.py', 'shell', '-c',
+                 'from backend.authentication import token_cache, token_cache_key; '
+                 f'print(token_cache().get(token_cache_key({self.token.key!r})) is not None)'],
+                cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+                env={**os.environ, 'AUTH_CACHE_DIR': directory},
+            ).stdout.split()[-1]
+
+        self.get_contacts()
+        self.assertEqual(cached_in_other_process(), 'True')
+        self.client.post('/api/logout/')
+        self.assertEqual(cached_in_other_process(), 'False')
+
+    def test_password_change_revokes_token(self):
+        """Тест: смена пароля отзывает токен, изменение пользователя обновляет кеш"""
+        self.get_contacts()
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.get_contacts()[0], 401)
+
+        self.user.is_active = True
+        self.user.save()
+        self.assertEqual(self.get_contacts()[0], 200)
+        self.user.set_password('new-password')
+        self.user.save()
+        self.assertFalse(Token.objects.filter(user=self.user).exists())
+        self.assertEqual(self.get_contacts()[0], 401)
+
+    def test_last_seen_is_batched(self):
+        """Тест: отметки последнего визита пишутся пачкой, а не на каждый запрос"""
+        other = User.objects.create_user(username="other@example.com", password="testpassword")
+        for _ in range(3):
+            self.get_contacts()
+        last_seen.touch(other.id)
+        self.assertIsNone(User.objects.get(id=self.user.id).last_seen)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(last_seen.flush(), 2)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(User.objects.filter(last_seen__isnull=False).count(), 2)
+
+
+@override_settings(CACHES=LOCMEM_AUTH_CACHES)
+class LoginTestCase(TestCase):
+
+    def setUp(self):
+        reset_limiters()
+        self.client = APIClient()
+
+    def login(self, email='buyer@example.com', password='testpassword', **extra):
+        return self.client.post('/api/login/', {'email': email, 'password': password}, **extra)
+
+    @override_settings(LOGIN_RATE_LIMITS={'ip': (100, 1), 'account': (3, 60)})
+    def test_rate_limit_before_hashing(self):
+        """Тест: после исчерпания ведёрка попытки отклоняются без проверки пароля"""
+        with mock.patch('backend.views.authenticate', return_value=None) as authenticate:
+            statuses = [self.login(password='wrong').status_code for _ in range(5)]
+            self.assertEqual(statuses, [400, 400, 400, 429, 429])
+            self.assertEqual(authenticate.call_count, 3)
+            # Другой аккаунт ограничен своим ведёрком
+            self.assertEqual(self.login(email='other@example.com').status_code, 400)
+
+    @override_settings(LOGIN_RATE_LIMITS={'ip': (2, 60), 'account': (100, 1)})
+    def test_rate_limit_per_ip(self):
+        """Тест: ведёрко IP общее для всех аккаунтов"""
+        statuses = [self.login(email=f'user{i}@example.com').status_code for i in range(3)]
+        self.assertEqual(statuses, [400, 400, 429])
+        self.assertEqual(self.login(email='user9@example.com', REMOTE_ADDR='10.0.0.2').status_code, 400)
+
+    def test_non_object_body(self):
+        """Тест: тело-список не ломает лимит и вход: ведёрко только по IP, ответ 400"""
+        for url in ('/api/login/', '/api/register/'):
+            response = self.client.post(url, [{'email': 'buyer@example.com'}], format='json')
+            self.assertEqual(response.status_code, 400)
+
+    def test_token_bucket_refill(self):
+        """Тест: токены ведёрка восстанавливаются со временем"""
+        limiter = TokenBucketLimiter(capacity=2, refill_seconds=10)
+        with mock.patch('backend.throttling.time.monotonic', side_effect=[0, 0, 0, 5, 10]):
+            self.assertEqual([limiter.consume('key') for _ in range(3)], [0, 0, 10])
+            self.assertEqual(limiter.consume('key'), 5)
+            self.assertEqual(limiter.consume('key'), 0)
+
+    def test_rehash_on_login(self):
+        """Тест: при входе хеш пересчитывается под текущие алгоритм и стоимость"""
+        with override_settings(PASSWORD_HASH_WORK_FACTOR=1000):
+            user = User.objects.create_user(username='buyer@example.com', password='testpassword')
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$1000$'))
+
+        with override_settings(PASSWORD_HASH_WORK_FACTOR=2000):
+            self.assertEqual(self.login().status_code, 200)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$2000$'))
+
+        with override_settings(PASSWORD_HASHERS=['backend.hashers.ScryptPasswordHasher', *settings.PASSWORD_HASHERS],
+                               PASSWORD_HASH_WORK_FACTOR=2 ** 10):
+            self.assertEqual(self.login().status_code, 200)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('scrypt$'))
+        # Перехеширование не отзывает токен пользователя
+        self.assertTrue(Token.objects.filter(user=user).exists())
+
+
+class JSONRenderersTestCase(TestCase):
+    payload = {
+        'price': Decimal('1234567.89'),
+        'dt': datetime(2024, 5, 1, 12, 30, 15, 250000, tzinfo=dt_timezone.utc),
+        'local_dt': datetime(2024, 5, 1, 12, 30, tzinfo=dt_timezone(timedelta(hours=3))),
+        'date': date(2024, 5, 1),
+        'lazy': gettext_lazy('Корзина'),
+        'text': 'Строка / с \u2028 разделителем',
+        'items': [{'id': 1, 'price': '100.00', 'parameters': {'Цвет': 'черный'}}],
+    }
+
+    def renderers(self):
+        renderers = [UJSONRenderer()]
+        if orjson is not None:
+            renderers.append(ORJSONRenderer())
+        return renderers
+
+    def test_output_matches_drf(self):
+        """Тест: быстрые рендереры дают тот же JSON, что и JSONRenderer"""
+        expected = JSONRenderer().render(self.payload)
+        for renderer in self.renderers():
+            with self.subTest(renderer=type(renderer).__name__):
+                ret = renderer.render(self.payload)
+                self.assertEqual(json.loads(ret), json.loads(expected))
+                self.assertIn(b'"2024-05-01T12:30:15.250000Z"', ret)
+                self.assertIn(b'\\u2028', ret)
+                self.assertEqual(renderer.render(None), b'')
+
+    def test_parsers(self):
+        """Тест: разбор тела запроса и ошибка на некорректном JSON"""
+        parsers = [UJSONParser()] + ([ORJSONParser()] if orjson is not None else [])
+        for parser in parsers:
+            with self.subTest(parser=type(parser).__name__):
+                self.assertEqual(parser.parse(BytesIO('{"name": "Товар", "ids": [1, 2]}'.encode())),
+                                 {'name': 'Товар', 'ids': [1, 2]})
+                with self.assertRaises(ParseError):
+                    parser.parse(BytesIO(b'{"name": '))
+
+    def test_api_uses_fast_renderer(self):
+        """Тест: API отвечает через рендерер из настроек REST_FRAMEWORK"""
+        catalog_cache().clear()
+        response = self.client.get('/api/products/')
+        self.assertIsInstance(response.accepted_renderer, DefaultJSONRenderer)
+        self.assertEqual(response.json()['results'], [])
+
+
+class FastReadSerializerTestCase(OrderFixturesMixin, TestCase):
+
+    def test_product_catalog_conformance(self):
+        """Тест: быстрый сериализатор каталога совпадает с ProductCatalogSerializer"""
+        PriceListImporter().import_data(make_price_list(20))
+        ProductInfo.objects.filter(id=ProductInfo.objects.order_by('id').values('id')[:1]).update(model=None)
+        queryset = ProductInfo.objects.order_by('id')
+        for fields in (None, ['id', 'name', 'price'], ['parameters', 'category_name', 'price_rrc'], ['shop_name']):
+            with self.subTest(fields=fields):
+                expected = ProductCatalogSerializer(queryset, many=True, fields=fields).data
+                self.assertEqual(FastProductCatalogSerializer(fields).serialize(queryset),
+                                 [dict(item) for item in expected])
+
+    def test_order_item_and_contact_conformance(self):
+        """Тест: быстрые сериализаторы позиций и контактов совпадают с ModelSerializer"""
+        self.client.post('/api/cart/', {'product_id': self.product.id, 'shop_id': self.shop_a.id, 'quantity': 2})
+        self.create_order(quantities=(1, 2))
+        OrderItem.objects.filter(shop=self.shop_b).snapshot()
+        Contact.objects.create(user=self.user, type='phone', value='+7 900 000-00-00')
+
+        items = OrderItem.objects.order_by('id')
+        self.assertEqual(FastOrderItemSerializer().serialize(items),
+                         [dict(item) for item in OrderItemSerializer(items, many=True).data])
+        contacts = Contact.objects.order_by('id')
+        self.assertEqual(FastContactSerializer().serialize(contacts),
+                         [dict(item) for item in ContactSerializer(contacts, many=True).data])
+        self.assertEqual(self.client.get('/api/cart/').data[0]['quantity'], 2)
+
+
+@override_settings(PROFILING_SAMPLE_RATE=1, CACHES=LOCMEM_AUTH_CACHES)
+class ProfilingTestCase(OrderFixturesMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        profile_store.reset()
+
+    def tearDown(self):
+        profile_store.reset()
+
+    def test_request_profile(self):
+        """Тест: профиль запроса совпадает с числом запросов к базе, эндпоинт — шаблон маршрута"""
+        self.create_order()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/orders/')
+        profile = profile_store.recent[-1]
+        self.assertEqual((profile.endpoint, profile.status, profile.queries), ('GET /api/orders/', 200, len(queries)))
+        self.assertGreater(profile.serialization_time, 0)
+        self.assertGreaterEqual(profile.duration, profile.db_time + profile.serialization_time)
+
+    def test_duplicate_queries(self):
+        """Тест: повторяющиеся запросы (N+1) попадают в профиль и показатели эндпоинта"""
+        def view(request):
+            for shop in (self.shop_a, self.shop_b):
+                list(ProductInfo.objects.filter(shop=shop))
+            list(Shop.objects.filter(id__in=[self.shop_a.id, self.shop_b.id]))
+            return HttpResponse()
+
+        ProfilingMiddleware(view)(AsyncRequestFactory().get('/n-plus-one/'))
+        profile = profile_store.recent[-1]
+        self.assertEqual(profile.queries, 3)
+        self.assertEqual(len(profile.duplicates), 1)
+        self.assertIn('backend_productinfo', profile.duplicates[0][0])
+        self.assertEqual(profile.duplicates[0][1], 2)
+        stats = profile_store.report()['endpoints']['GET <unresolved>']
+        self.assertEqual(stats['duplicates'], [{'sql': profile.duplicates[0][0], 'requests': 1}])
+
+    async def test_async_middleware(self):
+        """Тест: под ASGI запросы к базе из потоков sync_to_async попадают в профиль запроса"""
+        async def view(request):
+            await sync_to_async(list)(Shop.objects.all())
+            await Shop.objects.acount()
+            return HttpResponse()
+
+        middleware = ProfilingMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        await middleware(AsyncRequestFactory().get('/async/'))
+        self.assertEqual(profile_store.recent[-1].queries, 2)
+
+    async def test_async_view_serialization(self):
+        """Тест: время отрисовки ответа асинхронным представлением попадает в профиль"""
+        await sync_to_async(self.create_order)()
+        token = await Token.objects.acreate(user=self.user)
+        self.addCleanup(last_seen.pending.clear)
+        request = AsyncRequestFactory().get('/api/orders/', headers={'Authorization': f'Token {token.key}'})
+        response = await ProfilingMiddleware(AsyncOrderHistoryAPIView.as_view())(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(profile_store.recent[-1].serialization_time, 0)
+
+    def test_sampling(self):
+        """Тест: запросы вне выборки не профилируются"""
+        with override_settings(PROFILING_SAMPLE_RATE=0):
+            self.client.get('/api/orders/')
+        self.assertEqual(len(profile_store.recent), 0)
+
+    def test_fingerprint(self):
+        """Тест: IN-списки разной длины и числа в SQL дают один отпечаток"""
+        self.assertEqual(fingerprint('SELECT * FROM t WHERE id IN (%s, %s) LIMIT 21'),
+                         fingerprint('SELECT * FROM t WHERE id IN (%s, %s, %s) LIMIT 50'))
+
+    def test_ring_buffer(self):
+        """Тест: буфер хранит только последние профили, показатели эндпоинта копятся за все"""
+        store = ProfileStore(3)
+        for i, duration in enumerate((0.001, 0.02, 0.2, 3, 0.004)):
+            profile = RequestProfile('GET', f'/api/orders/{i}')
+            profile.finish('GET /api/orders/', 200, duration)
+            store.add(profile)
+        report = store.report()
+        self.assertEqual([profile['path'] for profile in report['recent']],
+                         ['/api/orders/4', '/api/orders/3', '/api/orders/2'])
+        stats = report['endpoints']['GET /api/orders/']
+        self.assertEqual(stats['count'], 5)
+        self.assertEqual((stats['histogram']['le_5'], stats['histogram']['le_25'], stats['histogram']['le_250'],
+                          stats['histogram']['le_5000']), (2, 1, 1, 1))
+        self.assertEqual((stats['p50_ms'], stats['p99_ms']), (25, 5000))
+
+    def test_metrics_endpoint(self):
+        """Тест: /api/_metrics/ доступен только персоналу, DELETE сбрасывает показатели"""
+        self.client.get('/api/cart/')
+        self.assertEqual(self.client.get('/api/_metrics/').status_code, 403)
+
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get('/api/_metrics/?recent=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('GET /api/cart/', response.data['endpoints'])
+        self.assertEqual(len(response.data['recent']), 1)
+        self.assertEqual(self.client.get('/api/_metrics/?recent=x').status_code, 400)
+
+        self.assertEqual(self.client.delete('/api/_metrics/').status_code, 204)
+        self.assertNotIn('GET /api/cart/', profile_store.report()['endpoints'])
+
+    def test_perf_report_command(self):
+        """Тест: perf_report выводит эндпоинты из сохранённого отчёта"""
+        self.create_order()
+        self.client.get('/api/orders/')
+        self.client.get('/api/cart/')
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+            json.dump(profile_store.report(), f)
+        self.addCleanup(os.remove, f.name)
+
+        out = StringIO()
+        call_command('perf_report', file=f.name, sort='queries', limit=1, stdout=out)
+        self.assertIn('1 endpoints', out.getvalue())
+        self.assertIn('GET /api/', out.getvalue())
+
+        profile_store.reset()
+        with self.assertRaises(CommandError):
+            call_command('perf_report', stdout=StringIO())
+
+
+class BenchmarkGeneratorTestCase(TestCase):
+
+    def test_price_list_is_deterministic(self):
+        """Тест: генератор повторяет данные при том же seed и формат data/shop1.yaml"""
+        data = generator.price_list(1, 10, 6, seed=1)
+        self.assertEqual(data, generator.price_list(1, 10, 6, seed=1))
+        self.assertNotEqual(data, generator.price_list(1, 10, 6, seed=2))
+        self.assertEqual(set(data), {'shop', 'categories', 'goods'})
+        self.assertEqual(set(data['goods'][0]),
+                         {'id', 'category', 'model', 'name', 'price', 'price_rrc', 'quantity', 'parameters'})
+        self.assertEqual(len(data['goods'][0]['parameters']), 6)
+
+    def test_generated_data(self):
+        """Тест: соседние магазины делят половину товаров, пользователи получают заказы и корзины"""
+        for data in generator.catalog(2, 10, 4):
+            PriceListImporter().import_data(data)
+        self.assertEqual(ProductInfo.objects.count(), 20)
+        self.assertEqual(Product.objects.count(), 15)
+
+        users = generator.create_users(3)
+        self.assertTrue(all(user.auth_token and user.contacts.exists() for user in users))
+        self.assertEqual(generator.create_orders(users, 2), 6)
+        generator.fill_carts(users, 2)
+        self.assertEqual(OrderItem.objects.filter(order__status='new').count(), 6)
+        order = Order.objects.exclude(status='new').order_by('id').first()
+        self.assertEqual(order.total, sum(item.price * item.quantity for item in order.items.all()))
+
+    def test_measure(self):
+        """Тест: measure() считает запросы к базе на операцию без прогревочного вызова"""
+        result = measure(lambda: list(Shop.objects.all()), 5)
+        self.assertEqual((result['iterations'], result['queries_per_op']), (5, 1))
+        self.assertGreater(result['peak_memory_kb'], 0)
+
+
+class AdminTestCase(CatalogTestCase):
+    """Списки админки больших таблиц и массовые действия"""
+
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_superuser(username='admin@example.com', password='adminpassword')
+        self.client = Client()
+        self.client.force_login(self.admin)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), [query['sql'] for query in queries]
+
+    def test_changelist_query_count(self):
+        """Тест: число запросов списка не зависит от числа строк, COUNT(*) по всей таблице не выполняется"""
+        PriceListImporter().import_data(make_price_list(5))
+        order = Order.objects.create(user=self.admin, status='completed')
+        OrderItem.objects.create(order=order, product=Product.objects.first(), shop=Shop.objects.first(), quantity=1)
+        urls = ['/admin/backend/productinfo/', '/admin/backend/productparameter/', '/admin/backend/orderitem/',
+                '/admin/backend/order/', '/admin/backend/productinfo/?shop__id__exact=1']
+        small = {url: self.count_queries(url)[0] for url in urls}
+
+        PriceListImporter().import_data(make_price_list(40))
+        for offer in ProductInfo.objects.all()[:20]:
+            order = Order.objects.create(user=self.admin, status='completed')
+            OrderItem.objects.create(order=order, product=offer.product, shop=offer.shop, quantity=1)
+        for url in urls:
+            count, queries = self.count_queries(url)
+            self.assertEqual(count, small[url], url)
+            self.assertFalse([sql for sql in queries if 'COUNT(*)' in sql and 'WHERE' not in sql], url)
+
+    def test_estimated_count_paginator(self):
+        """Тест: без фильтров число строк оценивается, с фильтром COUNT(*) ограничен max_count"""
+        PriceListImporter().import_data(make_price_list(30))
+        paginator = EstimatedCountPaginator(ProductInfo.objects.order_by('-id'), 10)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertGreaterEqual(paginator.count, 30)
+        self.assertFalse([query['sql'] for query in queries if 'COUNT(' in query['sql']])
+
+        paginator = EstimatedCountPaginator(ProductInfo.objects.filter(price__gte=0).order_by('-id'), 10)
+        paginator.max_count = 12
+        self.assertEqual((paginator.count, paginator.num_pages), (12, 2))
+
+    def test_mark_out_of_stock(self):
+        """Тест: снятие с продажи одним UPDATE с устареванием кеша каталога магазина, импорт возвращает остаток"""
+        data = make_price_list(6)
+        PriceListImporter().import_data(data)
+        offers = list(ProductInfo.objects.order_by('id')[:3])
+        shop_id = offers[0].shop_id
+        version = get_shop_versions([shop_id])[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/admin/backend/productinfo/', {
+                'action': 'mark_out_of_stock', '_selected_action': [offer.id for offer in offers],
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(ProductInfo.objects.filter(quantity=0, id__in=[offer.id for offer in offers]).count(), 3)
+        self.assertNotEqual(get_shop_versions([shop_id])[0], version)
+
+        PriceListImporter().import_data(data)
+        self.assertEqual(list(ProductInfo.objects.filter(id__in=[offer.id for offer in offers])
+                              .order_by('id').values_list('quantity', flat=True)),
+                         [offer.quantity for offer in offers])
+
+    def test_delete_selected(self):
+        """Тест: удаление предложений удаляет параметры и поисковые документы, пересчитывает фасеты"""
+        PriceListImporter().import_data(make_price_list(6))
+        ids = list(ProductInfo.objects.order_by('id').values_list('id', flat=True)[:4])
+        data = {'action': 'delete_selected', '_selected_action': ids}
+        response = self.client.post('/admin/backend/productinfo/', data)
+        self.assertContains(response, f'{ProductParameter._meta.verbose_name_plural}: 8')
+
+        facets_before = stored_facet_counts(224)
+        response = self.client.post('/admin/backend/productinfo/', {**data, 'post': 'yes'})
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(ProductInfo.objects.filter(id__in=ids).exists())
+        self.assertEqual(ProductInfo.objects.count(), 2)
+        self.assertFalse(ProductParameter.objects.filter(product_info_id__in=ids).exists())
+        self.assertFalse(ProductSearchDocument.objects.filter(product_info_id__in=ids).exists())
+        self.assertNotEqual(stored_facet_counts(224), facets_before)
+
+    def test_change_form_updates_indexes(self):
+        """Тест: правка предложения с параметрами в форме обновляет поиск, фасеты и кеш каталога"""
+        PriceListImporter().import_data(make_price_list(4))
+        offer = ProductInfo.objects.filter(product__category_id=224).order_by('id').first()
+        parameters = list(offer.parameters.order_by('id'))
+        version = get_shop_versions([offer.shop_id])[0]
+        data = {
+            'product': offer.product_id, 'shop': offer.shop_id, 'external_id': offer.external_id,
+            'model': offer.model, 'name': 'Переименованный товар', 'quantity': offer.quantity,
+            'price': offer.price, 'price_rrc': offer.price_rrc,
+            'parameters-TOTAL_FORMS': len(parameters), 'parameters-INITIAL_FORMS': len(parameters),
+            'parameters-MIN_NUM_FORMS': 0, 'parameters-MAX_NUM_FORMS': 1000,
+        }
+        for i, parameter in enumerate(parameters):
+            data.update({
+                f'parameters-{i}-id': parameter.id, f'parameters-{i}-product_info': offer.id,
+                f'parameters-{i}-parameter': parameter.parameter_id,
+                f'parameters-{i}-value': 'белый' if parameter.parameter.name == 'Цвет' else parameter.value,
+            })
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/admin/backend/productinfo/{offer.id}/change/', data)
+        self.assertEqual(response.status_code, 302)
+
+        self.assertEqual(get_search_index().search('переименованный'), [offer.id])
+        self.assertEqual(stored_facet_counts(224)['Цвет'], {'белый': 1, 'черный': 1})
+        self.assertNotEqual(get_shop_versions([offer.shop_id])[0], version)
+        self.assertEqual(ProductInfo.objects.values_list('reserved', 'content_hash').get(id=offer.id), (0, ''))
+
+    def test_order_status_actions(self):
+        """Тест: массовая смена статуса не трогает корзины"""
+        cart = Order.objects.create(user=self.admin, status='new')
+        order = Order.objects.create(user=self.admin, status='in_progress')
+        self.client.post('/admin/backend/order/', {
+            'action': 'mark_completed', '_selected_action': [cart.id, order.id],
+        })
+        cart.refresh_from_db()
+        order.refresh_from_db()
+        self.assertEqual((cart.status, order.status), ('new', 'completed'))
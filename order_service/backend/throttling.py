@@ -0,0 +1,81 @@
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Mapping
+
+from django.conf import settings
+from rest_framework.throttling import BaseThrottle
+
+
+class TokenBucketLimiter:
+    """
+    Ведёрки токенов в памяти процесса: capacity попыток подряд, затем одна
+    попытка каждые refill_seconds. Число ведёрок ограничено max_entries,
+    давно не использовавшиеся вытесняются
+    """
+
+    def __init__(self, capacity, refill_seconds, max_entries=10000):
+        self.capacity = capacity
+        self.refill_seconds = refill_seconds
+        self.max_entries = max_entries
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def consume(self, key):
+        """
+        Забирает токен из ведёрка key. Возвращает 0, если попытка разрешена,
+        иначе через сколько секунд появится следующий токен
+        """
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.buckets.pop(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - updated) / self.refill_seconds)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0
+            else:
+                wait = (1 - tokens) * self.refill_seconds
+            self.buckets[key] = (tokens, now)
+            if len(self.buckets) > self.max_entries:
+                self.buckets.popitem(last=False)
+        return wait
+
+    def reset(self):
+        with self.lock:
+            self.buckets.clear()
+
+
+_limiters = {}
+
+
+def get_limiter(scope):
+    limiter = _limiters.get(scope)
+    if limiter is None:
+        capacity, refill_seconds = settings.LOGIN_RATE_LIMITS[scope]
+        limiter = _limiters.setdefault(scope, TokenBucketLimiter(capacity, refill_seconds))
+    return limiter
+
+
+def reset_limiters():
+    _limiters.clear()
+
+
+class LoginRateThrottle(BaseThrottle):
+    """
+    Ограничивает попытки входа и регистрации отдельными ведёрками на IP и на
+    аккаунт (email). Throttle проверяется до вызова обработчика, поэтому
+    отклонённая попытка не тратит CPU на хеширование пароля
+    """
+    wait_time = 0
+
+    def allow_request(self, request, view):
+        waits = [get_limiter('ip').consume(self.get_ident(request))]
+        # Тело может быть JSON-списком или строкой: тогда лимит только по IP
+        email = request.data.get('email') if isinstance(request.data, Mapping) else None
+        if email:
+            waits.append(get_limiter('account').consume(str(email).casefold()))
+        self.wait_time = max(waits)
+        return not self.wait_time
+
+    def wait(self):
+        return self.wait_time
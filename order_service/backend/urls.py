@@ -1,15 +1,31 @@
+from django.conf import settings
 from django.urls import path
 from django.http import JsonResponse
 from backend.views import (
     ImportProductsAPIView,
+    ImportJobAPIView,
     LoginAPIView,
+    LogoutAPIView,
     RegisterAPIView,
     ProductListAPIView,
+    ProductSearchAPIView,
+    ProductOffersAPIView,
+    CatalogExportAPIView,
     CartAPIView,
+    CartBulkAPIView,
     ContactAPIView,
     ConfirmOrderAPIView,
     OrderHistoryAPIView,
+    MetricsAPIView,
 )
+from backend.async_views import AsyncProductListAPIView, AsyncCartAPIView, AsyncOrderHistoryAPIView
+
+# Под ASGI с ASYNC_VIEWS=1 читающие представления каталога, корзины и
+# истории заказов обрабатываются в цикле событий (см. settings.ASYNC_VIEWS)
+if settings.ASYNC_VIEWS:
+    ProductListView, CartView, OrderHistoryView = AsyncProductListAPIView, AsyncCartAPIView, AsyncOrderHistoryAPIView
+else:
+    ProductListView, CartView, OrderHistoryView = ProductListAPIView, CartAPIView, OrderHistoryAPIView
 
 
 def root_view(request):
@@ -18,11 +34,18 @@ def root_view(request):
 
 urlpatterns = [
     path('import-products/', ImportProductsAPIView.as_view(), name='import-products'),
+    path('import-jobs/<int:pk>/', ImportJobAPIView.as_view(), name='import-job'),
     path('login/', LoginAPIView.as_view(), name='login'),
+    path('logout/', LogoutAPIView.as_view(), name='logout'),
     path('register/', RegisterAPIView.as_view(), name='register'),
-    path('products/', ProductListAPIView.as_view(), name='product-list'),
-    path('cart/', CartAPIView.as_view(), name='cart'),
+    path('products/', ProductListView.as_view(), name='product-list'),
+    path('products/search/', ProductSearchAPIView.as_view(), name='product-search'),
+    path('products/<int:pk>/offers/', ProductOffersAPIView.as_view(), name='product-offers'),
+    path('products/export/<str:export_format>/', CatalogExportAPIView.as_view(), name='catalog-export'),
+    path('cart/', CartView.as_view(), name='cart'),
+    path('cart/bulk/', CartBulkAPIView.as_view(), name='cart-bulk'),
     path('contacts/', ContactAPIView.as_view(), name='contacts'),
     path('confirm-order/', ConfirmOrderAPIView.as_view(), name='confirm-order'),
-    path('orders/', OrderHistoryAPIView.as_view(), name='order-history'),
+    path('orders/', OrderHistoryView.as_view(), name='order-history'),
+    path('_metrics/', MetricsAPIView.as_view(), name='metrics'),
 ]
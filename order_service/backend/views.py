@@ -1,16 +1,40 @@
+from collections.abc import Mapping
+
 from rest_framework import status
 from rest_framework.generics import ListAPIView
-from rest_framework.filters import SearchFilter
 from rest_framework.authtoken.models import Token
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from django.contrib.auth import authenticate
-from django.http import JsonResponse
+from django.db import IntegrityError, transaction
+from django.http import StreamingHttpResponse
+from django.middleware.gzip import re_accepts_gzip
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from django.utils.text import compress_sequence
 from rest_framework.views import APIView
-from .models import Shop, Category, Product, ProductInfo, Parameter, ProductParameter, CustomUser, ProductInfo, Order, \
-    Contact, OrderItem
-from .serializers import ProductInfoSerializer, OrderItemSerializer, ContactSerializer
-import yaml
+from celery.result import AsyncResult
+from .models import Shop, Product, ProductInfo, CustomUser, Order, Contact, ImportJob
+from .serializers import ProductCatalogSerializer, ImportJobSerializer, OrderHistorySerializer, \
+    FastProductCatalogSerializer, FastOrderItemSerializer, FastContactSerializer
+from .pagination import CatalogCursorPagination, OrderHistoryPagination
+from .filters import ProductSearchFilter, ProductFacetFilter, OrderHistoryFilter
+from .facets import stored_facet_counts, live_facet_counts
+from .caching import CatalogCacheMixin
+from .search import get_search_index
+from .throttling import LoginRateThrottle
+from .reservations import OutOfStock, set_cart_item, set_cart_items, remove_cart_items, confirm_cart
+from .exporting import EXPORT_CHUNK_SIZE, EXPORT_FORMATS, export_validators
+from .tasks import import_price_list, send_order_notifications
+from .profiling import profile_store
+
+
+def parse_ids(*values):
+    """
+    Приводит id из тела запроса к int, пустые значения — к None. Для
+    нечисловых значений (строки, списки) бросает TypeError или ValueError
+    """
+    return [int(value) if value not in (None, '') else None for value in values]
 
 
 class ImportProductsAPIView(APIView):
@@ -20,69 +44,43 @@ class ImportProductsAPIView(APIView):
 
     def post(self, request, *args, **kwargs):
         if not request.user.is_authenticated:
-            return JsonResponse({'status': False, 'error': 'Authentication required'}, status=403)
+            return Response({'status': False, 'error': 'Authentication required'}, status=403)
 
         # Только пользователи с ролью shop могут загружать товары
         if not hasattr(request.user, 'type') or request.user.type != 'shop':
-            return JsonResponse({'status': False, 'error': 'Only shops can upload products'}, status=403)
+            return Response({'status': False, 'error': 'Only shops can upload products'}, status=403)
 
         # Получаем файл из запроса
         yaml_file = request.FILES.get('file')
         if not yaml_file:
-            return JsonResponse({'status': False, 'error': 'YAML file is required'}, status=400)
+            return Response({'status': False, 'error': 'YAML file is required'}, status=400)
 
-        # Загрузка и парсинг YAML файла
-        try:
-            data = yaml.safe_load(yaml_file)
-        except yaml.YAMLError as e:
-            return JsonResponse({'status': False, 'error': f'YAML parsing error: {e}'}, status=400)
+        # Сохраняем файл и передаём импорт в Celery, ответ возвращается сразу
+        job = ImportJob.objects.create(user=request.user, file=yaml_file)
+        async_result = import_price_list.delay(job.id)
+        ImportJob.objects.filter(id=job.id).update(task_id=async_result.id)
 
-        # Импортируем данные в базу
-        try:
-            shop, _ = Shop.objects.get_or_create(name=data['shop'])
-
-            # Импортируем категории
-            for category in data['categories']:
-                category_object, _ = Category.objects.get_or_create(
-                    id=category['id'],
-                    defaults={'name': category['name']}
-                )
-                category_object.shops.add(shop)
-                category_object.save()
-
-            # Удаляем текущие товары магазина
-            ProductInfo.objects.filter(shop=shop).delete()
-
-            # Импортируем товары
-            for item in data['goods']:
-                product, _ = Product.objects.get_or_create(
-                    name=item['name'],
-                    category_id=item['category']
-                )
-
-                product_info = ProductInfo.objects.create(
-                    product=product,
-                    shop=shop,
-                    external_id=item['id'],
-                    model=item['model'],
-                    price=item['price'],
-                    price_rrc=item['price_rrc'],
-                    quantity=item['quantity']
-                )
-
-                # Импортируем параметры товара
-                for name, value in item['parameters'].items():
-                    parameter_object, _ = Parameter.objects.get_or_create(name=name)
-                    ProductParameter.objects.create(
-                        product_info=product_info,
-                        parameter=parameter_object,
-                        value=value
-                    )
-
-            return JsonResponse({'status': True, 'message': 'Products imported successfully'}, status=201)
-
-        except Exception as e:
-            return JsonResponse({'status': False, 'error': f'Error during import: {e}'}, status=500)
+        return Response({'status': True, 'message': 'Import scheduled', 'job_id': job.id}, status=202)
+
+
+class ImportJobAPIView(APIView):
+    """
+    API для просмотра статуса фонового импорта
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        job = ImportJob.objects.filter(id=pk, user=request.user).first()
+        if not job:
+            return Response({'error': 'Задача импорта не найдена'}, status=404)
+
+        data = ImportJobSerializer(job).data
+        # Пока импорт идёт, количество обработанных строк берём из состояния задачи Celery
+        if job.status == 'running' and job.task_id:
+            info = AsyncResult(job.task_id).info
+            if isinstance(info, dict):
+                data['rows_processed'] = info.get('rows_processed', data['rows_processed'])
+        return Response(data, status=200)
 
 
 class LoginAPIView(APIView):
@@ -90,8 +88,12 @@ class LoginAPIView(APIView):
     API View для входа пользователя (авторизация)
     """
     permission_classes = [AllowAny]
+    # Лимит попыток проверяется до хеширования пароля
+    throttle_classes = [LoginRateThrottle]
 
     def post(self, request):
+        if not isinstance(request.data, Mapping):
+            return Response({'error': 'Email и пароль обязательны'}, status=400)
         email = request.data.get('email')
         password = request.data.get('password')
 
@@ -107,14 +109,30 @@ class LoginAPIView(APIView):
         return Response({'error': 'Неверные учетные данные'}, status=400)
 
 
+class LogoutAPIView(APIView):
+    """
+    API View для выхода: токен удаляется и сразу перестаёт приниматься
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        if isinstance(request.auth, Token):
+            request.auth.delete()
+        return Response({'message': 'Вы вышли из системы'}, status=200)
+
+
 class RegisterAPIView(APIView):
     """
     API View для регистрации пользователя
     """
     permission_classes = [AllowAny]
+    # Лимит попыток проверяется до хеширования пароля
+    throttle_classes = [LoginRateThrottle]
 
     def post(self, request):
         data = request.data
+        if not isinstance(data, Mapping):
+            return Response({'error': 'Все поля обязательны'}, status=400)
         email = data.get('email')
         first_name = data.get('first_name')
         last_name = data.get('last_name')
@@ -137,79 +155,316 @@ class RegisterAPIView(APIView):
         return Response({'message': 'Пользователь успешно зарегистрирован'}, status=201)
 
 
-class ProductListAPIView(ListAPIView):
+class ProductListAPIView(CatalogCacheMixin, ListAPIView):
     """
     API для получения списка товаров
+
+    Поддерживает курсорную пагинацию по id и выбор полей через ?fields=id,name,price.
+    Страница строится из values_list() через FastProductCatalogSerializer: в
+    запрос попадают только нужные для полей столбцы и JOIN, параметры товаров
+    читаются вторым запросом, если они запрошены.
+
+    Ответы кешируются до следующего импорта магазинов, товары которых в них входят.
+
+    С ?facets=1 в ответ добавляются счётчики товаров по значениям параметров.
+    Без фильтров (или только с ?category=) они читаются из таблицы ParameterFacet,
+    иначе считаются одним агрегирующим запросом по отфильтрованной выборке.
     """
     queryset = ProductInfo.objects.all()
-    serializer_class = ProductInfoSerializer
-    filter_backends = [SearchFilter]
-    search_fields = ['name', 'product__category__name']  # Фильтрация по названию и категории
+    serializer_class = ProductCatalogSerializer
+    pagination_class = CatalogCursorPagination
+    # Поиск по названию, модели, категории и параметрам; фильтры по цене, остатку и параметрам
+    filter_backends = [ProductSearchFilter, ProductFacetFilter]
+
+    def get_requested_fields(self):
+        fields = self.request.query_params.get('fields')
+        if not fields:
+            return None
+        return [name for name in fields.split(',') if name in self.serializer_class.Meta.fields] or None
+
+    def list(self, request, *args, **kwargs):
+        serializer = FastProductCatalogSerializer(self.get_requested_fields())
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(serializer.rows(queryset))
+        response = self.get_paginated_response(serializer.to_representation(page))
+        if request.query_params.get('facets') in ('1', 'true'):
+            response.data['facets'] = self.get_facets()
+        return response
+
+    def use_live_facets(self):
+        params = self.request.query_params
+        live_params = [ProductSearchFilter.search_param,
+                       *(param for param in ProductFacetFilter.facet_params if param != 'category')]
+        return any(params.get(param) for param in live_params)
+
+    def get_facet_category(self):
+        category = self.request.query_params.get('category')
+        return int(category) if category else None
+
+    def get_facets(self):
+        if self.use_live_facets():
+            return live_facet_counts(self.filter_queryset(ProductInfo.objects.all()))
+        return stored_facet_counts(self.get_facet_category())
+
+
+class ProductSearchAPIView(ProductListAPIView):
+    """
+    API поиска товаров с ранжированием по релевантности (для автодополнения)
+
+    Запрос ?q= разбивается на токены, каждый ищется как префикс, результат
+    содержит товары, подходящие под все токены.
+    """
+    pagination_class = None
+    filter_backends = []
+    max_limit = 100
+
+    def list(self, request, *args, **kwargs):
+        query = request.query_params.get('q', '')
+        try:
+            limit = max(min(int(request.query_params.get('limit', 20)), self.max_limit), 1)
+        except ValueError:
+            return Response({'error': 'limit должен быть числом'}, status=400)
+
+        ids = get_search_index().search(query, limit)
+        serializer = FastProductCatalogSerializer(self.get_requested_fields())
+        rows = {row.id: row for row in serializer.rows(self.get_queryset().filter(id__in=ids))}
+        return Response(serializer.to_representation([rows[pk] for pk in ids if pk in rows]))
+
+
+class ProductOffersAPIView(APIView):
+    """
+    API предложений товара от разных магазинов
+
+    Возвращает предложения в наличии от самого дешёвого; best — лучшее из них.
+    """
+    permission_classes = [AllowAny]
+    max_limit = 100
+    fields = ['id', 'shop', 'shop_name', 'price', 'price_rrc', 'quantity']
+
+    def get(self, request, pk):
+        try:
+            limit = max(min(int(request.query_params.get('limit', 10)), self.max_limit), 1)
+        except ValueError:
+            return Response({'error': 'limit должен быть числом'}, status=400)
+
+        offers = list(ProductInfo.objects.filter(product_id=pk).offers().select_related('shop')[:limit])
+        if not offers and not Product.objects.filter(id=pk).exists():
+            return Response({'error': 'Указанный продукт не найден'}, status=404)
+
+        data = ProductCatalogSerializer(offers, many=True, fields=self.fields).data
+        return Response({'product': pk, 'best': data[0] if data else None, 'offers': data}, status=200)
+
+
+class CatalogExportAPIView(APIView):
+    """
+    Потоковая выгрузка каталога: csv, jsonl (объекты /api/products/) или yaml
+    в формате data/shop1.yaml, целиком или по магазину (?shop=<id>)
+
+    Строки читаются курсором пачками по chunk_size и сразу отдаются клиенту,
+    память не зависит от размера каталога. При Accept-Encoding: gzip поток
+    сжимается на лету. ETag и Last-Modified считаются от времени последнего
+    импорта и изменения остатков магазинов, условные запросы получают 304 без
+    обращения к товарам.
+    """
+    permission_classes = [AllowAny]
+    chunk_size = EXPORT_CHUNK_SIZE
+
+    def perform_content_negotiation(self, request, force=False):
+        # Тип тела определяет формат из URL, а не Accept
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request, export_format):
+        if export_format not in EXPORT_FORMATS:
+            return Response({'error': f'Формат должен быть одним из: {", ".join(EXPORT_FORMATS)}'}, status=404)
+        content_type, export = EXPORT_FORMATS[export_format]
+
+        shops = Shop.objects.order_by('id')
+        shop_id = request.query_params.get('shop')
+        if shop_id is not None:
+            if not shop_id.isdigit():
+                return Response({'error': 'shop должен быть числом'}, status=400)
+            shops = shops.filter(id=shop_id)
+        shops = list(shops.only('id', 'name', 'imported_at'))
+        if shop_id is not None and not shops:
+            return Response({'error': 'Магазин не найден'}, status=404)
+
+        gzip = bool(re_accepts_gzip.search(request.META.get('HTTP_ACCEPT_ENCODING', '')))
+        etag, last_modified = export_validators(shops, export_format, gzip)
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified and int(last_modified.timestamp()),
+        )
+        if response is None:
+            if export_format == 'yaml':
+                content = export(shops, self.chunk_size)
+            else:
+                products = ProductInfo.objects.all()
+                if shop_id is not None:
+                    products = products.filter(shop_id=shop_id)
+                content = export(products, self.chunk_size)
+            if gzip:
+                content = compress_sequence(content)
+            response = StreamingHttpResponse(content, content_type=content_type)
+            if gzip:
+                response['Content-Encoding'] = 'gzip'
+            name = f'shop-{shop_id}' if shop_id is not None else 'catalog'
+            response['Content-Disposition'] = f'attachment; filename="{name}.{export_format}"'
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified.timestamp())
+        patch_vary_headers(response, ['Accept-Encoding'])
+        return response
 
 
 class CartAPIView(APIView):
     """
     API для работы с корзиной пользователя
+
+    Добавленное количество резервируется на складе магазина (учитывается в
+    ProductInfo.reserved) на CART_RESERVATION_TTL секунд; неподтверждённые
+    резервы снимает задача release_expired_reservations.
     """
+    permission_classes = [IsAuthenticated]
 
     def get(self, request):
         cart = Order.objects.filter(user=request.user, status='new').first()
         if not cart:
             return Response({'message': 'Корзина пуста'}, status=200)
 
-        items = cart.items.all()
-        serializer = OrderItemSerializer(items, many=True)
-        return Response(serializer.data, status=200)
+        return Response(FastOrderItemSerializer().serialize(cart.items.all()), status=200)
 
     def post(self, request):
+        if not isinstance(request.data, Mapping):
+            return Response({'error': 'Необходимо указать product_id и quantity'}, status=400)
         product_id = request.data.get('product_id')
         quantity = request.data.get('quantity')
+        shop_id = request.data.get('shop_id')
 
         if not product_id or not quantity:
             return Response({'error': 'Необходимо указать product_id и quantity'}, status=400)
-
         try:
-            # Получаем или создаём новую корзину
-            cart, _ = Order.objects.get_or_create(user=request.user, status='new')
-
-            # Получаем продукт
-            product = Product.objects.get(id=product_id)
-
-            # Получаем магазин, связанный с продуктом
-            product_info = ProductInfo.objects.filter(product=product).first()
-            if not product_info:
-                return Response({'error': 'Информация о продукте не найдена'}, status=404)
-
-            shop = product_info.shop
-
-            # Создаём или обновляем товар в корзине
-            order_item, created = OrderItem.objects.get_or_create(
-                order=cart,
-                product=product,
-                shop=shop,  # Устанавливаем значение для обязательного поля shop
-                defaults={'quantity': quantity}
-            )
-
-            # Обновляем количество, если товар уже существует в корзине
-            if not created:
-                order_item.quantity = quantity
-                order_item.save()
-
-            return Response({'message': 'Товар добавлен в корзину'}, status=201)
-        except Product.DoesNotExist:
+            quantity = int(quantity)
+        except (TypeError, ValueError):
+            quantity = 0
+        if quantity < 1:
+            return Response({'error': 'quantity должно быть положительным числом'}, status=400)
+        try:
+            product_id, shop_id = parse_ids(product_id, shop_id)
+        except (TypeError, ValueError):
+            return Response({'error': 'product_id и shop_id должны быть числами'}, status=400)
+
+        if not Product.objects.filter(id=product_id).exists():
             return Response({'error': 'Указанный продукт не найден'}, status=404)
 
+        # Предложение магазина из shop_id, иначе самое дешёвое в наличии. Если в
+        # наличии ничего нет, берётся любое, и резерв ниже ответит 409
+        offers = ProductInfo.objects.filter(product_id=product_id)
+        if shop_id:
+            offers = offers.filter(shop_id=shop_id)
+        product_info = offers.offers().first() or offers.order_by('id').first()
+        if not product_info:
+            return Response({'error': 'Информация о продукте не найдена'}, status=404)
+
+        # Количество резервируется на складе в той же транзакции, что и изменение корзины
+        try:
+            set_cart_item(request.user, product_info.product_id, product_info.shop_id, quantity)
+        except OutOfStock as e:
+            return Response({'error': str(e)}, status=409)
+        except IntegrityError:
+            return Response({'error': 'Корзина изменена параллельным запросом, повторите попытку'}, status=409)
+
+        return Response({'message': 'Товар добавлен в корзину'}, status=201)
+
     def delete(self, request):
-        item_id = request.data.get('item_id')
-        OrderItem.objects.filter(id=item_id).delete()
+        if not isinstance(request.data, Mapping):
+            return Response({'error': 'Необходимо указать item_id'}, status=400)
+        try:
+            item_id, = parse_ids(request.data.get('item_id'))
+        except (TypeError, ValueError):
+            return Response({'error': 'item_id должен быть числом'}, status=400)
+        remove_cart_items(request.user, [item_id])
         return Response({'message': 'Удалено из корзины'}, status=204)
 
 
+class CartBulkAPIView(APIView):
+    """
+    API для пакетного добавления товаров в корзину
+
+    Принимает {"items": [{"product_id": 1, "shop_id": 2, "quantity": 3}, ...]};
+    shop_id выбирает предложение магазина, без него берётся лучшее. Все строки
+    разрешаются и резервируются за постоянное число запросов в одной
+    транзакции, в ответе результат по каждой строке в исходном порядке.
+    """
+    permission_classes = [IsAuthenticated]
+    max_items = 500
+
+    def post(self, request):
+        lines = request.data.get('items') if isinstance(request.data, Mapping) else None
+        if not isinstance(lines, list) or not lines:
+            return Response({'error': 'Необходимо указать список items'}, status=400)
+        if len(lines) > self.max_items:
+            return Response({'error': f'Не больше {self.max_items} позиций за запрос'}, status=400)
+
+        results = [self.parse_line(line) for line in lines]
+        parsed = [result for result in results if 'error' not in result]
+
+        # Предложения всех товаров одним запросом; без shop_id берётся самое
+        # дешёвое в наличии, как в CartAPIView
+        offers = set()
+        best_offers = {}
+        any_offers = {}
+        for product_id, shop_id, available in ProductInfo.objects \
+                .filter(product_id__in={r['product_id'] for r in parsed}) \
+                .order_by('price', 'id').values_list('product_id', 'shop_id', 'available'):
+            offers.add((product_id, shop_id))
+            (best_offers if available > 0 else any_offers).setdefault(product_id, shop_id)
+
+        seen = set()
+        for result in parsed:
+            if result['shop_id'] is None:
+                result['shop_id'] = best_offers.get(result['product_id'], any_offers.get(result['product_id']))
+            key = result['product_id'], result['shop_id']
+            if key not in offers:
+                result['error'] = 'Предложение магазина не найдено'
+            elif key in seen:
+                result['error'] = 'Позиция повторяется в запросе'
+            seen.add(key)
+
+        valid = [result for result in parsed if 'error' not in result]
+        try:
+            items = valid and set_cart_items(request.user, [(r['product_id'], r['shop_id'], r['quantity']) for r in valid])
+        except IntegrityError:
+            return Response({'error': 'Корзина изменена параллельным запросом, повторите попытку'}, status=409)
+        for result, item in zip(valid, items):
+            if item is None:
+                result['error'] = 'Недостаточно товара на складе'
+            else:
+                result['item_id'] = item.id
+
+        for result in results:
+            result['status'] = 'error' if 'error' in result else 'ok'
+        return Response({'results': results}, status=200)
+
+    @staticmethod
+    def parse_line(line):
+        if not isinstance(line, dict):
+            return {'error': 'Позиция должна быть объектом'}
+        result = {'product_id': line.get('product_id'), 'shop_id': line.get('shop_id'),
+                  'quantity': line.get('quantity')}
+        try:
+            result['product_id'] = int(result['product_id'])
+            result['quantity'] = int(result['quantity'])
+            if result['shop_id'] is not None:
+                result['shop_id'] = int(result['shop_id'])
+        except (TypeError, ValueError):
+            return {**result, 'error': 'product_id, shop_id и quantity должны быть числами'}
+        if result['quantity'] < 1:
+            return {**result, 'error': 'quantity должно быть положительным числом'}
+        return result
+
+
 class ContactAPIView(APIView):
     def get(self, request):
-        contacts = Contact.objects.filter(user=request.user)
-        serializer = ContactSerializer(contacts, many=True)
-        return Response(serializer.data)
+        return Response(FastContactSerializer().serialize(Contact.objects.filter(user=request.user)))
 
     def post(self, request):
         data = request.data
@@ -227,53 +482,77 @@ class ContactAPIView(APIView):
 class ConfirmOrderAPIView(APIView):
     """
     API для подтверждения заказа пользователя
+
+    Покупатель (на email из contact_id) и магазины заказа получают письма
+    асинхронно, подтверждение не ждёт SMTP.
     """
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
+        if not isinstance(request.data, Mapping):
+            return Response({'error': 'ID заказа и ID контакта обязательны'}, status=400)
         order_id = request.data.get('order_id')
         contact_id = request.data.get('contact_id')
 
         if not order_id or not contact_id:
             return Response({'error': 'ID заказа и ID контакта обязательны'}, status=400)
-
-        # Проверим существование заказа
-        order = Order.objects.filter(id=order_id, user=request.user).first()
-        if not order:
-            return Response({'error': 'Заказ не найден'}, status=404)
+        try:
+            order_id, contact_id = parse_ids(order_id, contact_id)
+        except (TypeError, ValueError):
+            return Response({'error': 'order_id и contact_id должны быть числами'}, status=400)
 
         # Проверим существование контакта
         contact = Contact.objects.filter(id=contact_id, user=request.user).first()
         if not contact:
             return Response({'error': 'Контакт не найден'}, status=404)
 
-        # Обновляем статус заказа
-        order.status = 'in_progress'  # Или другой нужный статус
-        order.contact = contact
-        order.save()
+        # Резервы позиций становятся постоянными, цены и сумма фиксируются
+        try:
+            order = confirm_cart(request.user, order_id, contact)
+        except OutOfStock as e:
+            return Response({'error': str(e)}, status=409)
+        if not order:
+            return Response({'error': 'Заказ не найден или корзина пуста'}, status=404)
 
+        # Письма отправляет воркер; если брокер недоступен, уведомление
+        # останется в outbox и уйдёт при запуске по расписанию
+        transaction.on_commit(send_order_notifications.delay, robust=True)
         return Response({'message': 'Заказ успешно подтвержден', 'order_id': order.id}, status=200)
 
 
-class OrderHistoryAPIView(APIView):
+class OrderHistoryAPIView(ListAPIView):
     """
     API для просмотра истории заказов пользователя
+
+    Суммы заказов считаются в базе одним запросом на страницу.
+    Фильтры: ?status=, ?date_from=, ?date_to=
     """
     permission_classes = [IsAuthenticated]
+    serializer_class = OrderHistorySerializer
+    pagination_class = OrderHistoryPagination
+    filter_backends = [OrderHistoryFilter]
+
+    def get_queryset(self):
+        # Исключаем "новые" заказы
+        return Order.objects.filter(user=self.request.user).exclude(status='new').with_totals()
+
+
+class MetricsAPIView(APIView):
+    """
+    Показатели профилирования этого процесса (см. backend.profiling), только для персонала
+
+    GET: эндпоинты по убыванию суммарного времени и ?recent= последних профилей
+    (по умолчанию 50). DELETE: сброс накопленных показателей
+    """
+    permission_classes = [IsAdminUser]
 
     def get(self, request):
-        orders = Order.objects.filter(user=request.user).exclude(status='new')  # Исключаем "новые" заказы
-        data = []
-        for order in orders:
-            total_price = sum(
-                item.quantity * item.product.price
-                for item in order.items.all()
-            )
-            data.append({
-                'id': order.id,
-                'date': order.dt,
-                'status': order.status,
-                'total_price': total_price,
-            })
-
-        return Response(data, status=200)
\ No newline at end of file
+        try:
+            recent = max(int(request.query_params.get('recent', 50)), 0)
+        except ValueError:
+            return Response({'error': 'recent должен быть числом'}, status=400)
+        return Response(profile_store.report(recent))
+
+    def delete(self, request):
+        profile_store.reset()
+        return Response(status=204)
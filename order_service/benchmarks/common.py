@@ -0,0 +1,29 @@
+"""
+Общее для скриптов бенчмарков: настройка Django на временной базе и замеры
+времени. Данные для всех скриптов строит benchmarks.generator по seed
+"""
+import os
+import time
+
+
+def setup_django(database_name=None):
+    """Настраивает Django; с database_name — на этой базе SQLite вместо рабочей"""
+    if database_name is not None:
+        os.environ['DATABASE_NAME'] = str(database_name)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'orders.settings')
+    import django
+    django.setup()
+
+
+def mean_ms(function, repeat):
+    """Среднее время вызова function() в миллисекундах; первый вызов — прогрев, не учитывается"""
+    function()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def percentile(latencies, q):
+    """Перцентиль q в миллисекундах по ближайшему рангу; latencies в секундах и отсортированы"""
+    return latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000
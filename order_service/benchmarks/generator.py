@@ -0,0 +1,160 @@
+"""
+Детерминированный генератор данных для бенчмарков: прайс-листы в формате
+data/shop1.yaml на shops магазинов × goods товаров × parameters параметров,
+пользователи с контактами и токенами, корзины и история заказов.
+
+Одинаковые аргументы и seed дают одинаковые данные, поэтому замеры разных
+запусков сравнимы. Соседние магазины продают половину общих товаров по
+разным ценам, как в реальных прайс-листах
+"""
+import random
+from datetime import timedelta
+
+# Категории и параметры data/shop1.yaml; дальше список дополняется синтетическими
+CATEGORIES = [(224, 'Смартфоны'), (15, 'Аксессуары'), (1, 'Flash-накопители'), (5, 'Телевизоры')]
+COLORS = ['черный', 'белый', 'золотистый', 'красный', 'серебристый', 'синий']
+SEARCH_WORDS = ['Смартфон', 'Apple', 'Samsung', 'Xiaomi', 'Huawei', 'Honor', 'Nokia', 'Sony']
+PASSWORD = 'benchmark-password'
+
+
+def parameter_value(rng, index):
+    if index == 0:
+        return rng.choice([5.5, 5.8, 6.1, 6.5, 6.7])
+    if index == 1:
+        return rng.choice(['1792x828', '2688x1242', '2340x1080', '2400x1080'])
+    if index == 2:
+        return rng.choice([32, 64, 128, 256, 512])
+    if index == 3:
+        return rng.choice(COLORS)
+    return rng.randint(1, 20)
+
+
+def parameter_names(count):
+    names = ['Диагональ (дюйм)', 'Разрешение (пикс)', 'Встроенная память (Гб)', 'Цвет']
+    return (names + [f'Параметр {i}' for i in range(len(names) + 1, count + 1)])[:count]
+
+
+def categories(goods):
+    """Категории каталога (id, название): на каждые 500 товаров магазина добавляется одна"""
+    return CATEGORIES + [(1000 + i, f'Категория {i}') for i in range(max(goods // 500, 1))]
+
+
+def goods(shop, count, parameters, seed=0):
+    """
+    Товары прайс-листа магазина номер shop (с нуля) по одному. Товар i
+    магазина — товар shop * count // 2 + i общего каталога: половина товаров
+    совпадает с соседним магазином, цена и остаток у каждого магазина свои
+    """
+    rng = random.Random(f'{seed}:{shop}')
+    names = parameter_names(parameters)
+    category_ids = [category_id for category_id, _ in categories(count)]
+    for i in range(count):
+        number = shop * count // 2 + i
+        # Категория, модель и параметры — свойства товара, а не магазина
+        product_rng = random.Random(f'{seed}:product:{number}')
+        word = SEARCH_WORDS[number % len(SEARCH_WORDS)]
+        price = product_rng.randrange(1000, 150_000, 10)
+        yield {
+            'id': 4_000_000 + number,
+            'category': category_ids[number % len(category_ids)],
+            'model': f'{word.lower()}/model-{number // 4}',
+            'name': f'{word} модель {number // 4} ({COLORS[number % len(COLORS)]}) #{number}',
+            'price': price + rng.randrange(-500, 500, 10),
+            'price_rrc': price + 5000,
+            'quantity': rng.randint(1000, 5000),
+            'parameters': {name: parameter_value(product_rng, index) for index, name in enumerate(names)},
+        }
+
+
+def price_list(shop, goods_count, parameters, seed=0):
+    """Прайс-лист магазина номер shop в формате data/shop1.yaml, товары — goods()"""
+    return {
+        'shop': f'Benchmark Shop {shop}',
+        'categories': [{'id': category_id, 'name': name} for category_id, name in categories(goods_count)],
+        'goods': list(goods(shop, goods_count, parameters, seed)),
+    }
+
+
+def catalog(shops, goods_count, parameters, seed=0):
+    """Прайс-листы всех магазинов по одному, без хранения всех в памяти"""
+    for shop in range(shops):
+        yield price_list(shop, goods_count, parameters, seed)
+
+
+def create_users(count):
+    """
+    Пользователи bench{i}@example.com с email-контактом и токеном. Пароль
+    хешируется один раз, пользователи создаются пачкой
+    """
+    from django.contrib.auth import get_user_model
+    from django.contrib.auth.hashers import make_password
+    from rest_framework.authtoken.models import Token
+    from backend.models import Contact
+
+    User = get_user_model()
+    password = make_password(PASSWORD)
+    users = User.objects.bulk_create([
+        User(username=f'bench{i}@example.com', email=f'bench{i}@example.com', password=password)
+        for i in range(count)
+    ])
+    Contact.objects.bulk_create([Contact(user=user, type='email', value=user.email) for user in users])
+    Token.objects.bulk_create([Token(user=user, key=Token.generate_key()) for user in users])
+    return users
+
+
+def create_orders(users, orders_per_user, items_per_order=3, seed=0):
+    """
+    История заказов: orders_per_user подтверждённых заказов каждого
+    пользователя по items_per_order позиций со снимком цены и названия, как
+    после confirm_cart(). Даты заказов разнесены на год назад
+    """
+    from django.utils import timezone
+    from backend.models import Order, OrderItem, ProductInfo
+
+    rng = random.Random(f'{seed}:orders')
+    offers = {}
+    for product_id, shop_id, price, name in ProductInfo.objects.order_by('id') \
+            .values_list('product_id', 'shop_id', 'price', 'name'):
+        offers.setdefault((product_id, shop_id), (price, name))
+    offers = list(offers.items())
+    now = timezone.now()
+    orders, items = [], []
+    for user in users:
+        for _ in range(orders_per_user):
+            lines = rng.sample(offers, min(items_per_order, len(offers)))
+            quantities = [rng.randint(1, 3) for _ in lines]
+            orders.append(Order(user=user, status=rng.choice(['completed', 'completed', 'in_progress']),
+                                total=sum(price * quantity for (_, (price, _)), quantity in zip(lines, quantities))))
+            items.append(list(zip(lines, quantities)))
+    orders = Order.objects.bulk_create(orders, batch_size=1000)
+    # dt заполняется auto_now_add при создании, поэтому переписывается отдельно
+    for i, order in enumerate(orders):
+        order.dt = now - timedelta(hours=i % (24 * 365))
+    Order.objects.bulk_update(orders, ['dt'], batch_size=1000)
+    OrderItem.objects.bulk_create([
+        OrderItem(order=order, product_id=product_id, shop_id=shop_id, quantity=quantity, price=price,
+                  product_name=name)
+        for order, lines in zip(orders, items)
+        for ((product_id, shop_id), (price, name)), quantity in lines
+    ], batch_size=1000)
+    return len(orders)
+
+
+def offers(seed=0):
+    """Предложения каталога (product_id, shop_id) в постоянном порядке, перемешанные seed"""
+    from backend.models import ProductInfo
+
+    result = list(ProductInfo.objects.order_by('id').values_list('product_id', 'shop_id').distinct())
+    random.Random(f'{seed}:offers').shuffle(result)
+    return result
+
+
+def fill_carts(users, items_per_cart, seed=0):
+    """Корзины пользователей по items_per_cart позиций с резервом на складе, через set_cart_item()"""
+    from backend.reservations import set_cart_item
+
+    rng = random.Random(f'{seed}:carts')
+    available = offers(seed)
+    for user in users:
+        for product_id, shop_id in rng.sample(available, min(items_per_cart, len(available))):
+            set_cart_item(user, product_id, shop_id, rng.randint(1, 3))
@@ -0,0 +1,94 @@
+"""
+Сравнение JSON-рендереров на странице каталога из 10k товаров.
+
+Данные имеют вид ответа ProductListAPIView (цены строками, словарь
+параметров) плюс истории заказов с Decimal и datetime. Для каждого рендерера
+выводится среднее время render() и размер ответа, для парсеров — время
+разбора того же тела.
+
+Запуск из каталога order_service:
+    python -m benchmarks.json_renderers [--items 10000] [--repeat 20]
+"""
+import argparse
+import io
+import sys
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.common import mean_ms, setup_django  # noqa: E402
+
+
+def catalog_page(items):
+    return {
+        'next': None,
+        'previous': None,
+        'results': [
+            {
+                'id': i,
+                'name': f'Смартфон Apple iPhone XS Max 512GB (золотистый) {i}',
+                'price': f'{110000 + i % 5000}.00',
+                'quantity': i % 20,
+                'shop': i % 100 + 1,
+                'product': i // 2 + 1,
+                'model': f'apple/iphone/xs-max/{i}',
+                'price_rrc': f'{116990 + i % 5000}.00',
+                'shop_name': f'Связной {i % 100}',
+                'category': i % 50 + 1,
+                'category_name': 'Смартфоны',
+                'parameters': {'Диагональ (дюйм)': '6.5', 'Разрешение (пикс)': '2688x1242',
+                               'Встроенная память (Гб)': str(64 * (i % 4 + 1)), 'Цвет': 'золотистый'},
+            }
+            for i in range(items)
+        ],
+    }
+
+
+def order_history(items):
+    from django.utils import timezone
+
+    now = timezone.now()
+    return [
+        {'id': i, 'date': now - timedelta(minutes=i), 'status': 'completed',
+         'total_price': Decimal(f'{1000 + i % 9000}.50')}
+        for i in range(items)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=10_000, help='Товаров на странице')
+    parser.add_argument('--repeat', type=int, default=20, help='Повторов каждого замера')
+    args = parser.parse_args()
+
+    setup_django()
+    from rest_framework.parsers import JSONParser
+    from rest_framework.renderers import JSONRenderer
+    from backend.parsers import ORJSONParser, UJSONParser
+    from backend.renderers import orjson, ORJSONRenderer, UJSONRenderer
+
+    renderers = [JSONRenderer(), UJSONRenderer()] + ([ORJSONRenderer()] if orjson is not None else [])
+    parsers = [JSONParser(), UJSONParser()] + ([ORJSONParser()] if orjson is not None else [])
+
+    for title, data in (('catalog page', catalog_page(args.items)), ('order history', order_history(args.items))):
+        print(f'\n{title}, {args.items} items')
+        baseline = None
+        for renderer in renderers:
+            elapsed = mean_ms(lambda: renderer.render(data), args.repeat)
+            baseline = baseline or elapsed
+            size = len(renderer.render(data))
+            print(f'  {type(renderer).__name__:16} render {elapsed:8.2f} ms  x{baseline / elapsed:5.1f}  '
+                  f'{size / 1024:8.1f} KiB')
+
+        body = JSONRenderer().render(data)
+        baseline = None
+        for json_parser in parsers:
+            elapsed = mean_ms(lambda: json_parser.parse(io.BytesIO(body)), args.repeat)
+            baseline = baseline or elapsed
+            print(f'  {type(json_parser).__name__:16} parse  {elapsed:8.2f} ms  x{baseline / elapsed:5.1f}')
+
+
+if __name__ == '__main__':
+    main()
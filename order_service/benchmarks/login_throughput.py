@@ -0,0 +1,81 @@
+"""
+Пропускная способность входа: логинов в секунду на одно ядро.
+
+Во временной SQLite-базе создаётся пользователь benchmarks.generator, после
+чего LoginAPIView вызывается в одном потоке в течение --seconds секунд для
+каждой стоимости хеширования из --work-factors. Отдельно замеряется скорость
+отклонения попыток, упёршихся в лимит LoginRateThrottle: они не доходят до
+хеширования.
+
+Запуск из каталога order_service:
+    python -m benchmarks.login_throughput [--hasher pbkdf2_sha256] [--work-factors 100000,600000,1000000]
+"""
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks import generator  # noqa: E402
+from benchmarks.common import setup_django  # noqa: E402
+
+HASHERS = {
+    'pbkdf2_sha256': 'backend.hashers.PBKDF2PasswordHasher',
+    'scrypt': 'backend.hashers.ScryptPasswordHasher',
+}
+
+
+def run_logins(view, factory, email, password, seconds):
+    done = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        request = factory.post('/api/login/', {'email': email, 'password': password})
+        view(request)
+        done += 1
+    return done / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hasher', choices=sorted(HASHERS), default='pbkdf2_sha256')
+    parser.add_argument('--work-factors', default='100000,600000,1000000',
+                        help='Итерации PBKDF2 или N для scrypt, через запятую')
+    parser.add_argument('--seconds', type=float, default=5, help='Длительность каждого замера')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_django(Path(tmp) / 'bench.sqlite3')
+        from django.conf import settings
+        from django.core.management import call_command
+        from django.db import connection
+        from rest_framework.test import APIRequestFactory
+        from backend.throttling import reset_limiters
+        from backend.views import LoginAPIView
+
+        call_command('migrate', verbosity=0)
+        settings.PASSWORD_HASHERS = [HASHERS[args.hasher], *settings.PASSWORD_HASHERS]
+        user, = generator.create_users(1)
+        view = LoginAPIView.as_view()
+        factory = APIRequestFactory()
+
+        settings.LOGIN_RATE_LIMITS = {'ip': (10 ** 9, 1), 'account': (10 ** 9, 1)}
+        for work_factor in args.work_factors.split(','):
+            settings.PASSWORD_HASH_WORK_FACTOR = int(work_factor)
+            user.set_password(generator.PASSWORD)
+            user.save()
+            reset_limiters()
+            rate = run_logins(view, factory, user.email, generator.PASSWORD, args.seconds)
+            print(f'{args.hasher} work factor {work_factor:>9}: {rate:10.1f} logins/s per core')
+
+        # Лимит исчерпан с первой попытки: замеряется стоимость отказа
+        settings.LOGIN_RATE_LIMITS = {'ip': (1, 3600), 'account': (1, 3600)}
+        reset_limiters()
+        rate = run_logins(view, factory, user.email, 'wrong-password', args.seconds)
+        print(f'throttled attempts: {rate:10.1f} rejections/s per core')
+        connection.close()
+
+
+if __name__ == '__main__':
+    main()
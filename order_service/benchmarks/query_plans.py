@@ -0,0 +1,183 @@
+"""
+Планы и время горячих запросов до и после миграции 0008_query_indexes.
+
+Во временной SQLite-базе применяются миграции до 0007, база заполняется
+данными benchmarks.generator по --seed (по умолчанию 1M строк ProductInfo
+в 100 магазинах), после чего для каждого запроса выводится план и среднее
+время. Затем применяется 0008 и замеры повторяются.
+
+Запуск из каталога order_service:
+    python -m benchmarks.query_plans [--rows 1000000] [--repeat 200] [--seed 0]
+"""
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks import generator  # noqa: E402
+from benchmarks.common import mean_ms, setup_django  # noqa: E402
+from backend.utils import chunked  # noqa: E402
+
+BEFORE_MIGRATION = '0007_parameterfacet'
+AFTER_MIGRATION = '0008_query_indexes'
+
+
+def insert_rows(cursor, model, columns, rows):
+    table = model._meta.db_table
+    placeholders = ', '.join(['%s'] * len(columns))
+    cursor.executemany(f'INSERT INTO {table} ({", ".join(columns)}) VALUES ({placeholders})', rows)
+
+
+def fill(rows, seed, shops=100, parameters=200, users=10_000, orders_per_user=5, samples=1000):
+    """
+    Строки вставляются SQL-запросами: модели описывают схему после всех
+    миграций, а база стоит на 0007. Каталог — generator.goods() магазинов по
+    rows // shops товаров без параметров. Возвращает число товаров и выборку
+    предложений (shop_id, external_id, название товара, category_id) для
+    горячих запросов
+    """
+    from django.db import connection, transaction
+    from django.utils import timezone
+    from backend.models import (Shop, Category, Product, ProductInfo, Parameter, CustomUser, Order,
+                                OrderItem)
+
+    goods = max(rows // shops, 1)
+    rng = random.Random(f'{seed}:query_plans')
+    sample = []
+    products = 0
+    now = timezone.now()
+    with transaction.atomic(), connection.cursor() as cursor:
+        insert_rows(cursor, Shop, ['id', 'name', 'url'],
+                    [(i, f'Benchmark Shop {i - 1}', f'http://shop{i}.example.com') for i in range(1, shops + 1)])
+        insert_rows(cursor, Category, ['id', 'name'], generator.categories(goods))
+        insert_rows(cursor, Parameter, ['id', 'name'], enumerate(generator.parameter_names(parameters), 1))
+        for shop in range(shops):
+            for chunk in chunked(generator.goods(shop, goods, 0, seed), 10_000):
+                # Первая половина товаров магазина уже вставлена с предыдущим магазином
+                numbers = [item['id'] - 4_000_000 for item in chunk]
+                insert_rows(cursor, Product, ['id', 'category_id', 'name'],
+                            [(number + 1, item['category'], item['name'])
+                             for number, item in zip(numbers, chunk) if number >= products])
+                insert_rows(
+                    cursor, ProductInfo,
+                    ['product_id', 'shop_id', 'external_id', 'model', 'name', 'quantity', 'price', 'price_rrc',
+                     'content_hash'],
+                    [(number + 1, shop + 1, item['id'], item['model'], item['name'], item['quantity'],
+                      item['price'], item['price_rrc'], '') for number, item in zip(numbers, chunk)]
+                )
+                products = max(products, numbers[-1] + 1)
+                sample.extend((shop + 1, item['id'], item['name'], item['category'])
+                              for item in rng.sample(chunk, min(len(chunk), samples // shops + 1)))
+        insert_rows(
+            cursor, CustomUser,
+            ['id', 'password', 'is_superuser', 'username', 'first_name', 'last_name', 'email', 'is_staff',
+             'is_active', 'date_joined', 'type'],
+            ((i, '!', False, f'bench{i}@example.com', '', '', f'bench{i}@example.com', False, True, now,
+              'customer') for i in range(1, users + 1))
+        )
+        # У каждого пользователя одна корзина и несколько оформленных заказов
+        insert_rows(
+            cursor, Order, ['id', 'user_id', 'dt', 'status'],
+            ((user * orders_per_user + n, user, now, 'new' if n == 0 else 'completed')
+             for user in range(1, users + 1) for n in range(orders_per_user))
+        )
+        insert_rows(
+            cursor, OrderItem, ['order_id', 'product_id', 'shop_id', 'quantity'],
+            ((order, (order * 7 + n) % products + 1, (order + n) % shops + 1, 1)
+             for order in range(orders_per_user + 1, (users + 1) * orders_per_user) for n in range(2))
+        )
+        cursor.execute('ANALYZE')
+    return products, sample
+
+
+def hot_queries(products, sample, seed, parameters=200, shops=100, users=10_000, orders_per_user=5):
+    """
+    Горячие запросы со случайными аргументами из seed. Выбирается только id:
+    остальные столбцы моделей на 0007 могут ещё не существовать
+    """
+    from backend.models import Product, ProductInfo, Parameter, Order, OrderItem
+
+    rng = random.Random(f'{seed}:queries')
+    parameter_names = generator.parameter_names(parameters)
+
+    def order_item():
+        order = rng.randrange(orders_per_user + 1, (users + 1) * orders_per_user)
+        return OrderItem.objects.filter(order_id=order, product_id=(order * 7) % products + 1,
+                                        shop_id=order % shops + 1).values('id')
+
+    def product_info():
+        shop_id, external_id, _, _ = rng.choice(sample)
+        return ProductInfo.objects.filter(shop_id=shop_id, external_id=external_id).values('id')
+
+    def product():
+        _, _, name, category_id = rng.choice(sample)
+        return Product.objects.filter(name=name, category_id=category_id).values('id')
+
+    return {
+        'Order(user, status=new)': lambda: Order.objects.filter(user_id=rng.randrange(1, users + 1),
+                                                                status='new').values('id'),
+        'Order(user) exclude new': lambda: Order.objects.filter(user_id=rng.randrange(1, users + 1))
+        .exclude(status='new').values('id'),
+        'ProductInfo(shop, external_id)': product_info,
+        'Product(name, category)': product,
+        'Parameter(name)': lambda: Parameter.objects.filter(name=rng.choice(parameter_names)).values('id'),
+        'OrderItem(order, product, shop)': order_item,
+    }
+
+
+def explain(queries, repeat):
+    """План и среднее время в микросекундах каждого запроса"""
+    from django.db import connection
+
+    explain_prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+    results = {}
+    with connection.cursor() as cursor:
+        for name, make_queryset in queries.items():
+            sql, params = make_queryset().query.sql_with_params()
+            cursor.execute(explain_prefix + sql, params)
+            plan = '; '.join(str(row[-1]) for row in cursor.fetchall())
+
+            def execute():
+                sql, params = make_queryset().query.sql_with_params()
+                cursor.execute(sql, params)
+                cursor.fetchall()
+            results[name] = (plan, mean_ms(execute, repeat) * 1000)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000, help='Количество строк ProductInfo')
+    parser.add_argument('--repeat', type=int, default=200, help='Повторов каждого запроса')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_django(Path(tmp) / 'bench.sqlite3')
+        from django.core.management import call_command
+        from django.db import connection
+
+        call_command('migrate', 'backend', BEFORE_MIGRATION, verbosity=0)
+        started = time.perf_counter()
+        products, sample = fill(args.rows, args.seed)
+        print(f'Seeded {args.rows} ProductInfo rows in {time.perf_counter() - started:.1f}s')
+        before = explain(hot_queries(products, sample, args.seed), args.repeat)
+
+        call_command('migrate', 'backend', AFTER_MIGRATION, verbosity=0)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        after = explain(hot_queries(products, sample, args.seed), args.repeat)
+        connection.close()
+
+    for name in before:
+        print(f'\n{name}')
+        print(f'  before: {before[name][1]:10.1f} us  {before[name][0]}')
+        print(f'  after:  {after[name][1]:10.1f} us  {after[name][0]}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+ProductCatalogSerializer против FastProductCatalogSerializer на странице /api/products/.
+
+Во временной SQLite-базе импортируется прайс-лист из --goods товаров
+(benchmarks.generator, --seed), после
+чего для страницы из --page-size строк замеряется:
+  - serialize: только построение ответа из уже выбранных данных (модели
+    либо строки values_list()), без parameters, которым нужен отдельный запрос;
+  - query + serialize: выборка из базы вместе с построением ответа.
+
+Запуск из каталога order_service:
+    python -m benchmarks.read_serializers [--goods 10000] [--page-size 500] [--repeat 20] [--seed 0]
+"""
+import argparse
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks import generator  # noqa: E402
+from benchmarks.common import mean_ms, setup_django  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--goods', type=int, default=10_000, help='Товаров в прайс-листе')
+    parser.add_argument('--page-size', type=int, default=500, help='Строк на странице')
+    parser.add_argument('--repeat', type=int, default=20, help='Повторов каждого замера')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_django(Path(tmp) / 'bench.sqlite3')
+        from django.core.management import call_command
+        from django.db import connection
+        from django.db.models import Prefetch
+        from backend.importer import PriceListImporter
+        from backend.models import ProductInfo, ProductParameter
+        from backend.serializers import ProductCatalogSerializer, FastProductCatalogSerializer
+
+        call_command('migrate', verbosity=0)
+        PriceListImporter().import_data(generator.price_list(0, args.goods, 4, args.seed))
+
+        page = ProductInfo.objects.order_by('id')[:args.page_size]
+        models_page = page.select_related('shop', 'product__category').prefetch_related(
+            Prefetch('parameters', queryset=ProductParameter.objects.select_related('parameter'))
+        )
+        fields = [name for name in ProductCatalogSerializer.Meta.fields if name != 'parameters']
+        fast = FastProductCatalogSerializer()
+        fast_without_parameters = FastProductCatalogSerializer(fields)
+
+        def model_path():
+            return ProductCatalogSerializer(list(models_page.all()), many=True).data
+
+        def fast_path():
+            return fast.to_representation(list(fast.rows(page)))
+
+        instances = list(models_page.all())
+        rows = list(fast_without_parameters.rows(page))
+        results = {
+            'serialize': (
+                mean_ms(lambda: ProductCatalogSerializer(instances, many=True, fields=fields).data, args.repeat),
+                mean_ms(lambda: fast_without_parameters.to_representation(rows), args.repeat),
+            ),
+            'query + serialize': (mean_ms(model_path, args.repeat), mean_ms(fast_path, args.repeat)),
+        }
+        connection.close()
+
+    print(f'{args.page_size} rows per page, {args.goods} goods')
+    for name, (model_ms, fast_ms) in results.items():
+        print(f'  {name:18} ModelSerializer {model_ms:8.2f} ms   fast {fast_ms:8.2f} ms   x{model_ms / fast_ms:5.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+"""
+Воспроизводимый набор бенчмарков: импорт прайс-листов, страница каталога,
+поиск, добавление в корзину, подтверждение заказа и история заказов.
+
+Данные строит benchmarks.generator по seed, запросы к API идут через
+APIClient с токеном пользователя (middleware, аутентификация, рендеринг
+участвуют, сеть — нет). Для каждого бенчмарка измеряются пропускная
+способность, задержки, число запросов к базе на операцию и пиковая память
+Python (tracemalloc) на одной операции. Запускается командой
+manage.py run_benchmarks, результаты — JSON для сравнения запусков
+"""
+import platform
+import random
+import statistics
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from itertools import count, cycle
+from pathlib import Path
+
+import django
+from django.db import connection
+from rest_framework.test import APIClient
+
+from backend.importer import PriceListImporter
+from backend.models import Category, Order
+
+from . import generator
+from .common import percentile
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+def measure(operation, iterations, prepare=None):
+    """
+    Вызывает operation(*prepare()) сначала один раз под tracemalloc — прогрев
+    и пиковая память, время не учитывается, — затем iterations раз с замером
+    времени и подсчётом запросов к базе. prepare() выполняется вне замера
+    """
+    tracemalloc.start()
+    try:
+        operation(*(prepare() if prepare else ()))
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    queries = 0
+
+    def count_queries(execute, sql, params, many, context):
+        nonlocal queries
+        queries += 1
+        return execute(sql, params, many, context)
+
+    latencies = []
+    with connection.execute_wrapper(count_queries):
+        for _ in range(iterations):
+            args = prepare() if prepare else ()
+            started = time.perf_counter()
+            operation(*args)
+            latencies.append(time.perf_counter() - started)
+
+    total = sum(latencies)
+    latencies.sort()
+    return {
+        'iterations': iterations,
+        'seconds': round(total, 4),
+        'ops_per_second': round(iterations / total, 1) if total else None,
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 3) if latencies else None,
+        'p50_ms': round(percentile(latencies, 0.5), 3) if latencies else None,
+        'p95_ms': round(percentile(latencies, 0.95), 3) if latencies else None,
+        'p99_ms': round(percentile(latencies, 0.99), 3) if latencies else None,
+        'queries_per_op': round(queries / iterations, 2) if iterations else None,
+        'peak_memory_kb': round(peak_memory / 1024, 1),
+    }
+
+
+class Context:
+    """
+    Параметры запуска и общие для бенчмарков пользователи, клиенты и seed
+    """
+
+    def __init__(self, shops, goods, parameters, users, orders_per_user, cart_items, iterations, seed):
+        self.shops = shops
+        self.goods = goods
+        self.parameters = parameters
+        self.users = users
+        self.orders_per_user = orders_per_user
+        self.cart_items = cart_items
+        self.iterations = iterations
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.accounts = []
+        self.clients = {}
+
+    def client(self, user):
+        if user.id not in self.clients:
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f'Token {user.auth_token.key}')
+            self.clients[user.id] = client
+        return self.clients[user.id]
+
+    @staticmethod
+    def check(response, status=200):
+        if response.status_code != status:
+            raise RuntimeError(f'{response.request["PATH_INFO"]}: {response.status_code} {response.content[:200]!r}')
+        return response
+
+
+@benchmark('import')
+def bench_import(context):
+    """Первичный импорт прайс-листов всех магазинов; первый магазин — прогрев"""
+    price_lists = generator.catalog(context.shops, context.goods, context.parameters, context.seed)
+    importer = PriceListImporter()
+    results = []
+
+    def import_shop(data):
+        results.append(importer.import_data(data))
+
+    measured = measure(import_shop, context.shops - 1, lambda: (next(price_lists),))
+    timed = results[1:]
+    rows = sum(result.rows for result in timed)
+    measured['rows'] = rows
+    measured['rows_per_second'] = round(rows / measured['seconds'], 1) if measured['seconds'] else None
+    return measured
+
+
+def prepare_accounts(context):
+    """Пользователи, их история заказов и корзины: готовятся вне замеров"""
+    context.accounts = generator.create_users(context.users)
+    generator.create_orders(context.accounts, context.orders_per_user, seed=context.seed)
+    generator.fill_carts(context.accounts, context.cart_items, seed=context.seed)
+
+
+@benchmark('product_list')
+def bench_product_list(context):
+    """Страница каталога: без фильтров, по категории, по цене, с фасетами"""
+    category_ids = list(Category.objects.order_by('id').values_list('id', flat=True))
+    counter = count()
+
+    def prepare():
+        i = next(counter)
+        return ([
+            '/api/products/?page_size=50',
+            f'/api/products/?category={category_ids[i % len(category_ids)]}&page_size=50',
+            f'/api/products/?price_min={20000 + i % 10 * 5000}&price_max={60000 + i % 10 * 5000}&page_size=50',
+            '/api/products/?facets=1&page_size=50',
+        ][i % 4],)
+
+    client = APIClient()
+    return measure(lambda url: context.check(client.get(url)), context.iterations, prepare)
+
+
+@benchmark('search')
+def bench_search(context):
+    """Поиск с автодополнением: целые слова, префиксы и пары слов"""
+    queries = cycle([query for word in generator.SEARCH_WORDS
+                     for query in (word, word[:3].lower(), f'{word} модель 1')])
+    client = APIClient()
+    return measure(lambda query: context.check(client.get('/api/products/search/', {'q': query})),
+                   context.iterations, lambda: (next(queries),))
+
+
+@benchmark('cart_add')
+def bench_cart_add(context):
+    """Добавление товара в корзину с резервом на складе"""
+    accounts = cycle(context.accounts)
+    offers = cycle(generator.offers(context.seed))
+
+    def prepare():
+        product_id, shop_id = next(offers)
+        return context.client(next(accounts)), {'product_id': product_id, 'shop_id': shop_id, 'quantity': 1}
+
+    return measure(lambda client, data: context.check(client.post('/api/cart/', data), 201),
+                   context.iterations, prepare)
+
+
+@benchmark('confirm')
+def bench_confirm(context):
+    """Подтверждение корзины из cart_items позиций; корзина заполняется вне замера"""
+    accounts = cycle(context.accounts)
+
+    def prepare():
+        user = next(accounts)
+        cart = Order.objects.filter(user=user, status='new').first()
+        if cart is None:
+            generator.fill_carts([user], context.cart_items, seed=context.rng.random())
+            cart = Order.objects.get(user=user, status='new')
+        return context.client(user), {'order_id': cart.id, 'contact_id': user.contacts.first().id}
+
+    return measure(lambda client, data: context.check(client.post('/api/confirm-order/', data)),
+                   context.iterations, prepare)
+
+
+@benchmark('order_history')
+def bench_order_history(context):
+    """История заказов: первая страница и фильтр по статусу"""
+    accounts = cycle(context.accounts)
+    urls = cycle(['/api/orders/?page_size=20', '/api/orders/?status=completed&page_size=20'])
+    return measure(lambda client, url: context.check(client.get(url)), context.iterations,
+                   lambda: (context.client(next(accounts)), next(urls)))
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=Path(__file__).resolve().parent,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(context, names=None, log=None):
+    """
+    Импорт идёт первым (он же наполняет каталог), затем готовятся
+    пользователи, потом остальные бенчмарки в порядке BENCHMARKS. names
+    ограничивает замеры, но импорт и подготовка выполняются всегда
+    """
+    names = list(names or BENCHMARKS)
+    results = {}
+    started = time.perf_counter()
+    measured = bench_import(context)
+    if 'import' in names:
+        results['import'] = measured
+    prepare_accounts(context)
+    for name in names:
+        if name == 'import':
+            continue
+        if log:
+            log(name)
+        results[name] = BENCHMARKS[name](context)
+
+    return {
+        'meta': {
+            'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': f'{connection.vendor} {connection.Database.sqlite_version}'
+                        if connection.vendor == 'sqlite' else connection.vendor,
+            'duration': round(time.perf_counter() - started, 2),
+        },
+        'parameters': {
+            'shops': context.shops, 'goods': context.goods, 'parameters': context.parameters,
+            'users': context.users, 'orders_per_user': context.orders_per_user, 'cart_items': context.cart_items,
+            'iterations': context.iterations, 'seed': context.seed,
+        },
+        'benchmarks': results,
+    }
+
+
+def compare(baseline, current):
+    """
+    Строки сравнения двух запусков: пропускная способность (больше — лучше),
+    запросы на операцию и пиковая память (меньше — лучше)
+    """
+    lines = []
+    if baseline.get('parameters') != current.get('parameters'):
+        lines.append('warning: runs use different parameters')
+    for name, stats in current['benchmarks'].items():
+        before = baseline['benchmarks'].get(name)
+        if before is None:
+            continue
+        changes = []
+        for key in ('ops_per_second', 'queries_per_op', 'peak_memory_kb'):
+            if before.get(key) and stats.get(key) is not None:
+                changes.append(f'{key} {before[key]} -> {stats[key]} ({(stats[key] / before[key] - 1) * 100:+.1f}%)')
+        lines.append(f'{name}: {", ".join(changes)}')
+    return lines
@@ -0,0 +1,188 @@
+"""
+WSGI против ASGI на читающих эндпоинтах: /api/products/, /api/cart/, /api/orders/.
+
+Во временной SQLite-базе benchmarks.generator по --seed импортирует
+прайс-лист из --goods товаров, создаёт пользователя с токеном, корзину и
+историю заказов. Затем для каждого режима запускается отдельный процесс (под
+ASGI маршруты ведут на асинхронные представления, см. ASYNC_VIEWS), который
+--seconds секунд вызывает приложение с --concurrency одновременными
+запросами:
+  - wsgi: get_wsgi_application() из пула потоков, как в потоковом WSGI-сервере;
+  - asgi: get_asgi_application() из --concurrency задач в одном цикле событий.
+
+Сетевой слой и разбор HTTP не участвуют, сравнивается только обработка
+запроса Django. Кеш ответов каталога отключён (--catalog-cache включает),
+иначе замерялось бы чтение из кеша. Для каждого эндпоинта выводятся
+запросов в секунду, p50 и p99 задержки.
+
+Запуск из каталога order_service:
+    python -m benchmarks.wsgi_vs_asgi [--goods 5000] [--concurrency 16] [--seconds 5] [--seed 0]
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks import generator  # noqa: E402
+from benchmarks.common import percentile, setup_django  # noqa: E402
+
+ENDPOINTS = ['/api/products/?page_size=50', '/api/cart/', '/api/orders/?page_size=20']
+
+
+def prepare(goods, seed):
+    """Каталог, корзина из 10 позиций и 100 заказов пользователя; возвращает токен"""
+    from django.core.management import call_command
+    from backend.importer import PriceListImporter
+
+    call_command('migrate', verbosity=0)
+    PriceListImporter().import_data(generator.price_list(0, goods, 4, seed))
+    users = generator.create_users(1)
+    generator.fill_carts(users, 10, seed=seed)
+    generator.create_orders(users, 100, seed=seed)
+    return users[0].auth_token.key
+
+
+def summarize(latencies, elapsed):
+    latencies = sorted(latencies)
+    return {'rps': len(latencies) / elapsed, 'p50': percentile(latencies, 0.5), 'p99': percentile(latencies, 0.99)}
+
+
+def run_wsgi(url, token, concurrency, seconds):
+    from wsgiref.util import setup_testing_defaults
+    from django.core.wsgi import get_wsgi_application
+
+    application = get_wsgi_application()
+    path, _, query = url.partition('?')
+
+    def start_response(status, headers, exc_info=None):
+        if not status.startswith('200'):
+            raise RuntimeError(f'{url}: {status}')
+
+    def worker(deadline):
+        latencies = []
+        while time.perf_counter() < deadline:
+            environ = {'PATH_INFO': path, 'QUERY_STRING': query, 'HTTP_HOST': 'testserver',
+                       'HTTP_AUTHORIZATION': f'Token {token}'}
+            setup_testing_defaults(environ)
+            started = time.perf_counter()
+            response = application(environ, start_response)
+            b''.join(response)
+            response.close()
+            latencies.append(time.perf_counter() - started)
+        return latencies
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        results = list(executor.map(worker, [started + seconds] * concurrency))
+    return summarize([latency for latencies in results for latency in latencies], time.perf_counter() - started)
+
+
+def run_asgi(url, token, concurrency, seconds):
+    from django.core.asgi import get_asgi_application
+
+    application = get_asgi_application()
+    path, _, query = url.partition('?')
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': query.encode(), 'root_path': '',
+        'headers': [(b'host', b'testserver'), (b'authorization', f'Token {token}'.encode())],
+        'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+    }
+
+    def receiver():
+        messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            # После тела Django ждёт отключения клиента, клиент не отключается
+            await asyncio.Event().wait()
+        return receive
+
+    async def send(message):
+        if message['type'] == 'http.response.start' and message['status'] != 200:
+            raise RuntimeError(f'{url}: {message["status"]}')
+
+    async def worker(deadline):
+        latencies = []
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            await application(dict(scope), receiver(), send)
+            latencies.append(time.perf_counter() - started)
+        return latencies
+
+    async def main():
+        deadline = time.perf_counter() + seconds
+        return await asyncio.gather(*(worker(deadline) for _ in range(concurrency)))
+
+    started = time.perf_counter()
+    results = asyncio.run(main())
+    return summarize([latency for latencies in results for latency in latencies], time.perf_counter() - started)
+
+
+def run_mode(args):
+    """Дочерний процесс: замеры одного режима, результат — JSON в stdout"""
+    setup_django(args.database)
+    from django.conf import settings
+
+    settings.DEBUG = False
+    settings.ALLOWED_HOSTS = ['testserver']
+    if not args.catalog_cache:
+        settings.CACHES[settings.CATALOG_CACHE_ALIAS] = {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+
+    run = run_asgi if args.mode == 'asgi' else run_wsgi
+    # Прогрев: импорты, сгенерированные сериализаторы, соединение с базой
+    run(ENDPOINTS[0], args.token, 1, 0.2)
+    print(json.dumps({url: run(url, args.token, args.concurrency, args.seconds) for url in ENDPOINTS}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--goods', type=int, default=5000, help='Товаров в прайс-листе')
+    parser.add_argument('--concurrency', type=int, default=16, help='Одновременных запросов')
+    parser.add_argument('--seconds', type=float, default=5, help='Длительность замера каждого эндпоинта')
+    parser.add_argument('--catalog-cache', action='store_true', help='Не отключать кеш ответов каталога')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--mode', choices=['wsgi', 'asgi'], help=argparse.SUPPRESS)
+    parser.add_argument('--database', help=argparse.SUPPRESS)
+    parser.add_argument('--token', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database = Path(tmp) / 'bench.sqlite3'
+        setup_django(database)
+        token = prepare(args.goods, args.seed)
+
+        results = {}
+        for mode in ('wsgi', 'asgi'):
+            command = [sys.executable, '-m', 'benchmarks.wsgi_vs_asgi', '--mode', mode, '--database', str(database),
+                       '--token', token, '--concurrency', str(args.concurrency), '--seconds', str(args.seconds)]
+            if args.catalog_cache:
+                command.append('--catalog-cache')
+            env = {**os.environ, 'ASYNC_VIEWS': '1' if mode == 'asgi' else '0'}
+            output = subprocess.run(command, env=env, cwd=Path(__file__).resolve().parent.parent,
+                                    check=True, stdout=subprocess.PIPE, text=True).stdout
+            results[mode] = json.loads(output)
+
+    print(f'{args.goods} goods, concurrency {args.concurrency}')
+    for url in ENDPOINTS:
+        print(f'  {url}')
+        for mode, measured in results.items():
+            stats = measured[url]
+            print(f'    {mode:5} {stats["rps"]:9.1f} req/s   p50 {stats["p50"]:7.2f} ms   p99 {stats["p99"]:7.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Сравнение разбора прайс-листа через yaml.safe_load и PriceListStream.
+
+Для каждого размера benchmarks.generator строит файл в формате
+data/shop1.yaml, после чего каждый способ разбора запускается в отдельном
+процессе, чтобы пиковый RSS одного прогона не влиял на другой.
+
+Запуск из каталога order_service:
+    python -m benchmarks.yaml_parsing [10000 100000 1000000]
+"""
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import yaml
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from backend.streaming import PriceListStream, SafeLoader  # noqa: E402
+from benchmarks import generator  # noqa: E402
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+
+
+def scalar(value):
+    # JSON-строка — корректный скаляр YAML; без кавычек "#" в названии начал бы комментарий
+    return json.dumps(value, ensure_ascii=False) if isinstance(value, str) else value
+
+
+def generate_price_list(path, goods_count, seed=0):
+    """Пишет прайс-лист generator.price_list() построчно, не собирая товары в памяти"""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('shop: Benchmark Shop 0\ncategories:\n')
+        for category_id, name in generator.categories(goods_count):
+            f.write(f'  - id: {category_id}\n    name: {scalar(name)}\n')
+        f.write('goods:\n')
+        for item in generator.goods(0, goods_count, 4, seed):
+            f.write(f'  - id: {item["id"]}\n')
+            for key in ('category', 'model', 'name', 'price', 'price_rrc', 'quantity'):
+                f.write(f'    {key}: {scalar(item[key])}\n')
+            f.write('    parameters:\n')
+            for name, value in item['parameters'].items():
+                f.write(f'      {scalar(name)}: {scalar(value)}\n')
+
+
+def parse(mode, path):
+    started = time.perf_counter()
+    with open(path, 'rb') as f:
+        if mode == 'safe_load':
+            goods = len(yaml.load(f, Loader=SafeLoader)['goods'])
+        else:
+            goods = sum(1 for _ in PriceListStream(f).goods())
+    return {
+        'mode': mode,
+        'goods': goods,
+        'seconds': round(time.perf_counter() - started, 3),
+        # ru_maxrss в Linux измеряется в килобайтах
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def run_isolated(mode, path):
+    output = subprocess.check_output([sys.executable, __file__, '--child', mode, str(path)])
+    return json.loads(output)
+
+
+def main(sizes):
+    print(f'Loader: {SafeLoader.__name__}')
+    print(f'{"goods":>10} {"mode":>10} {"seconds":>10} {"peak RSS, MB":>14}')
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            path = Path(tmp) / f'price_{size}.yaml'
+            generate_price_list(path, size)
+            for mode in ('safe_load', 'stream'):
+                row = run_isolated(mode, path)
+                print(f'{size:>10} {mode:>10} {row["seconds"]:>10} {row["peak_rss_mb"]:>14}')
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--child']:
+        print(json.dumps(parse(sys.argv[2], sys.argv[3])))
+    else:
+        main([int(size) for size in sys.argv[1:]] or DEFAULT_SIZES)
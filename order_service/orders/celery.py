@@ -0,0 +1,28 @@
+import os
+from pathlib import Path
+
+from celery import Celery
+from celery.backends.filesystem import FilesystemBackend
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'orders.settings')
+
+
+class DirectoryCreatingFilesystemBackend(FilesystemBackend):
+    """
+    Бэкенд результатов file://, который сам создаёт каталог: стандартный
+    только проверяет его при создании. Каталог появляется при первом
+    обращении к app.backend, а не при импорте настроек
+    """
+
+    def _find_path(self, url):
+        path = super()._find_path(url)
+        Path(path).mkdir(parents=True, exist_ok=True)
+        return path
+
+
+app = Celery('orders')
+
+# Настройки Celery читаются из settings.py с префиксом CELERY_
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.loader.override_backends = {'file': 'orders.celery:DirectoryCreatingFilesystemBackend'}
+app.autodiscover_tasks()